@@ -1,24 +1,126 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import json
 import os
+import threading
+import time
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import IntegrityError
+from urllib.parse import quote
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
 
 from agents import Runner
-from epoch_agent.email_triage_agent import Email, ReportOutput, run_email_triage_agent, Base, EmailORM
+from epoch_agent.email_triage_agent import (
+    Email, run_email_triage_agent, EmailORM, AttachmentORM
+)
+from epoch_agent.services import archive, blobstore, dedup, metrics, rules, search, storage, threads
+from epoch_agent.services.jobs import Job, JobRunner
+from epoch_agent.services.scheduler import PeriodicTask, TaskStatus
+from epoch_agent.services.digest import build_digest
+from epoch_agent.services.writer import BatchWriter
 
 load_dotenv()
 
 DB_PATH = os.getenv("DB_FILE", "email_triage.db")
 
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-Base.metadata.create_all(bind=engine)
+# share the agent's engine so there is a single connection pool and writer per database file
+engine = storage.configure(DB_PATH)
+SessionLocal = storage.SessionLocal
 
-app = FastAPI()
+REVIEW_STATUS = "2 - Review"
+
+# columns the listing endpoints can return; the default matches the Email model
+LISTING_FIELDS = ("message_id", "subject", "sender", "date", "body", "html_body", "received_at", "status", "thread_id")
+DEFAULT_LISTING_FIELDS = tuple(Email.model_fields)
+# rows fetched per round trip when streaming NDJSON
+STREAM_BATCH = 500
+
+# rows per INSERT statement, well under SQLite's bound-parameter limit
+INSERT_CHUNK = 200
+
+_ingest_buffer: BatchWriter | None = None
+_ingest_buffer_lock = threading.Lock()
+
+jobs = JobRunner()
+# the scheduled fetch and POST /fetch_email never run at the same time
+_fetch_lock = asyncio.Lock()
+scheduled_fetch: PeriodicTask | None = None
+scheduled_archive: PeriodicTask | None = None
+
+
+async def fetch_now() -> int:
+    """Fetches new mail on a worker thread so IMAP I/O does not block the event loop."""
+    from epoch_agent.services.imap_fetcher import fetch_emails
+    async with _fetch_lock:
+        return await run_in_threadpool(fetch_emails)
+
+
+async def fetch_and_triage() -> dict:
+    """One scheduled run: fetch new mail, then triage it when FETCH_TRIAGE is enabled."""
+    result = {"fetched": await fetch_now()}
+    if result["fetched"] and os.getenv("FETCH_TRIAGE", "False").lower() in ("1", "true", "yes"):
+        # joins a triage job already started through POST /process
+        job, _ = jobs.submit("triage", run_email_triage_agent)
+        await jobs.wait(job)
+        result["triage_job"] = job.id
+        result["triage_status"] = job.status
+    return result
+
+
+async def archive_now() -> archive.ArchiveResult:
+    """Moves old processed emails to the archive database on a worker thread."""
+    return await run_in_threadpool(archive.archive_processed)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global scheduled_fetch, scheduled_archive
+    interval = float(os.getenv("FETCH_INTERVAL", 0))
+    if interval > 0:
+        scheduled_fetch = PeriodicTask("fetch", interval, fetch_and_triage).start()
+    if float(os.getenv("ARCHIVE_AFTER_DAYS", 0)) > 0:
+        scheduled_archive = PeriodicTask("archive", float(os.getenv("ARCHIVE_INTERVAL", 86400)), archive_now).start()
+    yield
+    if scheduled_fetch is not None:
+        await scheduled_fetch.stop()
+        scheduled_fetch = None
+    if scheduled_archive is not None:
+        await scheduled_archive.stop()
+        scheduled_archive = None
+    await jobs.shutdown()
+    global _ingest_buffer
+    if _ingest_buffer is not None:
+        _ingest_buffer.close()
+        _ingest_buffer = None
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so /review/{message_id} is one series
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
 
 class InboundEmail(BaseModel):
     message_id: str
@@ -26,10 +128,97 @@ class InboundEmail(BaseModel):
     sender: str
     date: str
     body: str
+    list_id: str | None = None
+    in_reply_to: str | None = None
+    references: str | None = None
+
+
+class AttachmentInfo(BaseModel):
+    id: int
+    filename: str | None
+    content_type: str | None
+    size: int | None
+
+
+class BatchIngestResult(BaseModel):
+    inserted: int
+    duplicates: int
+
+
+def email_row(session, inbound: InboundEmail) -> dict:
+    """Builds the emails row for an inbound message, including its digest and thread."""
+    return dict(
+        message_id=inbound.message_id,
+        subject=inbound.subject,
+        sender=inbound.sender,
+        date=inbound.date,
+        body=inbound.body,
+        digest=build_digest(inbound.body),
+        content_hash=dedup.content_hash(inbound.sender, inbound.subject, inbound.date, inbound.body),
+        list_id=inbound.list_id,
+        in_reply_to=inbound.in_reply_to,
+        references=inbound.references,
+        thread_id=threads.thread_id_for(session, inbound.message_id, inbound.in_reply_to, inbound.references),
+        received_at=datetime.utcnow().isoformat(),
+        processed=False,
+    )
+
+
+def insert_emails(session, inbounds: list[InboundEmail]) -> int:
+    """
+    Inserts inbound emails with INSERT ... ON CONFLICT DO NOTHING in the session's transaction.
+
+    An email is a duplicate when its Message-ID or its content hash is already stored.
+
+    Returns:
+        int: The number of new rows; the rest were duplicates.
+    """
+    inserted = 0
+    for start in range(0, len(inbounds), INSERT_CHUNK):
+        rows = [email_row(session, inbound) for inbound in inbounds[start:start + INSERT_CHUNK]]
+        stmt = sqlite_insert(EmailORM).values(rows).on_conflict_do_nothing()
+        inserted += session.execute(stmt).rowcount
+    return inserted
+
+
+def _flush_ingest_buffer(session, inbounds: list[InboundEmail]):
+    insert_emails(session, inbounds)
+    session.commit()
+
+
+def ingest_buffer() -> BatchWriter | None:
+    """
+    Returns the micro-batching write buffer for POST /email when INGEST_BUFFER is enabled.
+
+    Buffered emails are flushed in one transaction once INGEST_BUFFER_SIZE (default 100) have
+    queued up or INGEST_BUFFER_DELAY seconds (default 0.05) have passed.
+    """
+    global _ingest_buffer
+    if os.getenv("INGEST_BUFFER", "False").lower() not in ("1", "true", "yes"):
+        return None
+    with _ingest_buffer_lock:
+        if _ingest_buffer is None:
+            _ingest_buffer = BatchWriter(
+                _flush_ingest_buffer,
+                max_batch=int(os.getenv("INGEST_BUFFER_SIZE", 100)),
+                max_delay=float(os.getenv("INGEST_BUFFER_DELAY", 0.05)),
+                name="ingest-buffer",
+                session_factory=SessionLocal,
+            ).start()
+    return _ingest_buffer
 
 
 @app.post("/email")
 def receive_email(inbound: InboundEmail):
+    buffer = ingest_buffer()
+    if buffer is not None:
+        # acknowledge only once the batch holding this email is committed
+        done = threading.Event()
+        buffer.submit(inbound, done)
+        if not done.wait(timeout=30) or done.error is not None:
+            raise HTTPException(status_code=500, detail=str(getattr(done, "error", "ingest buffer timed out")))
+        print(f"Received email: {inbound.subject}")
+        return {"success": True}
     try:
         with SessionLocal() as session:
             email = EmailORM(
@@ -38,6 +227,14 @@ def receive_email(inbound: InboundEmail):
                 sender=inbound.sender,
                 date=inbound.date,
                 body=inbound.body,
+                digest=build_digest(inbound.body),
+                content_hash=dedup.content_hash(inbound.sender, inbound.subject, inbound.date, inbound.body),
+                list_id=inbound.list_id,
+                in_reply_to=inbound.in_reply_to,
+                references=inbound.references,
+                thread_id=threads.thread_id_for(
+                    session, inbound.message_id, inbound.in_reply_to, inbound.references
+                ),
                 received_at=datetime.utcnow().isoformat(),
             )
             session.add(email)
@@ -51,43 +248,150 @@ def receive_email(inbound: InboundEmail):
     return {"success": True}
 
 
+@app.post("/emails/batch", response_model=BatchIngestResult)
+async def receive_email_batch(request: Request):
+    """
+    Ingest many emails in one transaction.
+
+    Accepts a JSON array of emails, or NDJSON (one email per line) when the content type is
+    application/x-ndjson.
+    """
+    raw = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+        else:
+            items = json.loads(raw or b"[]")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=422, detail="Expected a JSON array or NDJSON")
+        inbounds = [InboundEmail.model_validate(item) for item in items]
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    def write() -> int:
+        with SessionLocal() as session:
+            inserted = insert_emails(session, inbounds)
+            session.commit()
+        return inserted
+
+    try:
+        inserted = await run_in_threadpool(write)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    print(f"Received {len(inbounds)} emails: {inserted} new")
+    return BatchIngestResult(inserted=inserted, duplicates=len(inbounds) - inserted)
+
+
+def encode_cursor(received_at: str, message_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([received_at, message_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        received_at, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(received_at), str(message_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def email_listing(request: Request, criteria: list, limit: int | None, cursor: str | None,
+                  fields: str | None, format: str | None) -> Response:
+    """
+    Lists emails oldest first, paged by (received_at, message_id) and projected to the requested fields.
+
+    A JSON list is returned with the next page's cursor in the X-Next-Cursor header. With
+    format=ndjson (or Accept: application/x-ndjson) rows are streamed one per line from a
+    server-side cursor instead.
+    """
+    names = fields.split(",") if fields else list(DEFAULT_LISTING_FIELDS)
+    unknown = [n for n in names if n not in LISTING_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    stmt = (
+        select(*(getattr(EmailORM, n) for n in names), EmailORM.received_at, EmailORM.message_id)
+        .where(*criteria)
+        .order_by(EmailORM.received_at, EmailORM.message_id)
+    )
+    if cursor:
+        stmt = stmt.where(tuple_(EmailORM.received_at, EmailORM.message_id) > tuple_(*decode_cursor(cursor)))
+
+    ndjson = format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+    if ndjson:
+        if limit:
+            stmt = stmt.limit(limit)
+
+        def lines():
+            with SessionLocal() as session:
+                for row in session.execute(stmt.execution_options(yield_per=STREAM_BATCH)):
+                    yield json.dumps(dict(zip(names, row))) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if limit:
+        # one extra row tells whether there is a next page
+        stmt = stmt.limit(limit + 1)
+    with SessionLocal() as session:
+        rows = session.execute(stmt).all()
+    headers = {}
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(*rows[-1][-2:])
+    return JSONResponse([dict(zip(names, row)) for row in rows], headers=headers)
+
+
 @app.get("/all", response_model=list[Email])
-def list_review_emails():
+def list_all_emails(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = None,
+    format: str | None = None,
+):
     """List all emails."""
-    with SessionLocal() as session:
-        emails_orm = session.query(EmailORM).all()
-        return [
-            Email(
-                message_id=e.message_id,
-                subject=e.subject,
-                sender=e.sender,
-                date=e.date,
-                body=e.body,
-            )
-            for e in emails_orm
-        ]
-    
+    return email_listing(request, [], limit, cursor, fields, format)
+
 
 @app.get("/review", response_model=list[Email])
-def list_review_emails():
+def list_review_emails(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = None,
+    format: str | None = None,
+):
     """List emails flagged for review."""
+    return email_listing(request, [EmailORM.status == REVIEW_STATUS], limit, cursor, fields, format)
+
+
+@app.get("/search", response_model=list[search.SearchHit])
+def search_emails(
+    q: str,
+    status: str | None = None,
+    processed: bool | None = None,
+    archived: bool = False,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Full-text search over subject, sender, body and HTML text, best match first.
+
+    q uses FTS5 query syntax: terms, "phrases", prefix*, column filters such as subject:invoice,
+    and AND/OR/NOT. With archived=true the archive database is searched instead.
+    """
     with SessionLocal() as session:
-        emails_orm = session.query(EmailORM).filter(EmailORM.processed == False).all()
-        return [
-            Email(
-                message_id=e.message_id,
-                subject=e.subject,
-                sender=e.sender,
-                date=e.date,
-                body=e.body,
-            )
-            for e in emails_orm
-        ]
+        try:
+            if archived:
+                return archive.search(q, status=status, limit=limit, offset=offset)
+            return search.search(session, q, status=status, processed=processed, limit=limit, offset=offset)
+        except OperationalError as e:
+            if "no such table" in str(e):
+                raise HTTPException(status_code=501, detail="Full-text search requires SQLite with FTS5")
+            raise HTTPException(status_code=400, detail=f"Invalid search query: {e.orig}")
 
 
 @app.get("/review/{message_id}", response_model=Email)
 def view_review_email(message_id: str):
-    """Retrieve a single email by message_id for manual review."""
+    """Retrieve a single email by message_id for manual review, from the archive if it was archived."""
     with SessionLocal() as session:
         email = (
             session.query(EmailORM)
@@ -95,7 +399,10 @@ def view_review_email(message_id: str):
             .first()
         )
         if not email:
-            raise HTTPException(status_code=404, detail="Email not found")
+            archived = archive.get_email(message_id)
+            if archived is None or archived["status"] is None:
+                raise HTTPException(status_code=404, detail="Email not found")
+            return Email(**{field: archived[field] for field in Email.model_fields})
         return Email(
             message_id=email.message_id,
             subject=email.subject,
@@ -105,16 +412,117 @@ def view_review_email(message_id: str):
         )
 
 
-@app.post("/process", response_model=ReportOutput)
+@app.get("/emails/{message_id}/attachments", response_model=list[AttachmentInfo])
+def list_attachments(message_id: str):
+    """List the stored attachments of an email, archived or not."""
+    with SessionLocal() as session:
+        attachments = session.query(AttachmentORM).filter(AttachmentORM.message_id == message_id).all()
+        return [
+            AttachmentInfo(
+                id=a.id,
+                filename=a.filename,
+                content_type=a.content_type,
+                size=a.size if a.size is not None else len(a.data or b""),
+            )
+            for a in attachments or archive.list_attachments(message_id)
+        ]
+
+
+def content_disposition(filename: str) -> str:
+    """
+    An attachment Content-Disposition header that is safe for any filename: non-ASCII names and
+    names with quotes or line breaks get an ASCII fallback plus an RFC 5987 filename*.
+    """
+    encoded = quote(filename)
+    if encoded == filename:
+        return f'attachment; filename="{filename}"'
+    fallback = "".join(c if " " <= c <= "~" and c not in '"\\' else "_" for c in filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=utf-8''{encoded}"
+
+
+def serve_attachment(attachment_id: int, message_id: str | None = None):
+    """Serves an attachment, hot or archived; with message_id, only one that belongs to that email."""
+    with SessionLocal() as session:
+        att = session.get(AttachmentORM, attachment_id)
+        if att is not None and message_id is not None and att.message_id != message_id:
+            att = None
+        att = att or archive.get_attachment(attachment_id, message_id)
+        if not att:
+            raise HTTPException(status_code=404, detail="Attachment not found")
+        media_type = att.content_type or "application/octet-stream"
+        if att.sha256 is None:
+            # legacy row whose bytes have not been migrated out of the database yet
+            headers = {"Content-Disposition": content_disposition(att.filename or str(attachment_id))}
+            return Response(content=att.data or b"", media_type=media_type, headers=headers)
+        path = blobstore.blob_path(att.sha256)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Attachment blob missing")
+        return FileResponse(path, media_type=media_type, filename=att.filename or str(attachment_id))
+
+
+@app.get("/emails/{message_id}/attachments/{attachment_id}")
+def download_email_attachment(message_id: str, attachment_id: int):
+    """Serve an attachment of a given email, archived or not, streamed from the blob store."""
+    return serve_attachment(attachment_id, message_id)
+
+
+@app.get("/attachments/{attachment_id}")
+def download_attachment(attachment_id: int):
+    """Serve an attachment, streamed from the blob store without loading it into memory."""
+    return serve_attachment(attachment_id)
+
+
+@app.get("/rules/stats", response_model=rules.FastPathStats)
+def fast_path_stats():
+    """Report how much triage work the rule-based fast path has handled since startup."""
+    return rules.stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics: stage, model, tool and request latencies, token usage and fetch throughput."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/process", response_model=Job, status_code=202)
 async def process_emails():
-    return await run_email_triage_agent()
+    """
+    Start a triage run in the background and return its job; poll GET /jobs/{id} for the report.
+
+    While a run is in flight, further calls return that run's job instead of starting another.
+    """
+    job, started = jobs.submit("triage", run_email_triage_agent)
+    if not started:
+        print(f"Triage job {job.id} already in flight; joining it")
+    return job
+
+
+@app.get("/jobs/{job_id}", response_model=Job)
+def get_job(job_id: str):
+    """Retrieve the status of a background job; succeeded triage jobs carry the ReportOutput as result."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 
 @app.post("/fetch_email")
 async def fetch_email():
     """Fetch emails from IMAP server."""
-    from epoch_agent.services.imap_fetcher import fetch_emails
     try:
-        fetch_emails()
-        return {"success": True, "message": "Emails fetched successfully."}
+        count = await fetch_now()
+        return {"success": True, "message": f"Fetched {count} new emails."}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/schedule", response_model=TaskStatus | None)
+def schedule_status():
+    """Report the last run of the periodic fetch (null when FETCH_INTERVAL is not set)."""
+    return scheduled_fetch.status if scheduled_fetch is not None else None
+
+
+@app.get("/archive", response_model=TaskStatus | None)
+def archive_status():
+    """Report the last run of the periodic archive job (null when ARCHIVE_AFTER_DAYS is not set)."""
+    return scheduled_archive.status if scheduled_archive is not None else None
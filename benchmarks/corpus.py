@@ -0,0 +1,128 @@
+"""
+Synthetic mail corpus for the benchmarks.
+
+generate_corpus builds a reproducible mix of RFC 822 messages resembling a real inbox: plain
+text, multipart/alternative with HTML, HTML-only newsletters with a List-Id, receipts with PDF
+attachments and reply chains with In-Reply-To/References. inbound_payloads turns the same mix into
+the JSON bodies the Cloudflare Worker posts to /email.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes
+from email.message import EmailMessage
+from email.policy import default
+from email.utils import format_datetime
+
+WORDS = (
+    "project meeting schedule review budget invoice update release plan team customer report "
+    "deadline question feedback design launch contract proposal travel receipt order shipping "
+    "account security newsletter weekly digest offer event agenda notes draft approval payment"
+).split()
+SENDERS = [
+    ("Alice Smith", "alice@example.com"),
+    ("Bob Jones", "bob@partner.org"),
+    ("Stripe", "receipts@stripe.com"),
+    ("Weekly Digest", "news@weekly.io"),
+    ("GitHub", "notifications@github.com"),
+    ("Carol White", "carol@example.com"),
+]
+QUOTED = "\n\nOn Mon, Jul 14, 2025 at 9:00 AM someone wrote:\n> " + "\n> ".join(["earlier message"] * 20)
+SIGNATURE = "\n\n-- \nBest regards\nSent from my phone"
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(_sentence(rng, rng.randint(6, 18)) for _ in range(rng.randint(2, 5))) for _ in range(count)]
+
+
+def _html(paragraphs: list[str]) -> str:
+    body = "".join(f"<p>{p}</p>" for p in paragraphs)
+    return (
+        "<html><head><style>p{margin:0}.footer{color:#999}</style></head><body>"
+        f"<table><tr><td>{body}</td></tr></table>"
+        '<div class="footer"><a href="https://example.com/unsubscribe">Unsubscribe</a></div></body></html>'
+    )
+
+
+def generate_corpus(count: int, seed: int = 7, attachment_size: int = 64 * 1024) -> list[bytes]:
+    """
+    Builds count RFC 822 messages.
+
+    Args:
+        count (int): Number of messages.
+        seed (int): Random seed; the same seed always yields the same corpus.
+        attachment_size (int): Size in bytes of the PDF attached to receipts.
+
+    Returns:
+        list[bytes]: The raw messages, oldest first.
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    threads: list[tuple[str, str, str]] = []  # (root id, references, subject)
+    messages = []
+    for n in range(count):
+        name, address = rng.choice(SENDERS)
+        msg = EmailMessage()
+        message_id = f"<bench-{seed}-{n}@example.com>"
+        msg["Message-ID"] = message_id
+        msg["From"] = f"{name} <{address}>"
+        msg["To"] = "me@example.com"
+        msg["Date"] = format_datetime(start + timedelta(minutes=7 * n))
+        paragraphs = _paragraphs(rng, rng.randint(1, 6))
+        kind = rng.random()
+        if kind < 0.25 and threads:
+            # reply in an existing conversation, with the quoted history real clients add
+            root, references, subject = rng.choice(threads)
+            msg["Subject"] = f"Re: {subject}"
+            msg["In-Reply-To"] = references.split()[-1]
+            msg["References"] = references
+            threads.append((root, f"{references} {message_id}", subject))
+            msg.set_content("\n\n".join(paragraphs) + SIGNATURE + QUOTED)
+        elif kind < 0.45:
+            msg["Subject"] = f"Weekly digest #{n}: {_sentence(rng, 4)}"
+            msg["List-Id"] = "Weekly Digest <digest.weekly.io>"
+            msg.set_content(_html(paragraphs), subtype="html")
+        elif kind < 0.6:
+            msg["Subject"] = f"Your receipt #{rng.randint(1000, 99999)}"
+            msg.set_content("\n\n".join(paragraphs))
+            msg.add_alternative(_html(paragraphs), subtype="html")
+            msg.add_attachment(
+                b"%PDF-1.4\n" + rng.randbytes(attachment_size), maintype="application", subtype="pdf",
+                filename=f"receipt-{n}.pdf",
+            )
+        else:
+            subject = _sentence(rng, rng.randint(3, 7)).rstrip(".")
+            if rng.random() < 0.3:
+                subject += "?"
+            msg["Subject"] = subject
+            threads.append((message_id, message_id, subject))
+            msg.set_content("\n\n".join(paragraphs) + SIGNATURE)
+            if rng.random() < 0.5:
+                msg.add_alternative(_html(paragraphs), subtype="html")
+        # fixed boundaries, otherwise the generator picks random ones
+        for i, part in enumerate(p for p in msg.walk() if p.is_multipart()):
+            part.set_boundary(f"==bench-{seed}-{n}-{i}==")
+        messages.append(msg.as_bytes())
+    return messages
+
+
+def inbound_payloads(count: int, seed: int = 7) -> list[dict]:
+    """Builds count /email request bodies with the same subject, sender and thread mix as generate_corpus."""
+    payloads = []
+    for raw in generate_corpus(count, seed, attachment_size=0):
+        msg = message_from_bytes(raw, policy=default)
+        body = msg.get_body(preferencelist=("plain", "html"))
+        payloads.append({
+            "message_id": msg["Message-ID"],
+            "subject": msg["Subject"],
+            "sender": msg["From"],
+            "date": msg["Date"],
+            "body": body.get_content() if body is not None else "",
+            "list_id": msg["List-Id"],
+            "in_reply_to": msg["In-Reply-To"],
+            "references": msg["References"],
+        })
+    return payloads
@@ -0,0 +1,193 @@
+"""
+Local IMAP4rev1 server serving an in-memory corpus, for driving fetch_emails offline.
+
+It implements the subset the fetcher and imapclient use (CAPABILITY, LOGIN, SELECT/EXAMINE,
+UID SEARCH, UID FETCH of UID, BODYSTRUCTURE, BODY.PEEK[HEADER], BODY.PEEK[<section>] and RFC822,
+NOOP and LOGOUT) over plain TCP, so benchmarks exercise the real client, wire format and parser.
+"""
+import re
+import socketserver
+import threading
+from email import message_from_bytes
+from email.policy import compat32
+
+_FETCH_ITEM = re.compile(r"BODY(?:\.PEEK)?\[[^\]]*\]|[A-Z0-9.]+")
+_LITERAL = re.compile(rb"\{(\d+)\}\r\n$")
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def bodystructure(msg) -> str:
+    """Serializes the BODYSTRUCTURE of an email.message.Message."""
+    if msg.is_multipart():
+        parts = "".join(bodystructure(part) for part in msg.get_payload())
+        return f"({parts} {_quote(msg.get_content_subtype().upper())})"
+    maintype, subtype = msg.get_content_maintype().upper(), msg.get_content_subtype().upper()
+    charset = msg.get_param("charset")
+    params = f"({_quote('CHARSET')} {_quote(charset)})" if charset else "NIL"
+    encoding = (msg.get("Content-Transfer-Encoding") or "7BIT").upper()
+    payload = section_bytes(msg)
+    disposition = "NIL"
+    if msg.get_content_disposition() == "attachment":
+        disposition = f"({_quote('ATTACHMENT')} ({_quote('FILENAME')} {_quote(msg.get_filename() or 'file')}))"
+    head = f"{_quote(maintype)} {_quote(subtype)} {params} NIL NIL {_quote(encoding)} {len(payload)}"
+    if maintype == "TEXT":
+        lines = payload.count(b"\n")
+        return f"({head} {lines} NIL {disposition} NIL NIL)"
+    return f"({head} NIL {disposition} NIL NIL)"
+
+
+def section_bytes(msg, section: str = "") -> bytes:
+    """Returns the transfer-encoded payload of a body section ("1", "2.1", ...)."""
+    for index in filter(None, section.split(".")):
+        if msg.is_multipart():
+            msg = msg.get_payload()[int(index) - 1]
+    payload = msg.get_payload()
+    return payload.encode("utf-8", "surrogateescape") if isinstance(payload, str) else b""
+
+
+class Mailbox:
+    """Messages of one folder by UID."""
+
+    def __init__(self, messages: list[bytes], uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.raw = {uid: raw for uid, raw in enumerate(messages, 1)}
+        self.parsed = {uid: message_from_bytes(raw, policy=compat32) for uid, raw in self.raw.items()}
+
+    def uids(self) -> list[int]:
+        return sorted(self.raw)
+
+
+def _uid_set(spec: str, uids: list[int]) -> list[int]:
+    top = max(uids, default=0)
+    wanted = set()
+    for item in spec.split(","):
+        if ":" in item:
+            lo, hi = (top if v == "*" else int(v) for v in item.split(":"))
+            lo, hi = min(lo, hi), max(lo, hi)
+            wanted.update(uid for uid in uids if lo <= uid <= hi)
+        else:
+            wanted.add(top if item == "*" else int(item))
+    return sorted(uid for uid in wanted if uid in uids)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, data: bytes | str):
+        self.wfile.write(data.encode() if isinstance(data, str) else data)
+
+    def read_command(self) -> str | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        # inline client literals: "... {5}\r\n" is followed by 5 bytes of the argument
+        while match := _LITERAL.search(line):
+            self.send("+ Ready for literal\r\n")
+            literal = self.rfile.read(int(match.group(1)))
+            line = line[:match.start()] + _quote(literal.decode()).encode() + self.rfile.readline()
+        return line.decode().rstrip("\r\n")
+
+    def handle(self):
+        server: FakeImapServer = self.server.owner
+        folder = None
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] Fake IMAP ready\r\n")
+        while (line := self.read_command()) is not None:
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "UID":
+                command, _, args = args.partition(" ")
+                command = "UID " + command.upper()
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 IDLE\r\n")
+            elif command == "LOGIN":
+                pass
+            elif command in ("SELECT", "EXAMINE"):
+                folder = server.mailboxes.get(args.strip('"'))
+                if folder is None:
+                    self.send(f"{tag} NO No such folder\r\n")
+                    continue
+                uids = folder.uids()
+                self.send(f"* {len(uids)} EXISTS\r\n* 0 RECENT\r\n")
+                self.send(f"* OK [UIDVALIDITY {folder.uidvalidity}] UIDs valid\r\n")
+                self.send(f"* OK [UIDNEXT {max(uids, default=0) + 1}] Predicted next UID\r\n")
+                mode = "READ-ONLY" if command == "EXAMINE" else "READ-WRITE"
+                self.send(f"{tag} OK [{mode}] {command} completed\r\n")
+                continue
+            elif command == "UID SEARCH":
+                uids = folder.uids()
+                criteria = args.split()
+                if criteria and criteria[0].upper() == "UID":
+                    uids = _uid_set(criteria[1], uids)
+                self.send("* SEARCH " + " ".join(map(str, uids)) + "\r\n")
+            elif command == "UID FETCH":
+                spec, _, items = args.partition(" ")
+                self.fetch(folder, _uid_set(spec, folder.uids()), _FETCH_ITEM.findall(items.upper()))
+            elif command == "LOGOUT":
+                self.send("* BYE Logging out\r\n")
+                self.send(f"{tag} OK LOGOUT completed\r\n")
+                return
+            elif command != "NOOP":
+                self.send(f"{tag} BAD Unsupported command {command}\r\n")
+                continue
+            self.send(f"{tag} OK {command} completed\r\n")
+
+    def fetch(self, folder: Mailbox, uids: list[int], items: list[str]):
+        seqs = {uid: i for i, uid in enumerate(folder.uids(), 1)}
+        for uid in uids:
+            msg = folder.parsed[uid]
+            out = [f"* {seqs[uid]} FETCH (UID {uid}".encode()]
+            for item in items:
+                if item == "UID":
+                    continue
+                if item == "BODYSTRUCTURE":
+                    out.append(f" BODYSTRUCTURE {bodystructure(msg)}".encode())
+                    continue
+                if item == "RFC822":
+                    name, data = "RFC822", folder.raw[uid]
+                else:
+                    section = item[item.index("[") + 1:-1]
+                    name = f"BODY[{section}]"
+                    if section == "HEADER":
+                        data = folder.raw[uid].split(b"\n\n", 1)[0] + b"\n\n"
+                    else:
+                        data = section_bytes(msg, section)
+                out.append(f" {name} {{{len(data)}}}\r\n".encode() + data)
+            out.append(b")\r\n")
+            self.send(b"".join(out))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeImapServer:
+    """
+    IMAP server on 127.0.0.1 serving folders of raw messages, listening on an ephemeral port
+    (see port). Use as a context manager.
+    """
+
+    def __init__(self, folders: dict[str, list[bytes]], uidvalidity: int = 1):
+        self.mailboxes = {name: Mailbox(messages, uidvalidity) for name, messages in folders.items()}
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.owner = self
+        self.host, self.port = self._server.server_address
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "FakeImapServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
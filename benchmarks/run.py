@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Runs the offline benchmarks and compares them with a saved baseline.
+
+Every benchmark works in a temporary directory with its own database, report, attachment and
+classifier paths, so nothing touches the configured ones and no network access or API key is
+needed:
+
+- ingest: POST /email (and POST /emails/batch) against the API served by uvicorn on a local port.
+- fetch: fetch_emails against a local fake IMAP server holding a synthetic corpus.
+- triage: run_email_triage_agent with a stub model for several backlog sizes.
+
+Peak Python memory of each benchmark is measured with tracemalloc. Metrics ending in _per_s are
+better when higher, all others when lower; with --fail-on-regression the exit code is 1 when any
+metric is worse than the baseline by more than --tolerance.
+
+Usage:
+    python -m benchmarks.run [--quick] [--only ingest,fetch,triage] [--save-baseline]
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import uvicorn
+
+from benchmarks.corpus import generate_corpus, inbound_payloads
+from benchmarks.fake_imap_server import FakeImapServer
+from benchmarks.stub_model import StubModel, restore_models, use_stub_model
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SIZES = {
+    "full": {"ingest": 2000, "batch": 5000, "fetch": 1000, "backlog": [100, 500, 2000]},
+    "quick": {"ingest": 200, "batch": 500, "fetch": 100, "backlog": [50, 200]},
+}
+
+
+@contextlib.contextmanager
+def sandbox():
+    """Points the database, reports, attachments and classifier at a temporary directory."""
+    import epoch_agent.email_triage_agent  # noqa: F401 (registers the models ensure_schema creates)
+    from epoch_agent.services import storage
+    names = ("DB_FILE", "REPORT_DIR", "BLOB_DIR", "CLASSIFIER_PATH", "OPENAI_AGENTS_DISABLE_TRACING")
+    saved = {name: os.environ.get(name) for name in names}
+    with tempfile.TemporaryDirectory(prefix="epoch-bench-") as tmp:
+        os.environ.update({
+            "DB_FILE": os.path.join(tmp, "bench.db"),
+            "REPORT_DIR": os.path.join(tmp, "reports"),
+            "BLOB_DIR": os.path.join(tmp, "attachments"),
+            "CLASSIFIER_PATH": os.path.join(tmp, "classifier.npz"),
+            "OPENAI_AGENTS_DISABLE_TRACING": "1",
+        })
+        storage.configure(os.environ["DB_FILE"])
+        try:
+            yield tmp
+        finally:
+            storage.engine.dispose()
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences the per-email prints of the code under test, which would otherwise dominate the timings."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def serve(app):
+    """Serves app with uvicorn on a free local port in a background thread and yields its base URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def bench_ingest(count: int, batch_count: int, concurrency: int) -> dict:
+    """Requests per second of POST /email from concurrent clients, and emails per second of POST /emails/batch."""
+    import app.app as app_module
+    app_module = importlib.reload(app_module)
+    payloads = inbound_payloads(count, seed=11)
+    with serve(app_module.app) as url, quiet():
+        local = threading.local()
+
+        def post(payload):
+            if not hasattr(local, "client"):
+                local.client = httpx.Client(base_url=url)
+            local.client.post("/email", json=payload).raise_for_status()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(post, payloads))
+        single = time.perf_counter() - start
+
+        batch = inbound_payloads(batch_count, seed=12)
+        start = time.perf_counter()
+        with httpx.Client(base_url=url, timeout=60) as client:
+            for i in range(0, len(batch), 500):
+                client.post("/emails/batch", json=batch[i:i + 500]).raise_for_status()
+        batched = time.perf_counter() - start
+    return {
+        "email_req_per_s": round(count / single, 1),
+        "batch_emails_per_s": round(batch_count / batched, 1),
+    }
+
+
+def bench_fetch(count: int) -> dict:
+    """Messages per second of a full fetch_emails run, and of its parse stage alone."""
+    from epoch_agent.services import imap_fetcher
+    corpus = generate_corpus(count)
+    with FakeImapServer({"INBOX": corpus}) as server:
+        env = {
+            "IMAP_HOST": server.host, "IMAP_PORT": str(server.port), "IMAP_SSL": "False",
+            "IMAP_USER": "bench", "IMAP_PASS": "bench", "IMAP_INITIAL_SYNC_DAYS": "36500",
+        }
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            with quiet():
+                start = time.perf_counter()
+                stored = imap_fetcher.fetch_emails()
+                seconds = time.perf_counter() - start
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    if stored != count:
+        raise RuntimeError(f"fetch stored {stored} of {count} messages")
+    return {
+        "fetch_msgs_per_s": round(count / seconds, 1),
+        "parse_msgs_per_s": round(imap_fetcher.parse_stats.per_second, 1),
+    }
+
+
+def bench_triage(backlog: int, batch_size: int, model_latency: float) -> dict:
+    """Wall time of one triage run over a backlog of unprocessed emails, using the stub model."""
+    import app.app as app_module
+    from epoch_agent import email_triage_agent as triage
+    from epoch_agent.services.storage import SessionLocal
+    with SessionLocal() as session:
+        app_module.insert_emails(session, [app_module.InboundEmail(**p) for p in inbound_payloads(backlog, seed=13)])
+        session.commit()
+    model = StubModel(latency=model_latency)
+    agents = [triage.email_triage_agent, triage.email_batch_triage_agent]
+    previous = use_stub_model(agents, model)
+    try:
+        with quiet():
+            start = time.perf_counter()
+            asyncio.run(triage.run_email_triage_agent(batch_size=batch_size))
+            seconds = time.perf_counter() - start
+    finally:
+        restore_models(agents, previous)
+    return {f"latency_s_{backlog}": round(seconds, 3), f"model_calls_{backlog}": model.calls}
+
+
+def measured(func, *args) -> dict:
+    """Runs one benchmark in a sandbox and adds its peak traced memory."""
+    with sandbox():
+        tracemalloc.start()
+        try:
+            result = func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {**result, "peak_mb": round(peak / 2**20, 1)}
+
+
+def run_benchmarks(sizes: dict, only: set[str], concurrency: int, batch_size: int, model_latency: float) -> dict:
+    # import everything up front so module loading is not counted in whichever benchmark runs first
+    import app.app  # noqa: F401
+    from epoch_agent.services import imap_fetcher  # noqa: F401
+    with sandbox():
+        bench_triage(5, batch_size, 0.0)
+    results = {}
+    if "ingest" in only:
+        results["ingest"] = measured(bench_ingest, sizes["ingest"], sizes["batch"], concurrency)
+    if "fetch" in only:
+        results["fetch"] = measured(bench_fetch, sizes["fetch"])
+    if "triage" in only:
+        triage = {}
+        for backlog in sizes["backlog"]:
+            result = measured(bench_triage, backlog, batch_size, model_latency)
+            result[f"peak_mb_{backlog}"] = result.pop("peak_mb")
+            triage.update(result)
+        results["triage"] = triage
+    return results
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_s")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[tuple]:
+    """
+    Compares every metric with the baseline.
+
+    Returns:
+        list[tuple]: (name, value, baseline value or None, change or None, regressed) per metric,
+            where change is the relative difference and regressed is True when the metric got
+            worse by more than tolerance.
+    """
+    rows = []
+    for group, metrics in results.items():
+        for metric, value in metrics.items():
+            name = f"{group}.{metric}"
+            base = baseline.get(group, {}).get(metric)
+            if not base or metric.startswith("model_calls"):
+                rows.append((name, value, base, None, False))
+                continue
+            change = (value - base) / base
+            worse = -change if higher_is_better(metric) else change
+            rows.append((name, value, base, change, worse > tolerance))
+    return rows
+
+
+def print_table(rows: list[tuple]):
+    print(f"{'metric':32} {'value':>12} {'baseline':>12} {'change':>9}")
+    for name, value, base, change, regressed in rows:
+        base_str = f"{base:12}" if base is not None else f"{'-':>12}"
+        change_str = f"{change:+9.1%}" if change is not None else f"{'-':>9}"
+        print(f"{name:32} {value:12} {base_str} {change_str}{'  REGRESSION' if regressed else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="small sizes for a fast smoke run")
+    parser.add_argument("--only", default="ingest,fetch,triage", help="comma-separated benchmarks to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent /email clients")
+    parser.add_argument("--batch-size", type=int, default=25, help="emails per agent run in the triage benchmark")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="simulated seconds per model call")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    mode = "quick" if args.quick else "full"
+    only = set(filter(None, args.only.split(",")))
+    results = run_benchmarks(SIZES[mode], only, args.concurrency, args.batch_size, args.model_latency)
+    document = {"mode": mode, "python": sys.version.split()[0], "results": results}
+
+    # the baseline file keeps one result set per mode
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    rows = compare(results, baselines.get(mode, {}).get("results", {}), args.tolerance)
+    print_table(rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.save_baseline:
+        baselines[mode] = document
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"Baseline saved: {args.baseline} ({mode})")
+    if args.fail_on_regression and any(regressed for *_, regressed in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Deterministic offline stand-in for the OpenAI model behind the triage agents.
+
+StubModel follows the same turn structure as the real model: given the get_unprocessed_emails
+tool it calls the tool first, then answers with a TriageResult built from the emails it was
+given. Tags come from simple keyword rules, token usage is estimated from the text length and an
+optional fixed latency simulates the network round trip.
+"""
+import ast
+import asyncio
+import json
+import time
+
+from agents import Agent
+from agents.items import ModelResponse
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseUsage,
+)
+
+KEYWORD_TAGS = [
+    (("invoice", "receipt", "payment", "statement"), "5 - Financials"),
+    (("newsletter", "weekly", "digest", "unsubscribe"), "6 - Newsletters"),
+    (("urgent", "asap", "outage"), "! - Bob"),
+    (("waiting", "pending", "follow up"), "4 - Waiting On"),
+    (("?",), "1 - To Respond"),
+]
+
+
+def stub_tag(subject: str, body: str) -> str:
+    text = f"{subject}\n{body}".lower()
+    for keywords, tag in KEYWORD_TAGS:
+        if any(k in text for k in keywords):
+            return tag
+    return "2 - Review"
+
+
+def _text_of(input) -> str:
+    if isinstance(input, str):
+        return input
+    return json.dumps(input, default=str)
+
+
+def _emails_from_repr(text: str) -> list[dict]:
+    # function tools hand the model str(EmailList), e.g. "emails=[Email(message_id='m1', ...)]"
+    try:
+        tree = ast.parse(f"dict({text})", mode="eval")
+    except SyntaxError:
+        return []
+    return [
+        {kw.arg: kw.value.value for kw in node.keywords if isinstance(kw.value, ast.Constant)}
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "Email"
+    ]
+
+
+def _emails_in(input) -> list[dict]:
+    """Finds the emails in the run input: a tool result, or the JSON email list of a batch run."""
+    if isinstance(input, str):
+        candidates = [input]
+    else:
+        candidates = [item.get("output") for item in input if isinstance(item, dict) and item.get("type") == "function_call_output"]
+        candidates += [item.get("content") for item in input if isinstance(item, dict) and item.get("role") == "user"]
+    for candidate in reversed(candidates):
+        if isinstance(candidate, list):
+            candidate = "".join(part.get("text", "") for part in candidate if isinstance(part, dict))
+        if not isinstance(candidate, str):
+            continue
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            if candidate.startswith("emails="):
+                return _emails_from_repr(candidate)
+            continue
+        if isinstance(data, dict) and "emails" in data:
+            return data["emails"]
+    return []
+
+
+class StubModel(Model):
+    """Deterministic model: calls the email tool when available, then tags every email it saw."""
+
+    def __init__(self, latency: float = 0.0, chars_per_token: int = 4):
+        self.latency = latency
+        self.chars_per_token = chars_per_token
+        self.calls = 0
+
+    def _usage(self, input_text: str, output_text: str) -> Usage:
+        input_tokens = len(input_text) // self.chars_per_token
+        output_tokens = len(output_text) // self.chars_per_token
+        return Usage(requests=1, input_tokens=input_tokens, output_tokens=output_tokens,
+                     total_tokens=input_tokens + output_tokens)
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                           handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        input_text = (system_instructions or "") + _text_of(input)
+        called_tool = not isinstance(input, str) and any(
+            isinstance(item, dict) and item.get("type") == "function_call_output" for item in input
+        )
+        if tools and not called_tool:
+            call = ResponseFunctionToolCall(
+                type="function_call", call_id=f"call_{self.calls}", name=tools[0].name, arguments="{}",
+                id=f"fc_{self.calls}", status="completed",
+            )
+            return ModelResponse(output=[call], usage=self._usage(input_text, call.arguments), response_id=None)
+
+        emails = _emails_in(input)
+        result = {
+            "emails": [
+                {
+                    "message_id": e["message_id"],
+                    "status": stub_tag(e.get("subject", ""), e.get("body", "")),
+                    "summary": (e.get("subject") or "")[:60],
+                }
+                for e in emails
+            ],
+            "summary": f"{len(emails)} emails triaged.",
+        }
+        text = json.dumps(result)
+        message = ResponseOutputMessage(
+            id=f"msg_{self.calls}", type="message", role="assistant", status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
+        return ModelResponse(output=[message], usage=self._usage(input_text, text), response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema,
+                              handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+        """Streams the get_response answer as a single response.completed event."""
+        response = await self.get_response(
+            system_instructions, input, model_settings, tools, output_schema, handoffs, tracing,
+            previous_response_id=previous_response_id, conversation_id=conversation_id, prompt=prompt,
+        )
+        usage = ResponseUsage(
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            total_tokens=response.usage.total_tokens,
+            input_tokens_details=response.usage.input_tokens_details,
+            output_tokens_details=response.usage.output_tokens_details,
+        )
+        yield ResponseCompletedEvent(
+            type="response.completed",
+            sequence_number=0,
+            response=Response(
+                id=f"resp_{self.calls}", object="response", created_at=time.time(), model="stub",
+                output=response.output, usage=usage, status="completed",
+                tool_choice="auto", tools=[], parallel_tool_calls=False,
+            ),
+        )
+
+
+def use_stub_model(agents: list[Agent], model: StubModel) -> dict:
+    """Points agents at model and returns their previous models for restore_models."""
+    previous = {agent.name: agent.model for agent in agents}
+    for agent in agents:
+        agent.model = model
+    return previous
+
+
+def restore_models(agents: list[Agent], previous: dict):
+    for agent in agents:
+        agent.model = previous[agent.name]
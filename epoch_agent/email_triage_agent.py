@@ -1,23 +1,30 @@
 from pydantic import BaseModel
-from agents import function_tool, Agent, Runner, trace
+from agents import function_tool, Agent, RunContextWrapper, Runner, trace
 import asyncio
 import os
-from sqlalchemy import create_engine, Column, String, Boolean, Text, Integer, LargeBinary
-from sqlalchemy.orm import declarative_base, sessionmaker
-from datetime import datetime
+import time
+import uuid
+from sqlalchemy import Column, String, Boolean, Text, Integer, LargeBinary, Index, or_, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import validates
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DB_FILE = os.getenv("DB_FILE", "email_triage.db")
-DATABASE_URL = f"sqlite:///{DB_FILE}"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-
-Base = declarative_base()
+from epoch_agent.services import agent_runner, cache, classifier, metrics, rules, search, threads
+from epoch_agent.services.storage import Base, DB_FILE, SessionLocal, engine, ensure_schema
 
 class EmailORM(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # the unprocessed queue, oldest first
+        Index("ix_emails_processed_received_at", "processed", "received_at"),
+        # keyset pagination of the listing endpoints
+        Index("ix_emails_received_at_message_id", "received_at", "message_id"),
+        # one row per message, whichever ingest path delivered it first (see services/dedup.py)
+        Index("ux_emails_content_hash", "content_hash", unique=True),
+    )
 
     message_id = Column(String, primary_key=True, index=True)
     subject = Column(String)
@@ -27,19 +34,77 @@ class EmailORM(Base):
     received_at = Column(String)
     processed = Column(Boolean, default=False)
     processed_at = Column(String)
-    status = Column(String, nullable=True)
+    status = Column(String, nullable=True, index=True)
     html_body = Column(Text, nullable=True)
+    # text of html_body for the full-text index, set with it (see services/search.py)
+    html_text = Column(Text, nullable=True)
+    digest = Column(Text, nullable=True)
+    list_id = Column(String, nullable=True)
+    tagged_by = Column(String, nullable=True)
+    in_reply_to = Column(String, nullable=True)
+    references = Column(Text, nullable=True)
+    thread_id = Column(String, nullable=True, index=True)
+    # set while a triage worker holds the email (see claim_emails)
+    lease_token = Column(String, nullable=True, index=True)
+    lease_expires_at = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+
+    @validates("html_body")
+    def _store_html_text(self, key, html_body):
+        # every ORM write of the HTML body also stores the text the full-text index reads
+        self.html_text = search.html_text(html_body)
+        return html_body
+
 
 class AttachmentORM(Base):
     __tablename__ = "attachments"
+    # ids are never reused, so an archived attachment's id cannot be handed to a new one
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     message_id = Column(String, index=True)
     filename = Column(String)
     content_type = Column(String)
-    data = Column(LargeBinary)
+    # legacy inline bytes; new attachments live in the blob store (see services/blobstore.py)
+    data = Column(LargeBinary, nullable=True)
+    sha256 = Column(String, nullable=True, index=True)
+    size = Column(Integer, nullable=True)
+
+class BlobORM(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String, primary_key=True)
+    size = Column(Integer)
+    refcount = Column(Integer, default=0)
+
+class RuleORM(Base):
+    __tablename__ = "triage_rules"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    field = Column(String, nullable=False)
+    pattern = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+
+class ClassificationCacheORM(Base):
+    __tablename__ = "classification_cache"
+
+    fingerprint = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    summary = Column(Text)
+    created_at = Column(String, index=True)
+    last_used_at = Column(String, index=True)
+    hits = Column(Integer, default=0)
+
+class ImapSyncStateORM(Base):
+    __tablename__ = "imap_sync_state"
 
-Base.metadata.create_all(bind=engine)
+    account = Column(String, primary_key=True)
+    folder = Column(String, primary_key=True)
+    uidvalidity = Column(Integer)
+    last_uid = Column(Integer, default=0)
+    updated_at = Column(String)
+
+ensure_schema(engine)
 class Email(BaseModel):
     """
     Represents an email message for triage and summarization.
@@ -71,72 +136,284 @@ class ProcessedOutput(BaseModel):
     success: bool
 
 class EmailStatus(BaseModel):
-    """Tag and ID for a processed email update."""
+    """Tag, ID and one-line summary for a processed email update."""
     message_id: str
     status: str
+    summary: str = ""
+
+
+class TriageResult(BaseModel):
+    """
+    Structured triage output: one status per email plus a one-line summary of the run.
+    """
+    emails: list[EmailStatus]
+    summary: str
+
+
+TAGS = [
+    "! - Bob",
+    "1 - To Respond",
+    "2 - Review",
+    "3 - Responded",
+    "4 - Waiting On",
+    "5 - Financials",
+    "6 - Newsletters",
+]
+
+
+def pending_filter(lease_token: str | None = None) -> tuple:
+    """
+    Filter for emails awaiting triage: those held under lease_token, or, without a token, every
+    unprocessed email no other worker holds an unexpired lease on.
+    """
+    if lease_token:
+        return (EmailORM.processed == False, EmailORM.lease_token == lease_token)
+    now = datetime.utcnow().isoformat()
+    return (
+        EmailORM.processed == False,
+        or_(EmailORM.lease_token.is_(None), EmailORM.lease_expires_at < now),
+    )
+
+
+@metrics.timed("claim")
+def claim_emails(limit: int | None = None, lease_seconds: float | None = None) -> tuple[str, int]:
+    """
+    Atomically leases unprocessed emails that are not held by another worker, oldest first.
+
+    Emails whose lease expired (e.g. after a worker crashed) are claimable again.
+
+    Args:
+        limit (int | None): Maximum emails to claim (default TRIAGE_CLAIM_LIMIT, or all).
+        lease_seconds (float | None): Lease duration (default TRIAGE_LEASE_SECONDS or 900).
+
+    Returns:
+        tuple[str, int]: The lease token and the number of emails claimed.
+    """
+    if limit is None and os.getenv("TRIAGE_CLAIM_LIMIT"):
+        limit = int(os.getenv("TRIAGE_CLAIM_LIMIT"))
+    if lease_seconds is None:
+        lease_seconds = float(os.getenv("TRIAGE_LEASE_SECONDS", 900))
+    token = uuid.uuid4().hex
+    expires = (datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat()
+    candidates = select(EmailORM.message_id).where(*pending_filter()).order_by(EmailORM.received_at).limit(limit)
+    stmt = (
+        update(EmailORM)
+        .where(EmailORM.message_id.in_(candidates))
+        .values(lease_token=token, lease_expires_at=expires)
+        .execution_options(synchronize_session=False)
+    )
+    for attempt in range(5):
+        try:
+            with SessionLocal() as session:
+                claimed = session.execute(stmt).rowcount
+                session.commit()
+            return token, claimed
+        except OperationalError:
+            # another worker committed a claim while this one was starting; retry on a fresh snapshot
+            if attempt == 4:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+@metrics.timed("release")
+def release_lease(lease_token: str) -> int:
+    """
+    Returns emails still held under lease_token to the pool.
+
+    Returns:
+        int: The number of emails released.
+    """
+    with SessionLocal() as session:
+        released = session.execute(
+            update(EmailORM)
+            .where(EmailORM.lease_token == lease_token)
+            .values(lease_token=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+    return released
+
+
+@metrics.timed("read_unprocessed")
+def has_pending_emails(lease_token: str | None = None) -> bool:
+    """Whether any email still awaits triage (see pending_filter)."""
+    with SessionLocal() as session:
+        return session.query(EmailORM.message_id).filter(*pending_filter(lease_token)).first() is not None
 
 
-@function_tool
-def get_unprocessed_emails() -> EmailList:
+@metrics.timed("read_unprocessed")
+def get_unprocessed_emails(
+    use_digest: bool = True, by_thread: bool = False, lease_token: str | None = None
+) -> EmailList:
     """
     Reads unprocessed emails from the local database.
 
+    Args:
+        use_digest (bool): Serve the compact ingest-time digest instead of the raw body when available.
+        by_thread (bool): Return only the newest unprocessed message of each thread, with a short
+            context of the earlier ones prepended to its body.
+        lease_token (str | None): Return only the emails claimed under this lease. Without it,
+            emails leased by other workers are skipped.
+
     Returns:
         EmailList: Emails awaiting triage.
     """
     with SessionLocal() as session:
-        emails_orm = session.query(EmailORM).filter(EmailORM.processed == False).all()
+        emails_orm = (
+            session.query(EmailORM)
+            .filter(*pending_filter(lease_token))
+            .order_by(EmailORM.received_at)
+            .all()
+        )
+        if by_thread:
+            grouped: dict[str, list[EmailORM]] = {}
+            for e in emails_orm:
+                grouped.setdefault(e.thread_id or e.message_id, []).append(e)
+            selected = [(group[-1], threads.thread_context(group[:-1])) for group in grouped.values()]
+        else:
+            selected = [(e, "") for e in emails_orm]
         emails = [
             Email(
                 message_id=e.message_id,
                 subject=e.subject,
                 sender=e.sender,
                 date=e.date,
-                body=e.body,
+                body=context + (e.digest if use_digest and e.digest is not None else e.body),
             )
-            for e in emails_orm
+            for e, context in selected
         ]
     return EmailList(emails=emails)
 
 
-@function_tool
-def save_report(report: str) -> ReportOutput:
+@metrics.timed("expand_threads")
+def expand_threads(result: TriageResult, lease_token: str | None = None) -> TriageResult:
+    """
+    Applies each thread representative's tag to every unprocessed message in its thread
+    (held under lease_token, when given).
     """
-    Saves the markdown report to a file in the report directory.
+    with SessionLocal() as session:
+        ids = [upd.message_id for upd in result.emails]
+        thread_of = dict(
+            session.query(EmailORM.message_id, EmailORM.thread_id).filter(EmailORM.message_id.in_(ids)).all()
+        )
+        expanded = []
+        for upd in result.emails:
+            expanded.append(upd)
+            thread_id = thread_of.get(upd.message_id)
+            if not thread_id:
+                continue
+            members = session.query(EmailORM.message_id).filter(
+                *pending_filter(lease_token),
+                EmailORM.thread_id == thread_id,
+                EmailORM.message_id != upd.message_id,
+            )
+            expanded.extend(
+                EmailStatus(message_id=mid, status=upd.status, summary=f"Earlier message in thread: {upd.summary}")
+                for (mid,) in members
+            )
+    return TriageResult(emails=expanded, summary=result.summary)
+
+
+def render_report(result: TriageResult, emails: dict[str, Email] | None = None) -> str:
+    """
+    Renders a triage result as a markdown report grouped by tag.
 
     Args:
-        report (str): The markdown-formatted report content.
+        result (TriageResult): The structured triage result.
+        emails (dict[str, Email] | None): Optional emails by message_id used to show subject and sender.
+
+    Returns:
+        str: The markdown report.
+    """
+    emails = emails or {}
+    groups: dict[str, list[EmailStatus]] = {}
+    for upd in result.emails:
+        groups.setdefault(upd.status, []).append(upd)
+    order = [t for t in TAGS if t in groups] + sorted(t for t in groups if t not in TAGS)
+
+    lines = ["# Email Triage Report", "", result.summary, ""]
+    for tag in order:
+        lines.append(f"## {tag} ({len(groups[tag])})")
+        lines.append("")
+        for upd in groups[tag]:
+            e = emails.get(upd.message_id)
+            title = f"**{e.subject}** ({e.sender})" if e else f"`{upd.message_id}`"
+            lines.append(f"- {title}: {upd.summary}" if upd.summary else f"- {title}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+@metrics.timed("save_report")
+def save_report(result: TriageResult) -> ReportOutput:
+    """
+    Renders the triage result and saves the markdown report to a file in the report directory.
+
+    Args:
+        result (TriageResult): The structured triage result.
 
     Returns:
         ReportOutput: The path and status of the saved report.
     """
+    with SessionLocal() as session:
+        ids = [upd.message_id for upd in result.emails]
+        emails = {
+            e.message_id: Email(
+                message_id=e.message_id,
+                subject=e.subject,
+                sender=e.sender,
+                date=e.date,
+                body="",
+            )
+            for e in session.query(EmailORM).filter(EmailORM.message_id.in_(ids))
+        }
     report_dir = os.getenv('REPORT_DIR', 'reports')
     os.makedirs(report_dir, exist_ok=True)
     filename = f"report_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.md"
     path = os.path.join(report_dir, filename)
     with open(path, 'w', encoding='utf-8') as f:
-        f.write(report)
+        f.write(render_report(result, emails))
     return ReportOutput(path=path, success=True)
 
 
-@function_tool
-def mark_emails_processed(updates: list[EmailStatus]) -> ProcessedOutput:
-    """Marks emails as processed and records their status code in the database."""
+def save_profile(profile: metrics.RunProfile, report_path: str) -> str:
+    """Saves a run's timings and token usage as JSON next to its report."""
+    path = os.path.splitext(report_path)[0] + ".profile.json"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profile.model_dump_json(indent=2))
+    return path
+
+
+@metrics.timed("mark_processed")
+def mark_emails_processed(
+    result: TriageResult, source: str = "agent", lease_token: str | None = None
+) -> ProcessedOutput:
+    """
+    Marks emails as processed and records their status code in the database.
+
+    Args:
+        result (TriageResult): The statuses to record.
+        source (str): What assigned the tags (agent, rules, classifier or manual).
+        lease_token (str | None): Only finalize emails still held under this lease; emails whose
+            lease expired and was claimed by another worker are left to that worker.
+    """
+    marked = 0
     with SessionLocal() as session:
-        for upd in updates:
+        for upd in result.emails:
             email_obj = session.get(EmailORM, upd.message_id)
-            if email_obj:
+            if email_obj and (lease_token is None or email_obj.lease_token == lease_token):
+                marked += 1
+                email_obj.lease_token = None
+                email_obj.lease_expires_at = None
                 email_obj.processed = True
                 email_obj.processed_at = datetime.utcnow().isoformat()
                 email_obj.status = upd.status
+                email_obj.tagged_by = source
         session.commit()
+    metrics.TRIAGE_EMAILS.inc(marked, source=source)
     return ProcessedOutput(success=True)
 
 
-email_triage_agent = Agent(
-    name="email_triage_agent",
-    instructions="""
-Use get_unprocessed_emails() to retrieve all unprocessed emails.
+TAG_INSTRUCTIONS = """
 Assign one of the following tags to each email based on content and urgency:
 - "! - Bob": requires my immediate attention.
 - "1 - To Respond": emails that should have a response drafted by the LLM administrative assistant.
@@ -145,27 +422,342 @@ Assign one of the following tags to each email based on content and urgency:
 - "4 - Waiting On": items that require action from others and I will update the assistant later.
 - "5 - Financials": anything finance related, including receipts, bills, or statements.
 - "6 - Newsletters": content I may want to consume later that the LLM assistant thinks I will like.
-Summarize emails grouped by tag and assemble a markdown report.
-Save the report using save_report(report).
-After saving, mark processed emails and record their status by calling mark_emails_processed(updates), where updates is a list of objects each containing message_id and status.
-Always finish by calling save_report tool and using that tool output as your final output.
-""",
-    tools=[get_unprocessed_emails, save_report, mark_emails_processed],
+Return one entry per email with its message_id, status and a one-line summary of at most 20 words,
+plus a one-line summary of the whole set. Do not write a report; it is rendered from your output.
+"""
+
+class TriageOptions(BaseModel):
+    """Run options passed to the triage agent's tools through the run context."""
+    by_thread: bool = False
+    lease_token: str | None = None
+
+
+@function_tool(name_override="get_unprocessed_emails")
+def get_unprocessed_emails_tool(ctx: RunContextWrapper[TriageOptions]) -> EmailList:
+    """
+    Reads unprocessed emails awaiting triage from the local database.
+
+    Returns:
+        EmailList: Emails awaiting triage.
+    """
+    options = ctx.context or TriageOptions()
+    return get_unprocessed_emails(by_thread=options.by_thread, lease_token=options.lease_token)
+
+
+email_triage_agent = Agent(
+    name="email_triage_agent",
+    instructions="""
+Use get_unprocessed_emails() to retrieve all unprocessed emails.
+""" + TAG_INSTRUCTIONS,
+    tools=[get_unprocessed_emails_tool],
     model="gpt-4.1-mini",
-    output_type=ReportOutput,
+    output_type=TriageResult,
 )
 
 
-async def run_email_triage_agent():
+email_batch_triage_agent = Agent(
+    name="email_batch_triage_agent",
+    instructions="""
+The input is a JSON list of emails awaiting triage.
+""" + TAG_INSTRUCTIONS,
+    model="gpt-4.1-mini",
+    output_type=TriageResult,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return len(text or "") // 4 + 1
+
+
+def chunk_emails(emails: list[Email], batch_size: int, max_tokens: int) -> list[list[Email]]:
+    """
+    Split emails into batches of at most batch_size emails and roughly max_tokens tokens.
+
+    An email larger than max_tokens on its own still gets a batch of its own.
+    """
+    batches: list[list[Email]] = []
+    current: list[Email] = []
+    current_tokens = 0
+    for e in emails:
+        tokens = estimate_tokens(e.subject) + estimate_tokens(e.sender) + estimate_tokens(e.body)
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(e)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def merge_results(results: list[TriageResult]) -> TriageResult:
+    """Combines per-batch triage results into a single result."""
+    return TriageResult(
+        emails=[upd for r in results for upd in r.emails],
+        summary=" ".join(r.summary.strip() for r in results if r.summary.strip()),
+    )
+
+
+@metrics.timed("fast_path")
+def apply_fast_path(lease_token: str | None = None) -> TriageResult:
+    """
+    Tags unprocessed emails matching a triage rule without calling the agent.
+
+    Matched emails are marked processed through mark_emails_processed, so the agent never sees them.
+
+    Returns:
+        TriageResult: The emails tagged by rules.
+    """
+    with SessionLocal() as session:
+        index = rules.load_rule_index(session)
+        if not index:
+            return TriageResult(emails=[], summary="")
+        updates = []
+        for e in session.query(EmailORM).filter(*pending_filter(lease_token)):
+            match = index.match(e.sender, e.subject, e.list_id)
+            if match:
+                status, rule = match
+                updates.append(EmailStatus(message_id=e.message_id, status=status, summary=f"Tagged by rule ({rule})."))
+    result = TriageResult(
+        emails=updates,
+        summary=f"{len(updates)} emails tagged by rules." if updates else "",
+    )
+    mark_emails_processed(result, source="rules", lease_token=lease_token)
+    rules.stats.emails_matched += len(updates)
+    rules.stats.llm_classifications_saved += len(updates)
+    return result
+
+
+@metrics.timed("classifier")
+def apply_local_classifier(threshold: float | None = None, lease_token: str | None = None) -> TriageResult:
+    """
+    Tags unprocessed emails the local classifier is confident about without calling the agent.
+
+    The classifier is first updated from newly processed emails. It only runs once it has seen
+    CLASSIFIER_MIN_EXAMPLES labeled emails (default 50) and needs NumPy.
+
+    Args:
+        threshold (float | None): Minimum confidence (default CLASSIFIER_THRESHOLD or 0.9).
+
+    Returns:
+        TriageResult: The emails tagged by the classifier.
+    """
+    if threshold is None:
+        threshold = float(os.getenv("CLASSIFIER_THRESHOLD", 0.9))
+    min_examples = int(os.getenv("CLASSIFIER_MIN_EXAMPLES", 50))
+    with SessionLocal() as session:
+        model = classifier.load_trained_model(session)
+        if model is None or model.n_examples < min_examples:
+            return TriageResult(emails=[], summary="")
+        pending = select(EmailORM).where(*pending_filter(lease_token)).execution_options(yield_per=classifier.BATCH_SIZE)
+        updates = []
+        for batch in session.scalars(pending).partitions():
+            predictions = model.predict([classifier.email_tokens(e.sender, e.subject, e.digest or e.body) for e in batch])
+            updates += [
+                EmailStatus(message_id=e.message_id, status=status, summary=f"Tagged by local classifier ({confidence:.2f}).")
+                for e, (status, confidence) in zip(batch, predictions)
+                if confidence >= threshold
+            ]
+    result = TriageResult(
+        emails=updates,
+        summary=f"{len(updates)} emails tagged by the local classifier." if updates else "",
+    )
+    mark_emails_processed(result, source="classifier", lease_token=lease_token)
+    return result
+
+
+@metrics.timed("cache_lookup")
+def apply_classification_cache(lease_token: str | None = None) -> tuple[TriageResult, cache.CacheStats]:
+    """
+    Tags unprocessed emails whose content fingerprint is in the classification cache.
+
+    Returns:
+        tuple[TriageResult, CacheStats]: The emails tagged from the cache and the hit/miss counts.
+    """
+    with SessionLocal() as session:
+        pending = session.query(EmailORM).filter(*pending_filter(lease_token)).all()
+        fingerprints = {e.message_id: cache.fingerprint(e.sender, e.subject, e.digest or e.body) for e in pending}
+        entries = cache.lookup(session, list(fingerprints.values()))
+        updates = [
+            EmailStatus(message_id=mid, status=entries[fp].status, summary=entries[fp].summary or "")
+            for mid, fp in fingerprints.items()
+            if fp in entries
+        ]
+    stats = cache.CacheStats(hits=len(updates), misses=len(fingerprints) - len(updates))
+    result = TriageResult(
+        emails=updates,
+        summary=f"{stats.hits} emails tagged from the classification cache ({stats.misses} misses)." if updates else "",
+    )
+    mark_emails_processed(result, source="cache", lease_token=lease_token)
+    return result, stats
+
+
+@metrics.timed("cache_fill")
+def fill_classification_cache(result: TriageResult):
+    """Remembers the agent's tags and summaries under each email's content fingerprint."""
+    with SessionLocal() as session:
+        ids = [upd.message_id for upd in result.emails]
+        emails = {e.message_id: e for e in session.query(EmailORM).filter(EmailORM.message_id.in_(ids))}
+        cache.store(session, {
+            cache.fingerprint(e.sender, e.subject, e.digest or e.body): (upd.status, upd.summary)
+            for upd in result.emails
+            if (e := emails.get(upd.message_id)) is not None
+        })
+
+
+async def run_agent(agent: Agent, input_data: str, **kwargs):
+    """
+    Runs an agent through the shared agent runner (concurrency and rate limits, retries) with
+    metrics hooks, recording its latency, outcome and token usage.
+    """
+    profile = metrics.current_profile.get()
+    if profile is not None:
+        profile.agent_runs += 1
+    with metrics.timed("agent"):
+        try:
+            run = await agent_runner.run(agent, input_data, hooks=metrics.MetricsHooks(), **kwargs)
+        except Exception:
+            metrics.AGENT_RUNS.inc(agent=agent.name, outcome="failed")
+            raise
+    metrics.AGENT_RUNS.inc(agent=agent.name, outcome="succeeded")
+    return run
+
+
+async def run_batched_triage(
+    batch_size: int, concurrency: int, max_tokens: int, by_thread: bool = False, lease_token: str | None = None
+) -> TriageResult:
+    """
+    Triage the unprocessed backlog in batches, running up to concurrency agent runs at once.
+
+    Batches that fail are logged and left unprocessed for the next run.
+    """
+    emails = (await asyncio.to_thread(get_unprocessed_emails, by_thread=by_thread, lease_token=lease_token)).emails
+    batches = chunk_emails(emails, batch_size, max_tokens)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def triage_batch(batch: list[Email]) -> TriageResult:
+        async with semaphore:
+            result = await run_agent(email_batch_triage_agent, EmailList(emails=batch).model_dump_json())
+            return result.final_output
+
+    results = await asyncio.gather(*(triage_batch(b) for b in batches), return_exceptions=True)
+
+    succeeded: list[TriageResult] = []
+    for batch, res in zip(batches, results):
+        if isinstance(res, BaseException):
+            print(f"Batch of {len(batch)} emails failed: {res}")
+            continue
+        succeeded.append(res)
+
+    merged = merge_results(succeeded)
+    print(f"Triaged {len(merged.emails)} of {len(emails)} emails in {len(batches)} batches")
+    return merged
+
+
+def triage_locally(lease_token: str) -> tuple[TriageResult, cache.CacheStats, bool]:
+    """
+    Runs the stages that need no agent: fast-path rules, the local classifier and the
+    classification cache, in that order, over the emails held under lease_token.
+
+    Returns:
+        tuple[TriageResult, CacheStats, bool]: The emails tagged, the cache statistics, and
+            whether emails are left for the agent.
+    """
+    ruled = apply_fast_path(lease_token)
+    # only runs the rules alone made unnecessary count as skipped by the fast path
+    skipped_by_rules = bool(ruled.emails) and not has_pending_emails(lease_token)
+    classified = apply_local_classifier(lease_token=lease_token)
+    cached, cache_stats = apply_classification_cache(lease_token)
+    pending = has_pending_emails(lease_token)
+    if not pending and skipped_by_rules:
+        rules.stats.agent_runs_skipped += 1
+    return merge_results([ruled, classified, cached]), cache_stats, pending
+
+
+def finish_triage(
+    fast: TriageResult, result: TriageResult, by_thread: bool, lease_token: str
+) -> tuple[TriageResult, ReportOutput]:
+    """
+    Caches and stores the agent's tags (expanded to whole threads in thread mode) and saves the
+    report of the run.
+
+    Returns:
+        tuple[TriageResult, ReportOutput]: The agent's tags as stored, and the saved report.
+    """
+    fill_classification_cache(result)
+    if by_thread:
+        result = expand_threads(result, lease_token)
+    mark_emails_processed(result, lease_token=lease_token)
+    return result, save_report(merge_results([fast, result]))
+
+
+async def run_email_triage_agent(
+    batch_size: int | None = None, concurrency: int | None = None, by_thread: bool | None = None
+):
     """
     Execute the email_triage_agent to generate and save the email triage report.
+
+    Emails matching a fast-path rule are tagged first, then emails the local classifier is
+    confident about, then emails found in the classification cache; only the rest are sent to
+    the agent, and its results are added to the cache.
+
+    The run first claims the unprocessed emails with a lease (see claim_emails), so several
+    workers can triage a shared database without processing the same email twice.
+
+    Database and CPU-bound stages run in worker threads, so a run started on the API's event
+    loop (POST /process) does not block other requests while it waits on them.
+
+    Args:
+        batch_size (int | None): Emails per agent run. When set (or TRIAGE_BATCH_SIZE is set),
+            the backlog is split into batches triaged concurrently and merged into one report.
+        concurrency (int | None): Maximum concurrent agent runs in batched mode
+            (default TRIAGE_CONCURRENCY or 4).
+        by_thread (bool | None): Send only the newest message of each thread to the agent and
+            apply its tag to the whole thread (default TRIAGE_BY_THREAD).
+
+    Returns:
+        ReportOutput: The path and status of the saved report.
     """
-    with trace("Running email_triage_agent"):
-        input_data = 'This is a placeholder input for the agent.'
-        result = await Runner.run(email_triage_agent, input_data)
-        print(f"Report saved: {result}")
-        return result
+    if batch_size is None and os.getenv("TRIAGE_BATCH_SIZE"):
+        batch_size = int(os.getenv("TRIAGE_BATCH_SIZE"))
+    if by_thread is None:
+        by_thread = os.getenv("TRIAGE_BY_THREAD", "False").lower() in ("1", "true", "yes")
+    profile = metrics.RunProfile(started_at=datetime.utcnow().isoformat())
+    with metrics.profiling(profile):
+        # worker threads inherit the context, so stage timings still reach the run profile
+        lease_token, claimed = await asyncio.to_thread(claim_emails)
+        try:
+            with trace("Running email_triage_agent"):
+                fast, cache_stats, pending = await asyncio.to_thread(triage_locally, lease_token)
+                if not pending:
+                    result = TriageResult(emails=[], summary="")
+                elif batch_size:
+                    concurrency = concurrency or int(os.getenv("TRIAGE_CONCURRENCY", 4))
+                    max_tokens = int(os.getenv("TRIAGE_BATCH_TOKENS", 20000))
+                    result = await run_batched_triage(batch_size, concurrency, max_tokens, by_thread, lease_token)
+                else:
+                    input_data = 'This is a placeholder input for the agent.'
+                    options = TriageOptions(by_thread=by_thread, lease_token=lease_token)
+                    run = await run_agent(email_triage_agent, input_data, context=options)
+                    result = run.final_output
+                result, output = await asyncio.to_thread(finish_triage, fast, result, by_thread, lease_token)
+        except Exception:
+            metrics.TRIAGE_RUNS.inc(outcome="failed")
+            raise
+        finally:
+            # emails left over (failed batches, emails the agent skipped) go back to the pool
+            await asyncio.to_thread(release_lease, lease_token)
+    profile.emails = len(fast.emails) + len(result.emails)
+    metrics.TRIAGE_RUNS.inc(outcome="succeeded")
+    metrics.TRIAGE_RUN_EMAILS.observe(profile.emails)
+    if os.getenv("TRIAGE_PROFILE", "False").lower() in ("1", "true", "yes"):
+        print(f"Run profile saved: {await asyncio.to_thread(save_profile, profile, output.path)}")
+    print(f"Report saved: {output.path} ({len(fast.emails)} emails tagged without the agent, {claimed} claimed)")
+    print(f"Classification cache: {cache_stats.hits} hits, {cache_stats.misses} misses")
+    return output
 
 
 if __name__ == "__main__":
-    asyncio.run(run_email_triage_agent())
\ No newline at end of file
+    asyncio.run(run_email_triage_agent())
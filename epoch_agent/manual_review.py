@@ -44,6 +44,7 @@ def review_loop():
             email.status = choice
             email.processed = True
             email.processed_at = datetime.utcnow().isoformat()
+            email.tagged_by = "manual"
             session.commit()
             print(f"Email {email.message_id} updated to status '{choice}'.\n")
     finally:
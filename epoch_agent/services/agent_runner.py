@@ -0,0 +1,285 @@
+"""
+Shared runner for agent runs: a concurrency governor with a priority queue, request and token
+rate limits, and retries with jittered exponential backoff.
+
+Every agent run in the process goes through one AgentRunner (see run), so parallel triage
+batches, the IMAP worker and any new agent share the provider's limits instead of each one
+running into 429 errors on its own:
+
+- At most AGENT_CONCURRENCY runs are in flight; waiting runs are admitted lowest priority value
+  first, in arrival order within a priority.
+- Each model call waits for a slot in the AGENT_RPM requests-per-minute bucket and for its
+  estimated tokens in the AGENT_TPM tokens-per-minute bucket; once the call returns, the bucket is
+  corrected with the real usage.
+- A run that fails with a transient error (rate limit, timeout, connection error, 5xx) is started
+  again after a jittered exponential delay, up to AGENT_MAX_RETRIES times. The whole run is
+  repeated, so tools must be safe to call again.
+
+A run holds its slot until it finishes, so an agent must not start nested runs through the same
+runner.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import openai
+from agents import RunHooks, Runner
+
+from epoch_agent.services import metrics
+
+# lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    Refills at per_minute units per minute up to capacity (default: one minute's worth).
+
+    Usable from any thread or event loop: callers reserve their amount up front and sleep until
+    the bucket has refilled enough, which serves them in arrival order.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes amount (the level may go negative) and returns the seconds to wait before using it."""
+        with self._lock:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float):
+        """Gives back (positive) or takes (negative) units once the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Waits until amount is available. Returns the seconds waited."""
+        wait = self.reserve(amount)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class PriorityGate:
+    """Admits at most limit holders at once; waiters are admitted lowest priority value first."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: list[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                *_, loop, future = heapq.heappop(self._waiters)
+                if future.done():
+                    continue
+                try:
+                    # waiters may be on other event loops (runs started with asyncio.run in worker threads)
+                    loop.call_soon_threadsafe(self._hand_over, future)
+                    return
+                except RuntimeError:
+                    continue  # that loop is closed
+            self.active -= 1
+
+    def _hand_over(self, future: asyncio.Future):
+        if future.done():
+            # cancelled while the slot was on its way; pass it on
+            self.release()
+        else:
+            future.set_result(None)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed run is worth repeating. An exhausted quota is reported as a 429 but is not transient."""
+    if isinstance(exc, openai.RateLimitError) and getattr(exc, "code", None) == "insufficient_quota":
+        return False
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """The delay the provider asked for in a Retry-After header, if any."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt, capped."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class GovernedHooks(RunHooks):
+    """Run hooks that apply the runner's rate limits to each model call, then call the inner hooks."""
+
+    def __init__(self, runner: "AgentRunner", inner: RunHooks | None = None):
+        self.runner = runner
+        self.inner = inner or RunHooks()
+        self._estimates: dict[str, int] = {}
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        waited = 0.0
+        if self.runner.requests is not None:
+            waited += await self.runner.requests.acquire(1)
+        if self.runner.tokens is not None:
+            # about four characters per token; corrected with the real usage in on_llm_end
+            estimate = (len(system_prompt or "") + len(json.dumps(input_items, default=str))) // 4
+            self._estimates[agent.name] = estimate
+            waited += await self.runner.tokens.acquire(estimate)
+        if waited:
+            metrics.AGENT_WAIT_SECONDS.observe(waited, reason="rate_limit")
+        await self.inner.on_llm_start(context, agent, system_prompt, input_items)
+
+    async def on_llm_end(self, context, agent, response):
+        estimate = self._estimates.pop(agent.name, None)
+        usage = getattr(response, "usage", None)
+        if estimate is not None and usage is not None:
+            self.runner.tokens.adjust(estimate - (usage.input_tokens or 0) - (usage.output_tokens or 0))
+        await self.inner.on_llm_end(context, agent, response)
+
+    async def on_agent_start(self, context, agent):
+        await self.inner.on_agent_start(context, agent)
+
+    async def on_agent_end(self, context, agent, output):
+        await self.inner.on_agent_end(context, agent, output)
+
+    async def on_handoff(self, context, from_agent, to_agent):
+        await self.inner.on_handoff(context, from_agent, to_agent)
+
+    async def on_tool_start(self, context, agent, tool):
+        await self.inner.on_tool_start(context, agent, tool)
+
+    async def on_tool_end(self, context, agent, tool, result):
+        await self.inner.on_tool_end(context, agent, tool, result)
+
+
+class AgentRunner:
+    """
+    Runs agents under a concurrency limit, request and token rate limits and a retry policy.
+
+    Args:
+        max_concurrency (int): Runs in flight at once.
+        requests_per_minute (float): Model calls per minute; 0 for no limit.
+        tokens_per_minute (float): Model tokens (input plus output) per minute; 0 for no limit.
+        max_retries (int): Times a run failing with a transient error is repeated.
+        backoff_base (float): Upper bound of the first retry delay in seconds; doubles per attempt.
+        backoff_max (float): Upper bound of any retry delay in seconds.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.gate = PriorityGate(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_env(cls) -> "AgentRunner":
+        return cls(
+            max_concurrency=int(os.getenv("AGENT_CONCURRENCY", 4)),
+            requests_per_minute=float(os.getenv("AGENT_RPM", 0)),
+            tokens_per_minute=float(os.getenv("AGENT_TPM", 0)),
+            max_retries=int(os.getenv("AGENT_MAX_RETRIES", 3)),
+            backoff_base=float(os.getenv("AGENT_BACKOFF_BASE", 1.0)),
+            backoff_max=float(os.getenv("AGENT_BACKOFF_MAX", 60.0)),
+        )
+
+    async def run(self, agent, input, *, priority: int = PRIORITY_NORMAL, hooks: RunHooks | None = None, **kwargs):
+        """
+        Runs agent with Runner.run once a slot is free, retrying transient failures.
+
+        Args:
+            priority (int): Queue position among waiting runs; lower runs first.
+            hooks (RunHooks | None): Hooks of the caller, called after the rate limits are applied.
+            **kwargs: Passed to Runner.run.
+
+        Returns:
+            RunResult: The result of the first successful attempt.
+        """
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            await self.gate.acquire(priority)
+            metrics.AGENT_WAIT_SECONDS.observe(time.perf_counter() - start, reason="slot")
+            try:
+                return await Runner.run(agent, input, hooks=GovernedHooks(self, hooks), **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                delay = max(retry_after(e) or 0.0, backoff(attempt, self.backoff_base, self.backoff_max))
+                metrics.AGENT_RETRIES.inc(agent=agent.name, error=type(e).__name__)
+                print(f"{agent.name} failed ({type(e).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            finally:
+                self.gate.release()
+            # wait without holding the slot
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_default: AgentRunner | None = None
+_default_lock = threading.Lock()
+
+
+def default_runner() -> AgentRunner:
+    """The process-wide runner, configured from the AGENT_* environment variables on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = AgentRunner.from_env()
+    return _default
+
+
+async def run(agent, input, *, priority: int = PRIORITY_NORMAL, **kwargs):
+    """Runs agent through the process-wide runner (see AgentRunner.run)."""
+    return await default_runner().run(agent, input, priority=priority, **kwargs)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Cold storage for old processed emails.
+
+archive_processed moves processed emails older than ARCHIVE_AFTER_DAYS, with their attachment
+rows, out of the hot database into a separate archive database (ARCHIVE_DB_FILE, default: the
+database file name with .archive before the extension) and then compacts the hot database with
+an incremental vacuum, so listings, triage queries, migrations and backups of the hot database
+only deal with recent and unprocessed mail.
+
+An archived email keeps the fields used to find it (subject, sender, dates, tag, thread) in
+plain columns and the rest of its row as zlib-compressed JSON. An FTS5 index in the archive
+database covers subject, sender and body text. Attachment bytes stay in the blob store, which
+both databases point into. The API reads archived emails on demand through get_email,
+list_attachments, get_attachment and search.
+"""
+import argparse
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, LargeBinary, String, func, select, text
+from sqlalchemy.orm import Session, declarative_base
+
+from epoch_agent.services import search as hot_search
+from epoch_agent.services import storage
+
+ArchiveBase = declarative_base()
+
+FTS_TABLE = "archived_emails_fts"
+_FTS_COLUMNS = "subject, sender, body, html_text"
+
+
+class ArchivedEmailORM(ArchiveBase):
+    __tablename__ = "archived_emails"
+
+    # also the rowid of the email in the FTS index
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(String, unique=True, nullable=False)
+    subject = Column(String)
+    sender = Column(String)
+    date = Column(String)
+    received_at = Column(String, index=True)
+    processed_at = Column(String)
+    status = Column(String, index=True)
+    thread_id = Column(String, index=True)
+    content_hash = Column(String, index=True)
+    archived_at = Column(String)
+    # zlib-compressed JSON of the complete emails row
+    data = Column(LargeBinary)
+
+
+class ArchivedAttachmentORM(ArchiveBase):
+    __tablename__ = "archived_attachments"
+
+    # the id the attachment had in the hot database, so download links keep working; the hot
+    # database never hands it out again (see reserve_attachment_ids)
+    id = Column(Integer, primary_key=True)
+    message_id = Column(String, index=True)
+    filename = Column(String)
+    content_type = Column(String)
+    data = Column(LargeBinary, nullable=True)
+    sha256 = Column(String, nullable=True)
+    size = Column(Integer, nullable=True)
+
+
+class ArchiveResult(BaseModel):
+    """What one archive run moved."""
+    emails: int = 0
+    attachments: int = 0
+    pages_freed: int = 0
+
+
+def archive_path() -> str:
+    if os.getenv("ARCHIVE_DB_FILE"):
+        return os.getenv("ARCHIVE_DB_FILE")
+    root, ext = os.path.splitext(storage.DB_FILE)
+    return f"{root}.archive{ext or '.db'}"
+
+
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def archive_engine(path: str | None = None):
+    """The engine of the archive database at path (default: archive_path()), created on first use."""
+    path = path or archive_path()
+    with _engines_lock:
+        if path not in _engines:
+            engine = storage.make_engine(path)
+            ArchiveBase.metadata.create_all(bind=engine)
+            with engine.begin() as conn:
+                if hot_search.fts5_available(conn):
+                    conn.exec_driver_sql(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_FTS_COLUMNS}, "
+                        "content='', tokenize='unicode61 remove_diacritics 2')"
+                    )
+            _engines[path] = engine
+    return _engines[path]
+
+
+def open_archive(path: str | None = None) -> Session:
+    return Session(bind=archive_engine(path))
+
+
+def _has_archive() -> bool:
+    # reads must not create an empty archive next to a database that was never archived
+    return os.path.exists(archive_path())
+
+
+def _has_fts(session) -> bool:
+    return bool(session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).scalar())
+
+
+def compress_row(email) -> bytes:
+    row = {column.key: getattr(email, column.key) for column in email.__table__.columns}
+    return zlib.compress(json.dumps(row).encode("utf-8"))
+
+
+def decompress_row(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data))
+
+
+def _archived_email(email, archived_at: str) -> ArchivedEmailORM:
+    return ArchivedEmailORM(
+        message_id=email.message_id,
+        subject=email.subject,
+        sender=email.sender,
+        date=email.date,
+        received_at=email.received_at,
+        processed_at=email.processed_at,
+        status=email.status,
+        thread_id=email.thread_id,
+        content_hash=email.content_hash,
+        archived_at=archived_at,
+        data=compress_row(email),
+    )
+
+
+def compact(engine) -> int:
+    """
+    Returns the free pages of a database to the file system with an incremental vacuum.
+
+    A database created before auto_vacuum was enabled (see storage) is converted with one full
+    VACUUM first.
+
+    Returns:
+        int: The number of pages freed.
+    """
+    raw = engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript steps each statement to completion; a plain execute of incremental_vacuum
+        # would free a single page
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+        else:
+            conn.executescript("PRAGMA incremental_vacuum;")
+        conn.executescript("PRAGMA wal_checkpoint(TRUNCATE);")
+    finally:
+        raw.close()
+    return free
+
+
+def reserve_attachment_ids(hot, up_to: int | None):
+    """
+    Makes sure the hot attachments table never assigns ids up to up_to again, also for ids
+    archived before the table used AUTOINCREMENT.
+    """
+    if not up_to:
+        return
+    seq = hot.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'attachments'")).scalar()
+    if seq is None:
+        hot.execute(text("INSERT INTO sqlite_sequence(name, seq) VALUES ('attachments', :id)"), {"id": up_to})
+    elif seq < up_to:
+        hot.execute(text("UPDATE sqlite_sequence SET seq = :id WHERE name = 'attachments'"), {"id": up_to})
+
+
+def archive_processed(days: float | None = None, batch_size: int = 500) -> ArchiveResult:
+    """
+    Moves processed emails older than days (default ARCHIVE_AFTER_DAYS or 90) and their
+    attachment rows to the archive database, batch by batch, then compacts the hot database.
+
+    Each batch is committed to the archive before it is deleted from the hot database, so an
+    interrupted run leaves emails in both databases (and the next run finishes moving them), never
+    in neither.
+    """
+    from epoch_agent.email_triage_agent import AttachmentORM, EmailORM, SessionLocal
+    if days is None:
+        days = float(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    result = ArchiveResult()
+    with SessionLocal() as hot, open_archive() as cold:
+        fts = _has_fts(cold)
+        reserve_attachment_ids(hot, cold.scalar(select(func.max(ArchivedAttachmentORM.id))))
+        hot.commit()
+        while True:
+            batch = (
+                hot.query(EmailORM)
+                .filter(EmailORM.processed.is_(True), func.coalesce(EmailORM.processed_at, EmailORM.received_at) < cutoff)
+                .order_by(EmailORM.received_at, EmailORM.message_id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            ids = [email.message_id for email in batch]
+            attachments = hot.query(AttachmentORM).filter(AttachmentORM.message_id.in_(ids)).all()
+            archived_at = datetime.utcnow().isoformat()
+
+            done = set(cold.scalars(select(ArchivedEmailORM.message_id).where(ArchivedEmailORM.message_id.in_(ids))))
+            new = [_archived_email(email, archived_at) for email in batch if email.message_id not in done]
+            cold.add_all(new)
+            cold.flush()
+            if fts and new:
+                bodies = {email.message_id: email for email in batch}
+                cold.execute(
+                    text(f"INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES (:id, :subject, :sender, :body, :html_text)"),
+                    [
+                        {
+                            "id": row.id, "subject": row.subject, "sender": row.sender,
+                            "body": bodies[row.message_id].body,
+                            "html_text": bodies[row.message_id].html_text,
+                        }
+                        for row in new
+                    ],
+                )
+            done_attachments = set(cold.scalars(
+                select(ArchivedAttachmentORM.id).where(ArchivedAttachmentORM.id.in_([att.id for att in attachments]))
+            ))
+            cold.add_all(
+                ArchivedAttachmentORM(
+                    id=att.id, message_id=att.message_id, filename=att.filename, content_type=att.content_type,
+                    data=att.data, sha256=att.sha256, size=att.size,
+                )
+                for att in attachments
+                if att.id not in done_attachments
+            )
+            cold.commit()
+
+            reserve_attachment_ids(hot, max((att.id for att in attachments), default=None))
+            # blobs keep their references: the archived attachment rows still point at them
+            hot.query(AttachmentORM).filter(AttachmentORM.message_id.in_(ids)).delete(synchronize_session=False)
+            hot.query(EmailORM).filter(EmailORM.message_id.in_(ids)).delete(synchronize_session=False)
+            hot.commit()
+            result.emails += len(batch)
+            result.attachments += len(attachments)
+        if result.emails:
+            result.pages_freed = compact(hot.get_bind())
+    return result
+
+
+def get_email(message_id: str) -> dict | None:
+    """The complete emails row of an archived email, or None."""
+    if not _has_archive():
+        return None
+    with open_archive() as cold:
+        row = cold.query(ArchivedEmailORM).filter_by(message_id=message_id).first()
+        return decompress_row(row.data) if row is not None else None
+
+
+def list_attachments(message_id: str) -> list[ArchivedAttachmentORM]:
+    if not _has_archive():
+        return []
+    with open_archive() as cold:
+        return cold.query(ArchivedAttachmentORM).filter_by(message_id=message_id).all()
+
+
+def get_attachment(attachment_id: int, message_id: str | None = None) -> ArchivedAttachmentORM | None:
+    """An archived attachment, or None; with message_id, only if it belongs to that email."""
+    if not _has_archive():
+        return None
+    with open_archive() as cold:
+        att = cold.get(ArchivedAttachmentORM, attachment_id)
+        if att is None or (message_id is not None and att.message_id != message_id):
+            return None
+        return att
+
+
+def search(query: str, status: str | None = None, limit: int = 20, offset: int = 0) -> list[hot_search.SearchHit]:
+    """Runs an FTS5 query over archived emails, ranked like search.search."""
+    if not _has_archive():
+        return []
+    filters, params = "", {"query": query, "limit": limit, "offset": offset}
+    if status is not None:
+        filters = " AND a.status = :status"
+        params["status"] = status
+    with open_archive() as cold:
+        rows = cold.execute(text(f"""
+            SELECT a.message_id, a.subject, a.sender, a.date, a.status,
+                   bm25({FTS_TABLE}, {', '.join(map(str, hot_search.WEIGHTS))}) AS rank
+            FROM {FTS_TABLE} JOIN archived_emails a ON a.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :query{filters}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """), params)
+        return [hot_search.SearchHit(**row._mapping, processed=True) for row in rows]
+
+
+def restore(message_id: str) -> bool:
+    """
+    Moves an archived email and its attachment rows back into the hot database, e.g. to retag it.
+
+    Returns:
+        bool: False when the email is not in the archive.
+    """
+    from epoch_agent.email_triage_agent import AttachmentORM, EmailORM, SessionLocal
+    if not _has_archive():
+        return False
+    with SessionLocal() as hot, open_archive() as cold:
+        row = cold.query(ArchivedEmailORM).filter_by(message_id=message_id).first()
+        if row is None:
+            return False
+        email = decompress_row(row.data)
+        if "html_text" not in email:
+            # archived before the HTML text was stored; indexed from html_body at the time
+            email["html_text"] = hot_search.html_text(email["html_body"])
+        if hot.get(EmailORM, message_id) is None:
+            hot.add(EmailORM(**email))
+        restored = []
+        for att in cold.query(ArchivedAttachmentORM).filter_by(message_id=message_id).all():
+            existing = hot.get(AttachmentORM, att.id)
+            if existing is not None and existing.message_id == message_id:
+                # put back by an earlier, interrupted restore
+                restored.append(att)
+                continue
+            hot.add(AttachmentORM(
+                # an id reused while the attachment was archived (before ids were reserved) gets a new one
+                id=att.id if existing is None else None,
+                message_id=att.message_id, filename=att.filename, content_type=att.content_type,
+                data=att.data, sha256=att.sha256, size=att.size,
+            ))
+            restored.append(att)
+        hot.commit()
+        if _has_fts(cold):
+            cold.execute(
+                text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_FTS_COLUMNS}) "
+                     "VALUES ('delete', :id, :subject, :sender, :body, :html_text)"),
+                {
+                    "id": row.id, "subject": row.subject, "sender": row.sender, "body": email["body"],
+                    "html_text": email["html_text"],
+                },
+            )
+        # only archive rows now present in the hot database are removed
+        for att in restored:
+            cold.delete(att)
+        cold.delete(row)
+        cold.commit()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old processed emails to the archive database.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="archive processed emails older than --days and compact the database")
+    run.add_argument("--days", type=float, default=None, help="default: ARCHIVE_AFTER_DAYS or 90")
+    restore_cmd = sub.add_parser("restore", help="move an archived email back into the database")
+    restore_cmd.add_argument("message_id")
+    args = parser.parse_args()
+    if args.command == "run":
+        result = archive_processed(args.days)
+        print(f"Archived {result.emails} emails and {result.attachments} attachments to {archive_path()}; "
+              f"freed {result.pages_freed} pages.")
+    elif restore(args.message_id):
+        print(f"Restored {args.message_id}.")
+    else:
+        print(f"{args.message_id} is not archived.")
+
+
+if __name__ == "__main__":
+    main()
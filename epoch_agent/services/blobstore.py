@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Content-addressed attachment store.
+
+Attachment bytes live in BLOB_DIR (default: attachments) as files named by their sha256, fanned
+out as ab/cd/<sha256>. The database keeps only the hash, size and a reference count, so a PDF
+forwarded ten times is stored once and the SQLite file stays small.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+# files younger than this may belong to a transaction that has not committed yet
+ORPHAN_MIN_AGE = 3600
+
+
+def blob_dir() -> str:
+    return os.getenv("BLOB_DIR", "attachments")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(blob_dir(), sha256[:2], sha256[2:4], sha256)
+
+
+def put(data: bytes) -> tuple[str, int]:
+    """
+    Writes data to the store unless an identical blob is already there.
+
+    Returns:
+        tuple[str, int]: The sha256 hex digest and size.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        # a fresh mtime keeps gc from sweeping a file that is about to be referenced again
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file and rename so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+    return sha256, len(data)
+
+
+def add_ref(session, sha256: str, size: int):
+    """Records one more attachment row pointing at a blob."""
+    from epoch_agent.email_triage_agent import BlobORM
+    blob = session.get(BlobORM, sha256)
+    if blob is None:
+        session.add(BlobORM(sha256=sha256, size=size, refcount=1))
+        # make the new row visible to later lookups in the same unit of work
+        session.flush()
+    else:
+        blob.refcount += 1
+
+
+def release(session, sha256: str):
+    """Drops one reference to a blob; the file is removed by gc once nothing points at it."""
+    from epoch_agent.email_triage_agent import BlobORM
+    blob = session.get(BlobORM, sha256)
+    if blob is not None:
+        blob.refcount = max(blob.refcount - 1, 0)
+
+
+def store_attachment(session, data: bytes) -> tuple[str, int]:
+    """Writes an attachment's bytes to the store and takes a reference on the blob."""
+    sha256, size = put(data)
+    add_ref(session, sha256, size)
+    return sha256, size
+
+
+def gc(session, min_age: float = ORPHAN_MIN_AGE) -> int:
+    """
+    Deletes unreferenced blobs and their files, then orphaned files: blob files with no row,
+    left behind when the transaction that wrote them rolled back, and interrupted temp files.
+    Files modified in the last min_age seconds are left alone.
+
+    Returns:
+        int: The number of blobs and orphaned files removed.
+    """
+    from epoch_agent.email_triage_agent import BlobORM
+    removed = 0
+    for blob in session.query(BlobORM).filter(BlobORM.refcount <= 0).all():
+        path = blob_path(blob.sha256)
+        if os.path.exists(path):
+            os.unlink(path)
+        session.delete(blob)
+        removed += 1
+    session.commit()
+    return removed + sweep_orphans(session, min_age)
+
+
+def sweep_orphans(session, min_age: float = ORPHAN_MIN_AGE, batch_size: int = 500) -> int:
+    """Deletes files in BLOB_DIR older than min_age seconds that no blobs row points at."""
+    from epoch_agent.email_triage_agent import BlobORM
+    cutoff = time.time() - min_age
+    candidates: dict[str, str] = {}
+    removed = 0
+
+    def flush():
+        nonlocal removed
+        known = {sha for (sha,) in session.query(BlobORM.sha256).filter(BlobORM.sha256.in_(list(candidates)))}
+        for sha256, path in candidates.items():
+            if sha256 not in known:
+                os.unlink(path)
+                removed += 1
+        candidates.clear()
+
+    for root, _, files in os.walk(blob_dir()):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if name.startswith(".tmp-"):
+                os.unlink(path)
+                removed += 1
+                continue
+            candidates[name] = path
+            if len(candidates) >= batch_size:
+                flush()
+    if candidates:
+        flush()
+    return removed
+
+
+def migrate_attachments(session, batch_size: int = 100) -> int:
+    """
+    Moves attachment bytes still stored in the database into the blob store.
+
+    Returns:
+        int: The number of attachments moved.
+    """
+    from epoch_agent.email_triage_agent import AttachmentORM
+    moved = 0
+    while True:
+        batch = session.query(AttachmentORM).filter(AttachmentORM.data.isnot(None)).limit(batch_size).all()
+        if not batch:
+            return moved
+        for att in batch:
+            att.sha256, att.size = store_attachment(session, att.data)
+            att.data = None
+        session.commit()
+        moved += len(batch)
+
+
+def main():
+    from sqlalchemy import text
+    from epoch_agent.email_triage_agent import SessionLocal
+    parser = argparse.ArgumentParser(description="Manage the content-addressed attachment store.")
+    parser.add_argument("command", choices=["migrate", "gc"],
+                        help="migrate: move attachment bytes out of the database; "
+                             "gc: delete unreferenced blobs and orphaned files")
+    args = parser.parse_args()
+    with SessionLocal() as session:
+        if args.command == "migrate":
+            moved = migrate_attachments(session)
+            print(f"Moved {moved} attachments to {blob_dir()}.")
+            if moved:
+                # reclaim the space the attachment bytes used in the database file
+                with session.get_bind().connect() as conn:
+                    conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+                print("Database vacuumed.")
+        else:
+            print(f"Removed {gc(session)} unreferenced blobs and orphaned files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Persistent classification cache keyed by a normalized content fingerprint.
+
+Automated senders produce near-identical emails; the cache maps the fingerprint of an email
+(sender address plus a hash of its cleaned subject and body) to the tag and summary the agent
+produced, so repeats are tagged without another model call.
+"""
+import hashlib
+import os
+import re
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+
+from pydantic import BaseModel
+
+# tags that are not worth remembering
+UNCACHED_TAGS = {"2 - Review"}
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_URL = re.compile(r"https?://\S+")
+_DIGITS = re.compile(r"\d+")
+_SPACE = re.compile(r"\s+")
+
+
+class CacheStats(BaseModel):
+    """Cache hits and misses for one triage run."""
+    hits: int = 0
+    misses: int = 0
+
+
+def _clean(text: str | None) -> str:
+    # order numbers, dates and tracking links differ between otherwise identical emails
+    text = _URL.sub(" ", (text or "").lower())
+    text = _DIGITS.sub("#", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def fingerprint(sender: str | None, subject: str | None, body: str | None) -> str:
+    """Computes the normalized content fingerprint of an email."""
+    address = parseaddr(sender or "")[1].lower()
+    subject = _clean(_REPLY_PREFIX.sub("", subject or ""))
+    body_hash = hashlib.sha256(_clean(body).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{address}\n{subject}\n{body_hash}".encode("utf-8")).hexdigest()
+
+
+def _ttl() -> timedelta:
+    return timedelta(days=float(os.getenv("CACHE_TTL_DAYS", 30)))
+
+
+def lookup(session, fingerprints: list[str]) -> dict:
+    """
+    Finds unexpired cache entries and refreshes their last-used time.
+
+    Returns:
+        dict: Cache entries by fingerprint.
+    """
+    from epoch_agent.email_triage_agent import ClassificationCacheORM
+    if not fingerprints:
+        return {}
+    now = datetime.utcnow()
+    cutoff = (now - _ttl()).isoformat()
+    entries = (
+        session.query(ClassificationCacheORM)
+        .filter(
+            ClassificationCacheORM.fingerprint.in_(set(fingerprints)),
+            ClassificationCacheORM.created_at >= cutoff,
+        )
+        .all()
+    )
+    for entry in entries:
+        entry.last_used_at = now.isoformat()
+        entry.hits = (entry.hits or 0) + 1
+    session.commit()
+    return {entry.fingerprint: entry for entry in entries}
+
+
+def store(session, entries: dict[str, tuple[str, str]]):
+    """
+    Stores or refreshes cache entries and evicts expired and least recently used ones.
+
+    Args:
+        entries (dict[str, tuple[str, str]]): (status, summary) by fingerprint.
+    """
+    from epoch_agent.email_triage_agent import ClassificationCacheORM
+    now = datetime.utcnow().isoformat()
+    for fp, (status, summary) in entries.items():
+        if status in UNCACHED_TAGS:
+            continue
+        session.merge(ClassificationCacheORM(
+            fingerprint=fp, status=status, summary=summary, created_at=now, last_used_at=now, hits=0,
+        ))
+    session.commit()
+    evict(session)
+
+
+def evict(session) -> int:
+    """
+    Deletes expired entries, then the least recently used ones above CACHE_MAX_ENTRIES.
+
+    Returns:
+        int: The number of entries removed.
+    """
+    from epoch_agent.email_triage_agent import ClassificationCacheORM
+    cutoff = (datetime.utcnow() - _ttl()).isoformat()
+    removed = session.query(ClassificationCacheORM).filter(ClassificationCacheORM.created_at < cutoff).delete()
+    max_entries = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+    excess = session.query(ClassificationCacheORM).count() - max_entries
+    if excess > 0:
+        oldest = (
+            session.query(ClassificationCacheORM.fingerprint)
+            .order_by(ClassificationCacheORM.last_used_at)
+            .limit(excess)
+            .subquery()
+        )
+        removed += (
+            session.query(ClassificationCacheORM)
+            .filter(ClassificationCacheORM.fingerprint.in_(oldest.select()))
+            .delete(synchronize_session=False)
+        )
+    session.commit()
+    return removed
+
+
+if __name__ == "__main__":
+    from epoch_agent.email_triage_agent import SessionLocal
+    with SessionLocal() as session:
+        print(f"Evicted {evict(session)} cache entries.")
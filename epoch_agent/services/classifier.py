@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Local nearest-centroid classifier trained on the emails.status history.
+
+Emails are embedded as hashed TF-IDF vectors and scored against one centroid per tag. The model
+is updated incrementally from emails processed since the last training run (including manual
+review decisions) and saved to CLASSIFIER_PATH, so it runs fully offline.
+"""
+import os
+import re
+import tempfile
+import zlib
+from email.utils import parseaddr
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIM = 2 ** 14
+# rows read from the database and scored per step; bounds memory on large mailboxes
+BATCH_SIZE = 256
+# tags the classifier never learns or predicts
+EXCLUDED_TAGS = {"2 - Review"}
+# emails tagged by the classifier itself are not used for training
+EXCLUDED_SOURCES = {"classifier"}
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9'._-]{1,30}")
+
+
+def email_tokens(sender: str | None, subject: str | None, body: str | None) -> list[str]:
+    """Tokenizes an email into sender, subject and body features."""
+    address = parseaddr(sender or "")[1].lower()
+    tokens = [f"from:{address}", f"domain:{address.rpartition('@')[2]}"]
+    tokens += [f"subj:{t}" for t in _TOKEN.findall((subject or "").lower())]
+    tokens += _TOKEN.findall((body or "").lower())
+    return tokens
+
+
+def hash_features(tokens: list[str]):
+    """
+    Hashes tokens into a sparse log-scaled term-frequency vector of length DIM.
+
+    Returns:
+        tuple: The distinct hashed indices and their log1p term counts.
+    """
+    idx = np.fromiter((zlib.crc32(t.encode("utf-8")) % DIM for t in tokens), dtype=np.int64, count=len(tokens))
+    idx, counts = np.unique(idx, return_counts=True)
+    return idx, np.log1p(counts).astype(np.float32)
+
+
+class CentroidClassifier:
+    """Nearest-centroid classifier over hashed TF-IDF features."""
+
+    def __init__(self):
+        self.labels: list[str] = []
+        self.sums = np.zeros((0, DIM), dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.doc_freq = np.zeros(DIM, dtype=np.float32)
+        self.n_docs = 0
+        self.trained_until = ""
+
+    @property
+    def n_examples(self) -> int:
+        return int(self.counts.sum())
+
+    def _idf(self):
+        return np.log((1.0 + self.n_docs) / (1.0 + self.doc_freq)) + 1.0
+
+    def partial_fit(self, rows: list[tuple[list[str], str]]):
+        """Adds (tokens, label) examples to the model, one sparse row at a time."""
+        for label in dict.fromkeys(label for _, label in rows):
+            if label not in self.labels:
+                self.labels.append(label)
+                self.sums = np.vstack([self.sums, np.zeros((1, DIM), dtype=np.float32)])
+                self.counts = np.append(self.counts, 0)
+        for tokens, label in rows:
+            idx, tf = hash_features(tokens)
+            row = self.labels.index(label)
+            self.doc_freq[idx] += 1
+            self.sums[row, idx] += tf
+            self.counts[row] += 1
+        self.n_docs += len(rows)
+
+    def predict(self, docs: list[list[str]], temperature: float = 0.1) -> list[tuple[str, float]]:
+        """
+        Scores documents against each tag centroid.
+
+        Returns:
+            list[tuple[str, float]]: The best tag and its softmax confidence for each document.
+        """
+        if not docs or len(self.labels) < 2:
+            return []
+        idf = self._idf()
+        centroids = self.sums / np.maximum(self.counts, 1)[:, None] * idf
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-9
+        results = []
+        for tokens in docs:
+            idx, tf = hash_features(tokens)
+            x = tf * idf[idx]
+            sims = centroids[:, idx] @ (x / (np.linalg.norm(x) + 1e-9))
+            z = np.exp((sims - sims.max()) / temperature)
+            probs = z / z.sum()
+            best = int(probs.argmax())
+            results.append((self.labels[best], float(probs[best])))
+        return results
+
+    def save(self, path: str):
+        """Writes the model to exactly path (no .npz suffix is added), atomically."""
+        # write to a temp file and rename so parallel workers never load a partial model
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    labels=np.array(self.labels, dtype=str),
+                    sums=self.sums,
+                    counts=self.counts,
+                    doc_freq=self.doc_freq,
+                    n_docs=np.array(self.n_docs),
+                    trained_until=np.array(self.trained_until, dtype=str),
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> "CentroidClassifier":
+        model = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                model.labels = [str(label) for label in data["labels"]]
+                model.sums = data["sums"].reshape(len(model.labels), DIM)
+                model.counts = data["counts"]
+                model.doc_freq = data["doc_freq"]
+                model.n_docs = int(data["n_docs"])
+                model.trained_until = str(data["trained_until"])
+        return model
+
+
+def model_path() -> str:
+    return os.getenv("CLASSIFIER_PATH", "classifier.npz")
+
+
+def update_model(session, model: "CentroidClassifier") -> int:
+    """
+    Trains the model on emails processed since it was last updated.
+
+    Returns:
+        int: The number of new examples.
+    """
+    from epoch_agent.email_triage_agent import EmailORM
+    query = session.query(EmailORM).filter(
+        EmailORM.processed == True,
+        EmailORM.status.isnot(None),
+        EmailORM.status.notin_(EXCLUDED_TAGS),
+        (EmailORM.tagged_by.is_(None)) | (EmailORM.tagged_by.notin_(EXCLUDED_SOURCES)),
+        EmailORM.processed_at > model.trained_until,
+    ).order_by(EmailORM.processed_at)
+    added = 0
+    rows = []
+    for e in query.yield_per(BATCH_SIZE):
+        rows.append((email_tokens(e.sender, e.subject, e.digest or e.body), e.status))
+        model.trained_until = e.processed_at
+        if len(rows) == BATCH_SIZE:
+            model.partial_fit(rows)
+            added += len(rows)
+            rows = []
+    model.partial_fit(rows)
+    return added + len(rows)
+
+
+def load_trained_model(session) -> "CentroidClassifier | None":
+    """Loads the saved model, trains it on new history and saves it. Returns None without NumPy."""
+    if np is None:
+        return None
+    path = model_path()
+    model = CentroidClassifier.load(path)
+    if update_model(session, model):
+        model.save(path)
+    return model
+
+
+if __name__ == "__main__":
+    from epoch_agent.email_triage_agent import SessionLocal
+    if np is None:
+        print("numpy is required. Install with 'pip install numpy'.")
+    else:
+        with SessionLocal() as session:
+            model = load_trained_model(session)
+        print(f"Classifier trained on {model.n_examples} emails across {len(model.labels)} tags.")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Content-hash deduplication of stored emails.
+
+The same message can reach the database through the Cloudflare Worker (POST /email) and through
+the IMAP fetcher, with different Message-IDs (the fetcher makes one up from the UID when the
+header is missing). Both ingest paths store a normalized content hash (sender address, subject,
+sending time and body text) in emails.content_hash, which has a unique index, so the second copy
+is rejected by the insert itself instead of being triaged twice. Unlike the classification cache
+fingerprint, numbers and links are kept: two receipts that differ only in the amount are
+different emails.
+
+backfill hashes emails stored before the column existed and collapses the duplicates among them.
+"""
+import argparse
+import hashlib
+import re
+from datetime import datetime, timezone
+from email.utils import parseaddr, parsedate_to_datetime
+
+from pydantic import BaseModel
+
+from epoch_agent.services import blobstore
+from epoch_agent.services.digest import html_to_text, looks_like_html
+
+_SPACE = re.compile(r"\s+")
+
+
+class BackfillResult(BaseModel):
+    """What backfill did."""
+    hashed: int = 0
+    collapsed: int = 0
+
+
+def _normalized_date(date: str | None) -> str:
+    # the Worker and the IMAP header may format the same instant differently
+    date = (date or "").strip()
+    try:
+        parsed = parsedate_to_datetime(date)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.fromisoformat(date)
+        except ValueError:
+            return date
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def normalized_text(body: str | None, html_body: str | None = None) -> str:
+    """The body as whitespace-collapsed text, from the HTML part when there is no plain text."""
+    text = body or ""
+    if not text.strip() and html_body:
+        text = html_to_text(html_body)
+    elif looks_like_html(text):
+        text = html_to_text(text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def content_hash(
+    sender: str | None, subject: str | None, date: str | None, body: str | None, html_body: str | None = None
+) -> str:
+    """Computes the normalized content hash that identifies copies of the same email."""
+    address = parseaddr(sender or "")[1].lower() or (sender or "").strip().lower()
+    subject = _SPACE.sub(" ", subject or "").strip().casefold()
+    body_hash = hashlib.sha256(normalized_text(body, html_body).encode("utf-8")).hexdigest()
+    key = f"{address}\n{subject}\n{_normalized_date(date)}\n{body_hash}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def find_existing(session, hashes: list[str]) -> dict[str, str]:
+    """
+    Looks up stored emails by content hash in one indexed query.
+
+    Returns:
+        dict: Message IDs of the stored copies by content hash.
+    """
+    from epoch_agent.email_triage_agent import EmailORM
+    if not hashes:
+        return {}
+    rows = session.query(EmailORM.content_hash, EmailORM.message_id).filter(
+        EmailORM.content_hash.in_(set(hashes))
+    )
+    return dict(rows.all())
+
+
+def collapse(session, keeper, duplicate):
+    """
+    Merges duplicate into keeper and deletes it.
+
+    keeper gains the duplicate's HTML body and attachments when it has none of its own, and its
+    triage outcome when only the duplicate was processed.
+    """
+    from epoch_agent.email_triage_agent import AttachmentORM
+    if keeper.html_body is None and duplicate.html_body is not None:
+        keeper.html_body = duplicate.html_body
+    if not keeper.processed and duplicate.processed:
+        keeper.processed = True
+        keeper.processed_at = duplicate.processed_at
+        keeper.status = duplicate.status
+        keeper.tagged_by = duplicate.tagged_by
+    keeper_has_attachments = session.query(AttachmentORM.id).filter_by(message_id=keeper.message_id).first()
+    for att in session.query(AttachmentORM).filter_by(message_id=duplicate.message_id).all():
+        if keeper_has_attachments:
+            if att.sha256:
+                blobstore.release(session, att.sha256)
+            session.delete(att)
+        else:
+            att.message_id = keeper.message_id
+    session.delete(duplicate)
+
+
+def backfill(session, batch_size: int = 500) -> BackfillResult:
+    """
+    Hashes emails stored without a content hash, oldest first, and collapses each one whose hash
+    is already taken into the email that holds it (see collapse). Commits after every batch.
+    """
+    from epoch_agent.email_triage_agent import EmailORM
+    result = BackfillResult()
+    while True:
+        batch = (
+            session.query(EmailORM)
+            .filter(EmailORM.content_hash.is_(None))
+            .order_by(EmailORM.received_at, EmailORM.message_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return result
+        hashes = {
+            email.message_id: content_hash(email.sender, email.subject, email.date, email.body, email.html_body)
+            for email in batch
+        }
+        keepers = {h: session.get(EmailORM, mid) for h, mid in find_existing(session, list(hashes.values())).items()}
+        for email in batch:
+            keeper = keepers.get(hashes[email.message_id])
+            if keeper is None:
+                email.content_hash = hashes[email.message_id]
+                keepers[email.content_hash] = email
+                result.hashed += 1
+            else:
+                collapse(session, keeper, email)
+                result.collapsed += 1
+        session.commit()
+
+
+def main():
+    from epoch_agent.email_triage_agent import SessionLocal
+    parser = argparse.ArgumentParser(description="Deduplicate stored emails by content hash.")
+    parser.add_argument("command", choices=["backfill"],
+                        help="backfill: hash emails stored before deduplication and collapse duplicates")
+    args = parser.parse_args()
+    with SessionLocal() as session:
+        result = backfill(session)
+    print(f"Hashed {result.hashed} emails, collapsed {result.collapsed} duplicates.")
+
+
+if __name__ == "__main__":
+    main()
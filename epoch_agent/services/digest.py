@@ -0,0 +1,155 @@
+"""
+Ingest-time digests: compact plain-text versions of email bodies for the triage agent.
+"""
+import os
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+# rough conversion used to turn a token budget into a character budget
+CHARS_PER_TOKEN = 4
+
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+_QUOTE_HEADERS = [
+    re.compile(r"^On .+ wrote:\s*$"),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+]
+# "From: ..." starts a quoted reply only as the first line of a header block (Outlook style)
+_QUOTE_FROM = re.compile(r"^From: .+$")
+_HEADER_FIELD = re.compile(r"^(Sent|Date|To|Cc|Subject): ", re.IGNORECASE)
+# forwarded messages are content to triage, not history: their header block and body are kept
+_FORWARD_HEADER = re.compile(r"^(-{2,}\s*Forwarded message\s*-{2,}|Begin forwarded message:)", re.IGNORECASE)
+_SIGNATURE_MARKERS = [
+    re.compile(r"^--\s*$"),
+    re.compile(r"^Sent from my \w+", re.IGNORECASE),
+    re.compile(r"^Get Outlook for ", re.IGNORECASE),
+    re.compile(r"^(CONFIDENTIALITY|DISCLAIMER|This (e-?mail|message) (and any attachments )?(is|may be) confidential)",
+               re.IGNORECASE),
+]
+# the Worker posts the markup as body for HTML-only mail
+_MARKUP = re.compile(r"^\s*<(!doctype|html|head|body|div|table|p)\b", re.IGNORECASE)
+_URL = re.compile(r"https?://[^\s<>\"')\]]+")
+_INVISIBLE = re.compile(r"[\u200b\u200c\u200d\u2060\ufeff\u034f\u00ad]")
+
+
+class _HTMLText(HTMLParser):
+    """Collects visible text from an HTML document."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Converts an HTML body to plain text, dropping scripts, styles and markup."""
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    return unescape("".join(parser.parts))
+
+
+def _is_quote_header(lines: list[str], i: int) -> bool:
+    stripped = lines[i].strip()
+    if any(p.match(stripped) for p in _QUOTE_HEADERS):
+        return True
+    return bool(_QUOTE_FROM.match(stripped)) and i + 1 < len(lines) and bool(_HEADER_FIELD.match(lines[i + 1].strip()))
+
+
+def looks_like_html(text: str | None) -> bool:
+    """Whether a body is HTML markup rather than plain text."""
+    return bool(text and _MARKUP.match(text))
+
+
+def strip_quoted(text: str) -> str:
+    """
+    Removes quoted reply chains: '>' lines and everything after a reply header. Forwarded
+    messages, including their header block, are kept.
+    """
+    lines = text.splitlines()
+    kept = []
+    in_forward_headers = False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if _FORWARD_HEADER.match(stripped):
+            in_forward_headers = True
+        elif in_forward_headers:
+            in_forward_headers = bool(stripped)
+        elif kept and _is_quote_header(lines, i):
+            break
+        elif stripped.startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(text: str) -> str:
+    """Cuts the text at the first signature delimiter, mobile footer or legal disclaimer."""
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if i and any(p.match(line.strip()) for p in _SIGNATURE_MARKERS):
+            return "\n".join(lines[:i])
+    return text
+
+
+def _shorten_url(match: re.Match) -> str:
+    # tracking links carry long query strings; the host and path are enough context
+    return match.group(0).split("?", 1)[0]
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Truncates text to roughly max_tokens tokens, preferring a word boundary."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    if " " in cut[limit // 2:]:
+        cut = cut[:cut.rfind(" ")]
+    return cut + " [...]"
+
+
+def build_digest(body: str | None, html_body: str | None = None, max_tokens: int | None = None) -> str:
+    """
+    Builds a compact digest of an email body for triage.
+
+    Args:
+        body (str | None): The text/plain body.
+        html_body (str | None): The text/html body, used when there is no plain text. A body
+            that is itself markup is converted too.
+        max_tokens (int | None): Token budget (default DIGEST_MAX_TOKENS or 500).
+
+    Returns:
+        str: The cleaned and truncated digest.
+    """
+    if max_tokens is None:
+        max_tokens = int(os.getenv("DIGEST_MAX_TOKENS", 500))
+    text = body or ""
+    if not text.strip() and html_body:
+        text = html_to_text(html_body)
+    elif looks_like_html(text):
+        text = html_to_text(text)
+    text = _INVISIBLE.sub("", text.replace("\r\n", "\n"))
+    text = strip_signature(strip_quoted(text))
+    text = _URL.sub(_shorten_url, text)
+    lines = [re.sub(r"[ \t\xa0]+", " ", line).strip() for line in text.splitlines()]
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    return truncate_tokens(text, max_tokens)
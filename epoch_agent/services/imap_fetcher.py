@@ -1,10 +1,32 @@
 #!/usr/bin/env python3
 """
-IMAP fetcher to pull unseen messages into the triage database.
+IMAP fetcher to pull new messages into the triage database.
+
+Each account and folder keeps its UIDVALIDITY and the highest UID seen in imap_sync_state, so a
+poll only downloads messages that arrived since the previous one, whether or not they were read.
+New UIDs are fetched in chunks of IMAP_FETCH_CHUNK messages: BODYSTRUCTURE and headers first,
+then only the text parts and the attachments under IMAP_ATTACHMENT_MAX_SIZE, and each chunk is
+committed before the next one is downloaded.
 """
+import argparse
+import asyncio
+import json
+import multiprocessing
 import os
 import email
+import email.message
+import quopri
+import random
+import threading
+import time
+from base64 import b64decode
+from binascii import Error as BinasciiError
 from datetime import datetime, timedelta
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+from urllib.parse import unquote
+
+from pydantic import BaseModel
 
 try:
     from imapclient import IMAPClient
@@ -12,92 +34,702 @@ except ImportError:
     IMAPClient = None
 from email.header import decode_header, make_header
 
+from epoch_agent.services import blobstore, dedup, metrics
+from epoch_agent.services.digest import build_digest
+from epoch_agent.services.threads import thread_id_for
+from epoch_agent.services.writer import BatchWriter
+
 ## avoid circular import warning; defer ORM imports until function execution
 
 
-def fetch_emails():
+def sync_key(host: str, user: str) -> str:
+    """Identifies an account in the sync-state table."""
+    return f"{user}@{host}"
+
+
+def select_new_uids(client, session, account: str, folder: str, since_days: int):
     """
-    Connect to the IMAP server, fetch unseen emails, and store them in the database.
+    Selects the folder and finds the UIDs to download since the last sync.
+
+    A full resync over the last since_days days is done on the first run and whenever the
+    folder's UIDVALIDITY changes; otherwise only UIDs above the highest one seen are searched.
+
+    Returns:
+        tuple: The sync-state row and the new UIDs.
     """
-    # import ORM types here to avoid import-cycle warnings
-    from epoch_agent.email_triage_agent import EmailORM, AttachmentORM, SessionLocal
-    if IMAPClient is None:
-        print("imapclient library is required. Install with 'pip install imapclient'.")
-        return
+    from epoch_agent.email_triage_agent import ImapSyncStateORM
+    # Open mailbox readonly so messages are not marked or deleted
+    info = client.select_folder(folder, readonly=True)
+    uidvalidity = int(info[b"UIDVALIDITY"])
+    state = session.get(ImapSyncStateORM, (account, folder))
+    if state is None:
+        state = ImapSyncStateORM(account=account, folder=folder, uidvalidity=uidvalidity, last_uid=0)
+        session.add(state)
+    if state.uidvalidity != uidvalidity or not state.last_uid:
+        if state.last_uid:
+            print(f"UIDVALIDITY changed for {folder}; resyncing the last {since_days} days.")
+        state.uidvalidity = uidvalidity
+        state.last_uid = 0
+        state.updated_at = datetime.utcnow().isoformat()
+        session.commit()
+        since = (datetime.utcnow() - timedelta(days=since_days)).date()
+        uids = client.search(["SINCE", since])
+        if not uids and b"UIDNEXT" in info:
+            # nothing in the window: start incremental sync from the current end of the folder
+            state.last_uid = int(info[b"UIDNEXT"]) - 1
+            session.commit()
+    else:
+        # "N:*" always matches the newest message, even when its UID is below N
+        uids = [uid for uid in client.search(["UID", f"{state.last_uid + 1}:*"]) if uid > state.last_uid]
+    return state, sorted(uids)
+
+
+class AttachmentRecord(BaseModel):
+    """An attachment extracted from a fetched message."""
+    filename: str | None
+    content_type: str
+    data: bytes
+
+
+class MessageRecord(BaseModel):
+    """A fetched message reduced to the fields stored in the database."""
+    uid: int
+    message_id: str
+    subject: str
+    sender: str
+    date: str
+    list_id: str | None = None
+    in_reply_to: str | None = None
+    references: str | None = None
+    text_body: str | None = None
+    html_body: str | None = None
+    digest: str | None = None
+    attachments: list[AttachmentRecord] = []
+
+
+class MessagePart(BaseModel):
+    """A leaf part described by BODYSTRUCTURE."""
+    section: str
+    content_type: str
+    charset: str | None = None
+    encoding: str
+    size: int
+    disposition: str | None = None
+    filename: str | None = None
+
+
+def _str(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value) if value is not None else ""
+
+
+def _params(values) -> dict[str, str]:
+    params = {}
+    values = values or ()
+    for key, value in zip(values[::2], values[1::2]):
+        key, value = _str(key).lower(), _str(value)
+        if key.endswith("*") and "''" in value:
+            # RFC 2231 extended value: charset'language'percent-encoded-text
+            charset, _, encoded = value.partition("''")
+            try:
+                key, value = key[:-1], unquote(encoded, encoding=charset or "utf-8", errors="replace")
+            except LookupError:
+                key, value = key[:-1], unquote(encoded, errors="replace")
+        params[key] = _decode_header_value(value)
+    return params
+
+
+def _decode_header_value(value: str) -> str:
+    return str(make_header(decode_header(value))) if value else value
+
+
+def message_parts(bodystructure, section: str = "") -> list[MessagePart]:
+    """
+    Flattens a BODYSTRUCTURE response into its leaf parts with IMAP section numbers.
+
+    Attached messages (message/rfc822) are treated as single parts.
+    """
+    if bodystructure.is_multipart:
+        parts = []
+        for i, sub in enumerate(bodystructure[0], 1):
+            parts.extend(message_parts(sub, f"{section}.{i}" if section else str(i)))
+        return parts
+    maintype, subtype = _str(bodystructure[0]).lower(), _str(bodystructure[1]).lower()
+    params = _params(bodystructure[2])
+    content_type = f"{maintype}/{subtype}"
+    # extension data follows the line count for text parts and the envelope, body and line count for messages
+    ext = {"text": 8, "message": 10 if subtype == "rfc822" else 7}.get(maintype, 7)
+    disposition, filename = None, params.get("name")
+    if len(bodystructure) > ext + 1 and bodystructure[ext + 1]:
+        disp = bodystructure[ext + 1]
+        disposition = _str(disp[0]).lower()
+        filename = _params(disp[1] if len(disp) > 1 else ()).get("filename") or filename
+    return [MessagePart(
+        section=section or "1",
+        content_type=content_type,
+        charset=params.get("charset"),
+        encoding=_str(bodystructure[5]).lower(),
+        size=int(bodystructure[6] or 0),
+        disposition=disposition,
+        filename=filename,
+    )]
+
+
+def decode_transfer(data: bytes, encoding: str) -> bytes:
+    """Undoes the Content-Transfer-Encoding of a downloaded part."""
+    try:
+        if encoding == "base64":
+            return b64decode(data)
+        if encoding == "quoted-printable":
+            return quopri.decodestring(data)
+    except (BinasciiError, ValueError):
+        pass
+    return data
+
+
+def _decode_text(payload: bytes, charset: str | None) -> str:
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def wanted_parts(parts: list[MessagePart], max_size: int) -> list[MessagePart]:
+    """Selects the first plain and HTML bodies and the attachments small enough to keep."""
+    wanted, seen_types = [], set()
+    for part in parts:
+        if part.content_type in ("text/plain", "text/html") and part.disposition != "attachment":
+            if part.content_type not in seen_types:
+                seen_types.add(part.content_type)
+                wanted.append(part)
+        elif part.disposition == "attachment":
+            # base64 inflates the payload by a third
+            decoded_size = part.size * 3 // 4 if part.encoding == "base64" else part.size
+            if decoded_size <= max_size:
+                wanted.append(part)
+    return wanted
+
+
+def _header_fields(msg: email.message.Message, uid: int, host: str) -> dict:
+    return dict(
+        uid=uid,
+        message_id=msg.get("Message-ID") or f"<{uid}@{host}>",
+        subject=str(make_header(decode_header(msg.get("Subject", "")))),
+        sender=str(make_header(decode_header(msg.get("From", "")))),
+        date=msg.get("Date", ""),
+        list_id=msg.get("List-Id"),
+        in_reply_to=msg.get("In-Reply-To"),
+        references=msg.get("References"),
+    )
+
+
+def parse_message(raw: bytes, uid: int, host: str, max_size: int) -> MessageRecord:
+    """Parses a full RFC822 message into a MessageRecord."""
+    msg = email.message_from_bytes(raw)
+    record = MessageRecord(**_header_fields(msg, uid, host))
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            disp = part.get_content_disposition()
+            if ctype == "text/plain" and disp is None and record.text_body is None:
+                record.text_body = _decode_text(part.get_payload(decode=True) or b"", part.get_content_charset())
+            elif ctype == "text/html" and disp is None and record.html_body is None:
+                record.html_body = _decode_text(part.get_payload(decode=True) or b"", part.get_content_charset())
+            elif disp == "attachment":
+                payload = part.get_payload(decode=True) or b""
+                if len(payload) <= max_size:
+                    record.attachments.append(
+                        AttachmentRecord(filename=part.get_filename(), content_type=ctype, data=payload)
+                    )
+    else:
+        record.text_body = _decode_text(msg.get_payload(decode=True) or b"", msg.get_content_charset())
+    return record
+
+
+class RawPart(BaseModel):
+    """A downloaded body section, still transfer-encoded."""
+    part: MessagePart
+    payload: bytes
+
+
+class RawMessage(BaseModel):
+    """A downloaded message before MIME parsing: headers plus wanted parts, or the full RFC822 source."""
+    uid: int
+    headers: bytes = b""
+    parts: list[RawPart] = []
+    rfc822: bytes | None = None
+
+
+def download_chunk(client, uids: list[int], max_size: int) -> list[RawMessage]:
+    """
+    Downloads a chunk of messages: BODYSTRUCTURE and headers first, then only the wanted parts.
+
+    Messages whose BODYSTRUCTURE cannot be used are downloaded whole.
+    """
+    meta = client.fetch(uids, ["BODYSTRUCTURE", "BODY.PEEK[HEADER]"])
+    raws: dict[int, RawMessage] = {}
+    plans: dict[tuple[str, ...], list[tuple[int, list[MessagePart]]]] = {}
+    fallback = []
+    for uid in uids:
+        data = meta.get(uid)
+        if not data:
+            continue
+        try:
+            parts = wanted_parts(message_parts(data[b"BODYSTRUCTURE"]), max_size)
+        except (IndexError, TypeError, ValueError, AttributeError):
+            fallback.append(uid)
+            continue
+        raws[uid] = RawMessage(uid=uid, headers=data[b"BODY[HEADER]"])
+        # messages with the same layout share one FETCH command
+        plans.setdefault(tuple(p.section for p in parts), []).append((uid, parts))
+
+    for sections, members in plans.items():
+        if not sections:
+            continue
+        response = client.fetch([uid for uid, _ in members], [f"BODY.PEEK[{s}]" for s in sections])
+        for uid, parts in members:
+            data = response.get(uid, {})
+            raws[uid].parts = [RawPart(part=p, payload=data.get(f"BODY[{p.section}]".encode()) or b"") for p in parts]
+
+    if fallback:
+        for uid, data in client.fetch(fallback, ["RFC822"]).items():
+            raws[uid] = RawMessage(uid=uid, rfc822=data[b"RFC822"])
+    return [raws[uid] for uid in uids if uid in raws]
+
+
+def parse_raw(raw: RawMessage, host: str, max_size: int) -> MessageRecord:
+    """
+    Parses a downloaded message into a MessageRecord, including its digest.
+
+    This is the CPU-bound stage (header and charset decoding, HTML to text) and runs in worker
+    processes when IMAP_PARSE_WORKERS is set.
+    """
+    if raw.rfc822 is not None:
+        record = parse_message(raw.rfc822, raw.uid, host, max_size)
+    else:
+        record = MessageRecord(**_header_fields(email.message_from_bytes(raw.headers), raw.uid, host))
+        for rp in raw.parts:
+            part = rp.part
+            payload = decode_transfer(rp.payload, part.encoding)
+            if part.disposition == "attachment":
+                if len(payload) <= max_size:
+                    record.attachments.append(
+                        AttachmentRecord(filename=part.filename, content_type=part.content_type, data=payload)
+                    )
+            elif part.content_type == "text/plain":
+                record.text_body = _decode_text(payload, part.charset)
+            else:
+                record.html_body = _decode_text(payload, part.charset)
+    record.digest = build_digest(record.text_body, record.html_body)
+    return record
+
+
+class ParseStats(BaseModel):
+    """Running totals for the parse stage."""
+    messages: int = 0
+    seconds: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return self.messages / self.seconds if self.seconds else 0.0
+
+
+parse_stats = ParseStats()
+_parse_stats_lock = threading.Lock()
+
+
+def parse_chunk(raws: list[RawMessage], host: str, max_size: int, pool: Executor | None = None) -> list[MessageRecord]:
+    """Parses downloaded messages in this process, or on pool when given."""
+    start = time.perf_counter()
+    if pool is None:
+        records = [parse_raw(raw, host, max_size) for raw in raws]
+    else:
+        records = list(pool.map(partial(parse_raw, host=host, max_size=max_size), raws))
+    seconds = time.perf_counter() - start
+    with _parse_stats_lock:
+        parse_stats.messages += len(records)
+        parse_stats.seconds += seconds
+    metrics.IMAP_STAGE_SECONDS.observe(seconds, stage="parse")
+    metrics.IMAP_MESSAGES.inc(len(records), stage="parsed")
+    return records
+
+
+def fetch_chunk(client, uids: list[int], host: str, max_size: int, pool: Executor | None = None) -> list[MessageRecord]:
+    """Downloads and parses a chunk of messages."""
+    with metrics.timed("download", metrics.IMAP_STAGE_SECONDS):
+        raws = download_chunk(client, uids, max_size)
+    metrics.IMAP_MESSAGES.inc(len(raws), stage="downloaded")
+    return parse_chunk(raws, host, max_size, pool)
+
+
+def parse_pool() -> ProcessPoolExecutor | None:
+    """
+    Creates the parse process pool when IMAP_PARSE_WORKERS is above 0 (default 0: parse in-process).
+
+    Workers are spawned rather than forked: the pool starts inside fetch and writer threads (or
+    the API's threadpool), and a forked child can deadlock on a lock another thread held.
+    """
+    workers = int(os.getenv("IMAP_PARSE_WORKERS", 0))
+    if workers <= 0:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def report_parse_stats(pool: Executor | None):
+    mode = "process pool" if pool is not None else "in-process"
+    print(f"Parsed {parse_stats.messages} messages in {parse_stats.seconds:.2f}s "
+          f"({parse_stats.per_second:.1f} msgs/s, {mode}).")
+
+
+class ImapAccount(BaseModel):
+    """Connection settings for one IMAP account."""
+    host: str
+    user: str
+    password: str
+    folders: list[str] = ["INBOX"]
+    ssl: bool = True
+    # None uses the standard port (993 with SSL, 143 without)
+    port: int | None = None
+
+
+def load_accounts(path: str | None = None) -> list[ImapAccount]:
+    """
+    Loads IMAP accounts from the JSON file at path (default IMAP_ACCOUNTS_FILE), or the single
+    account described by the IMAP_* environment variables when no file is configured.
+
+    The file holds {"accounts": [{"host": ..., "user": ..., "password_env": ..., "folders": [...]}]};
+    password_env names an environment variable holding the password and may replace password.
+    """
+    path = path or os.getenv("IMAP_ACCOUNTS_FILE")
+    if not path:
+        account = account_from_env()
+        return [account] if account else []
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    accounts = []
+    for entry in config.get("accounts", []):
+        if "password_env" in entry:
+            entry = {**entry, "password": os.getenv(entry.pop("password_env"), "")}
+        accounts.append(ImapAccount(**entry))
+    return accounts
+
+
+def account_from_env() -> ImapAccount | None:
+    """Reads the IMAP_* environment variables; returns None (after explaining why) when they are missing."""
     host = os.getenv("IMAP_HOST")
     user = os.getenv("IMAP_USER")
     password = os.getenv("IMAP_PASS")
-    folder = os.getenv("IMAP_FOLDER", "INBOX")
-    ssl = os.getenv("IMAP_SSL", "True").lower() in ("1", "true", "yes")
-
     if not host or not user or not password:
         print("IMAP_HOST, IMAP_USER, and IMAP_PASS must be set in environment.")
-        return
+        return None
+    return ImapAccount(
+        host=host,
+        user=user,
+        password=password,
+        folders=[os.getenv("IMAP_FOLDER", "INBOX")],
+        ssl=os.getenv("IMAP_SSL", "True").lower() in ("1", "true", "yes"),
+        port=int(os.getenv("IMAP_PORT")) if os.getenv("IMAP_PORT") else None,
+    )
 
-    with IMAPClient(host, ssl=ssl) as client:
-        client.login(user, password)
-        # Open mailbox readonly so messages are not marked or deleted
-        client.select_folder(folder, readonly=True)
-        # Only fetch unseen messages no older than one week
-        since = (datetime.utcnow() - timedelta(days=1)).date()
-        messages = client.search(["UNSEEN", "SINCE", since])
-        if not messages:
-            print("No new messages found within the last 1 days.")
-            return
-        response = client.fetch(messages, ["RFC822"])
 
+def sync_folder(
+    client, account: ImapAccount, folder: str, writer: BatchWriter | None = None, pool: Executor | None = None
+) -> int:
+    """
+    Downloads and stores the messages that arrived in folder since the last sync.
+
+    Args:
+        client: Logged-in IMAPClient.
+        account (ImapAccount): The account the client is logged in to.
+        folder (str): The folder to sync.
+        writer (BatchWriter | None): Shared writer to hand fetched chunks to instead of storing them here.
+        pool (Executor | None): Process pool for MIME parsing.
+
+    Returns:
+        int: The number of new emails stored, or fetched when a writer is used.
+    """
+    from epoch_agent.email_triage_agent import SessionLocal
+    since_days = int(os.getenv("IMAP_INITIAL_SYNC_DAYS", 1))
+    chunk_size = int(os.getenv("IMAP_FETCH_CHUNK", 50))
     max_size = int(os.getenv("IMAP_ATTACHMENT_MAX_SIZE", 1024 * 1024))
+    stored = 0
     with SessionLocal() as session:
-        for msgid, data in response.items():
-            raw = data[b"RFC822"]
-            msg = email.message_from_bytes(raw)
-            message_id = msg.get("Message-ID") or f"<{msgid}@{host}>"
-            subject = str(make_header(decode_header(msg.get("Subject", ""))))
-            sender = str(make_header(decode_header(msg.get("From", ""))))
-            date = msg.get("Date", "")
-            text_body = None
-            html_body = None
-            # extract parts
-            if msg.is_multipart():
-                for part in msg.walk():
-                    ctype = part.get_content_type()
-                    disp = part.get_content_disposition()
-                    if ctype == "text/plain" and disp is None and text_body is None:
-                        charset = part.get_content_charset() or "utf-8"
-                        text_body = part.get_payload(decode=True).decode(charset, errors="replace")
-                    elif ctype == "text/html" and disp is None and html_body is None:
-                        charset = part.get_content_charset() or "utf-8"
-                        html_body = part.get_payload(decode=True).decode(charset, errors="replace")
-                    elif disp == "attachment":
-                        payload = part.get_payload(decode=True) or b""
-                        if len(payload) <= max_size:
-                            session.add(AttachmentORM(
-                                message_id=message_id,
-                                filename=part.get_filename(),
-                                content_type=ctype,
-                                data=payload,
-                            ))
-            else:
-                charset = msg.get_content_charset() or "utf-8"
-                text_body = msg.get_payload(decode=True).decode(charset, errors="replace")
-
-            email_obj = EmailORM(
-                message_id=message_id,
-                subject=subject,
-                sender=sender,
-                date=date,
-                body=text_body or "",
-                html_body=html_body,
-                received_at=datetime.utcnow().isoformat(),
-            )
-            session.add(email_obj)
-            try:
-                session.commit()
-                print(f"Stored email {message_id}")
-            except Exception:
-                session.rollback()
-                print(f"Email {message_id} already exists or failed to store.")
+        state, messages = select_new_uids(client, session, sync_key(account.host, account.user), folder, since_days)
+        if not messages:
+            print(f"No new messages in {folder}.")
+            return 0
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            records = fetch_chunk(client, chunk, account.host, max_size, pool)
+            if writer is not None:
+                writer.submit(FetchedChunk(
+                    account=state.account, folder=folder, uidvalidity=state.uidvalidity,
+                    last_uid=max(chunk), records=records,
+                ))
+                stored += len(records)
+                continue
+            stored += store_records(session, records)
+            state.last_uid = max(chunk)
+            state.updated_at = datetime.utcnow().isoformat()
+            session.commit()
+    return stored
+
+
+class FetchedChunk(BaseModel):
+    """A chunk of fetched messages and the sync state to record once they are stored."""
+    account: str
+    folder: str
+    uidvalidity: int
+    last_uid: int
+    records: list[MessageRecord]
+
+
+def write_chunks(session, chunks: list[FetchedChunk]):
+    """BatchWriter flush: stores the messages of several chunks and advances their sync state in one commit."""
+    from epoch_agent.email_triage_agent import ImapSyncStateORM
+    for chunk in chunks:
+        store_records(session, chunk.records, commit=False)
+        state = session.get(ImapSyncStateORM, (chunk.account, chunk.folder))
+        if state is not None and state.uidvalidity == chunk.uidvalidity and state.last_uid < chunk.last_uid:
+            state.last_uid = chunk.last_uid
+            state.updated_at = datetime.utcnow().isoformat()
+    session.commit()
+
+
+def _sync_account_folder(account: ImapAccount, folder: str, writer: BatchWriter, pool: Executor | None) -> int:
+    with IMAPClient(account.host, port=account.port, ssl=account.ssl) as client:
+        client.login(account.user, account.password)
+        return sync_folder(client, account, folder, writer, pool)
+
+
+def fetch_all(accounts: list[ImapAccount], workers: int | None = None, pool: Executor | None = None) -> int:
+    """
+    Fetches every folder of every account concurrently, one connection per folder, with at most
+    workers (default IMAP_FETCH_WORKERS or 4) connections open at a time. All inserts go through
+    one shared BatchWriter. MIME parsing runs on pool when given.
+
+    Returns:
+        int: The number of messages fetched.
+    """
+    workers = workers or int(os.getenv("IMAP_FETCH_WORKERS", 4))
+    tasks = [(account, folder) for account in accounts for folder in account.folders]
+    fetched = 0
+    # a small queue bounds the number of fetched-but-unwritten chunks held in memory
+    with BatchWriter(write_chunks, max_batch=8, max_delay=0.2, max_queue=workers * 2, name="imap-writer") as writer:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="imap-fetch") as fetchers:
+            futures = {fetchers.submit(_sync_account_folder, account, folder, writer, pool): (account, folder)
+                       for account, folder in tasks}
+            for future in as_completed(futures):
+                account, folder = futures[future]
+                try:
+                    fetched += future.result()
+                except Exception as e:
+                    print(f"Fetching {account.user}@{account.host}/{folder} failed: {e}")
+    return fetched
+
+
+def fetch_emails() -> int:
+    """
+    Connect to the IMAP server(s), fetch messages that arrived since the last sync, and store them in the database.
+
+    Several accounts or folders (see load_accounts) are fetched concurrently.
+
+    Returns:
+        int: The number of new emails stored.
+    """
+    if IMAPClient is None:
+        print("imapclient library is required. Install with 'pip install imapclient'.")
+        return 0
+    accounts = load_accounts()
+    if not accounts:
+        return 0
+    parse_stats.messages, parse_stats.seconds = 0, 0.0
+    pool = parse_pool()
+    start = time.perf_counter()
+    try:
+        if len(accounts) > 1 or len(accounts[0].folders) > 1:
+            return fetch_all(accounts, pool=pool)
+        account = accounts[0]
+        with IMAPClient(account.host, port=account.port, ssl=account.ssl) as client:
+            client.login(account.user, account.password)
+            return sync_folder(client, account, account.folders[0], pool=pool)
+    finally:
+        metrics.IMAP_FETCH_SECONDS.observe(time.perf_counter() - start)
+        report_parse_stats(pool)
+        if pool is not None:
+            pool.shutdown()
+
+
+def _start_triage(state: dict):
+    """Runs triage in a background thread unless a run is already in progress."""
+    from epoch_agent.email_triage_agent import run_email_triage_agent
+    if state.get("thread") is not None and state["thread"].is_alive():
+        return False
+
+    def run():
+        try:
+            asyncio.run(run_email_triage_agent())
+        except Exception as e:
+            print(f"Triage run failed: {e}")
+
+    state["thread"] = threading.Thread(target=run, name="idle-triage", daemon=True)
+    state["thread"].start()
+    return True
+
+
+def run_idle_worker(triage_after: int | None = None, stop: threading.Event | None = None):
+    """
+    Keeps one authenticated IMAP connection open and ingests new mail as it arrives.
+
+    The worker waits for EXISTS notifications with IMAP IDLE (re-issued every IMAP_IDLE_TIMEOUT
+    seconds, default 300), falling back to polling every IMAP_POLL_INTERVAL seconds when the server
+    has no IDLE support. Dropped connections are re-established with exponential backoff up to
+    IMAP_RECONNECT_MAX seconds.
+
+    Args:
+        triage_after (int | None): Start a triage run once this many new emails have been stored
+            (default IMAP_TRIAGE_AFTER; 0 disables).
+        stop (threading.Event | None): Set to stop the worker.
+    """
+    if IMAPClient is None:
+        print("imapclient library is required. Install with 'pip install imapclient'.")
+        return
+    account = account_from_env()
+    if account is None:
+        return
+    folder = account.folders[0]
+    if triage_after is None:
+        triage_after = int(os.getenv("IMAP_TRIAGE_AFTER", 0))
+    idle_timeout = int(os.getenv("IMAP_IDLE_TIMEOUT", 300))
+    poll_interval = int(os.getenv("IMAP_POLL_INTERVAL", 60))
+    max_backoff = int(os.getenv("IMAP_RECONNECT_MAX", 300))
+    stop = stop or threading.Event()
+    triage_state: dict = {}
+    pending = 0
+    backoff = 1
+
+    while not stop.is_set():
+        try:
+            with IMAPClient(account.host, port=account.port, ssl=account.ssl) as client:
+                client.login(account.user, account.password)
+                print(f"Connected to {account.host}; watching {folder}.")
+                backoff = 1
+                can_idle = client.has_capability("IDLE")
+                while not stop.is_set():
+                    pending += sync_folder(client, account, folder)
+                    if triage_after and pending >= triage_after and _start_triage(triage_state):
+                        print(f"Started triage after {pending} new emails.")
+                        pending = 0
+                    if not can_idle:
+                        stop.wait(poll_interval)
+                        continue
+                    client.idle()
+                    try:
+                        # returns early on any untagged response (EXISTS, EXPUNGE, ...)
+                        client.idle_check(timeout=idle_timeout)
+                    finally:
+                        client.idle_done()
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            if stop.is_set():
+                break
+            print(f"IMAP connection lost ({e}); reconnecting in {backoff}s.")
+            stop.wait(backoff + random.uniform(0, backoff / 2))
+            backoff = min(backoff * 2, max_backoff)
+
+
+def link_duplicate(session, message_id: str, record: MessageRecord):
+    """
+    Adds what only the fetched copy of an already stored email has to the stored copy: the HTML
+    body, and the attachments, which the Worker does not post.
+    """
+    from epoch_agent.email_triage_agent import EmailORM, AttachmentORM
+    email = session.get(EmailORM, message_id)
+    if email is None:
+        return
+    if email.html_body is None and record.html_body is not None:
+        email.html_body = record.html_body
+    if record.attachments and session.query(AttachmentORM.id).filter_by(message_id=message_id).first() is None:
+        _add_attachments(session, message_id, record.attachments)
+
+
+def _add_attachments(session, message_id: str, attachments: list[AttachmentRecord]):
+    from epoch_agent.email_triage_agent import AttachmentORM
+    for att in attachments:
+        sha256, size = blobstore.store_attachment(session, att.data)
+        session.add(AttachmentORM(
+            message_id=message_id,
+            filename=att.filename,
+            content_type=att.content_type,
+            sha256=sha256,
+            size=size,
+        ))
+
+
+@metrics.timed("store", metrics.IMAP_STAGE_SECONDS)
+def store_records(session, records: list[MessageRecord], commit: bool = True) -> int:
+    """
+    Stores new messages and their attachments, committing once for the whole chunk unless commit is False.
+
+    Messages whose content hash is already stored (for example because the Worker posted them
+    under another Message-ID) are not stored again; see link_duplicate.
+
+    Returns:
+        int: The number of new emails stored.
+    """
+    from epoch_agent.email_triage_agent import EmailORM
+    hashes = [
+        dedup.content_hash(record.sender, record.subject, record.date, record.text_body, record.html_body)
+        for record in records
+    ]
+    known = dedup.find_existing(session, hashes)
+    stored = []
+    duplicates = 0
+    for record, content_hash in zip(records, hashes):
+        if record.message_id in stored or session.get(EmailORM, record.message_id) is not None:
+            print(f"Email {record.message_id} already exists.")
+            continue
+        if content_hash in known:
+            print(f"Email {record.message_id} is a copy of {known[content_hash]}.")
+            link_duplicate(session, known[content_hash], record)
+            duplicates += 1
+            continue
+        known[content_hash] = record.message_id
+        _add_attachments(session, record.message_id, record.attachments)
+        session.add(EmailORM(
+            message_id=record.message_id,
+            subject=record.subject,
+            sender=record.sender,
+            date=record.date,
+            body=record.text_body or "",
+            html_body=record.html_body,
+            digest=record.digest if record.digest is not None else build_digest(record.text_body, record.html_body),
+            content_hash=content_hash,
+            list_id=record.list_id,
+            in_reply_to=record.in_reply_to,
+            references=record.references,
+            thread_id=thread_id_for(session, record.message_id, record.in_reply_to, record.references),
+            received_at=datetime.utcnow().isoformat(),
+        ))
+        stored.append(record.message_id)
+    if commit:
+        session.commit()
+    for message_id in stored:
+        print(f"Stored email {message_id}")
+    metrics.IMAP_MESSAGES.inc(len(stored), stage="stored")
+    metrics.IMAP_MESSAGES.inc(duplicates, stage="duplicate")
+    return len(stored)
 
 
 if __name__ == "__main__":
-    fetch_emails()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch new emails via IMAP into the triage database.")
+    parser.add_argument("--idle", action="store_true", help="keep running and ingest new mail with IMAP IDLE")
+    parser.add_argument("--triage-after", type=int, default=None,
+                        help="with --idle, start triage once this many new emails are stored")
+    args = parser.parse_args()
+    if args.idle:
+        run_idle_worker(triage_after=args.triage_after)
+    else:
+        fetch_emails()
@@ -0,0 +1,96 @@
+"""
+In-process background jobs for long-running API actions such as triage runs.
+
+Jobs run as asyncio tasks on the server's event loop and are tracked by ID so clients can poll
+their status. At most one job of each kind is in flight: triggering a kind that is already
+queued or running joins the existing job instead of starting a duplicate.
+"""
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel
+
+
+class Job(BaseModel):
+    """Status of a background job."""
+    id: str
+    kind: str
+    status: str = "queued"  # queued, running, succeeded or failed
+    created_at: str
+    started_at: str | None = None
+    finished_at: str | None = None
+    result: Any = None
+    error: str | None = None
+
+
+class JobRunner:
+    """Runs single-flight background jobs and keeps the most recent keep jobs for polling."""
+
+    def __init__(self, keep: int = 100):
+        self.keep = keep
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._active: dict[str, Job] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def submit(self, kind: str, factory: Callable[[], Awaitable[Any]]) -> tuple[Job, bool]:
+        """
+        Starts a job of the given kind unless one is already in flight. Must be called on the event loop.
+
+        Returns:
+            tuple[Job, bool]: The job, and whether it was newly started.
+        """
+        active = self._active.get(kind)
+        if active is not None:
+            return active, False
+        job = Job(id=uuid.uuid4().hex, kind=kind, created_at=datetime.utcnow().isoformat())
+        self._active[kind] = job
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.status in ("queued", "running"):
+                break
+            self.jobs.popitem(last=False)
+        # keep a reference so the task is not garbage collected while it runs
+        task = asyncio.get_running_loop().create_task(self._run(job, factory))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job, True
+
+    async def _run(self, job: Job, factory: Callable[[], Awaitable[Any]]):
+        job.status = "running"
+        job.started_at = datetime.utcnow().isoformat()
+        try:
+            result = await factory()
+            job.result = result.model_dump() if isinstance(result, BaseModel) else result
+            job.status = "succeeded"
+        except asyncio.CancelledError:
+            job.error = "cancelled"
+            job.status = "failed"
+            raise
+        except Exception as e:
+            print(f"Job {job.kind} {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow().isoformat()
+            self._active.pop(job.kind, None)
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: Job) -> Job:
+        """Waits for a job to finish without cancelling it if the waiter is cancelled."""
+        task = self._tasks.get(job.id)
+        if task is not None:
+            await asyncio.wait([task])
+        return job
+
+    async def shutdown(self):
+        """Cancels jobs still in flight."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
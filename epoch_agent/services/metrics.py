@@ -0,0 +1,219 @@
+"""
+In-process metrics in the Prometheus text format, plus per-run triage profiles.
+
+Counters and histograms live in one registry that GET /metrics renders. Timings recorded with
+timed() while a RunProfile is active (see profiling()) are also added to that run's profile, which
+run_email_triage_agent can save as JSON next to the report.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from pydantic import BaseModel
+
+from agents import RunHooks
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Counter:
+    """Monotonic counter, one series per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_label_str(key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # [per-bucket counts, sum, count]
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[2] if series else 0
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_label_str(key + (('le', bound),))} {c}")
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', '+Inf'),))} {n}")
+                lines.append(f"{self.name}_sum{_label_str(key)} {total}")
+                lines.append(f"{self.name}_count{_label_str(key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TRIAGE_STAGE_SECONDS = REGISTRY.histogram("triage_stage_seconds", "Time spent in each triage stage.")
+TRIAGE_RUNS = REGISTRY.counter("triage_runs_total", "Triage runs by outcome.")
+TRIAGE_RUN_EMAILS = REGISTRY.histogram("triage_run_emails", "Emails tagged per triage run.", COUNT_BUCKETS)
+TRIAGE_EMAILS = REGISTRY.counter("triage_emails_total", "Emails tagged, by what tagged them.")
+AGENT_RUNS = REGISTRY.counter("agent_runs_total", "Agent runs by agent and outcome.")
+AGENT_MODEL_SECONDS = REGISTRY.histogram("agent_model_call_seconds", "Latency of model calls made by agents.")
+AGENT_TOOL_SECONDS = REGISTRY.histogram("agent_tool_call_seconds", "Latency of agent tool calls.")
+AGENT_TOKENS = REGISTRY.counter("agent_tokens_total", "Model tokens used by agents, by direction.")
+AGENT_RETRIES = REGISTRY.counter("agent_retries_total", "Agent runs repeated after a transient error.")
+AGENT_WAIT_SECONDS = REGISTRY.histogram("agent_wait_seconds", "Time agent runs waited for a slot or a rate limit.")
+IMAP_STAGE_SECONDS = REGISTRY.histogram("imap_stage_seconds", "Time spent downloading, parsing and storing message chunks.")
+IMAP_MESSAGES = REGISTRY.counter("imap_messages_total", "Messages downloaded, parsed and stored by the IMAP fetcher.")
+IMAP_FETCH_SECONDS = REGISTRY.histogram("imap_fetch_seconds", "Duration of complete IMAP fetches.")
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("http_request_seconds", "API request latency by route.")
+
+
+class RunProfile(BaseModel):
+    """Where the time and tokens of one triage run went."""
+    started_at: str = ""
+    seconds: float = 0.0
+    emails: int = 0
+    stages: dict[str, float] = {}
+    stage_calls: dict[str, int] = {}
+    agent_runs: int = 0
+    model_calls: int = 0
+    tool_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+current_profile: contextvars.ContextVar[RunProfile | None] = contextvars.ContextVar("current_profile", default=None)
+
+
+@contextmanager
+def profiling(profile: RunProfile):
+    """Makes profile the target of timed() and the agent hooks in this context."""
+    token = current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds = round(time.perf_counter() - start, 4)
+        current_profile.reset(token)
+
+
+def _profile_stage(stage: str, seconds: float):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.stages[stage] = round(profile.stages.get(stage, 0.0) + seconds, 4)
+        profile.stage_calls[stage] = profile.stage_calls.get(stage, 0) + 1
+
+
+@contextmanager
+def timed(stage: str, histogram: Histogram = TRIAGE_STAGE_SECONDS):
+    """Records the duration of the block under stage in histogram and the active run profile."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        histogram.observe(seconds, stage=stage)
+        _profile_stage(stage, seconds)
+
+
+class MetricsHooks(RunHooks):
+    """Agent run hooks recording model and tool latency and token usage. Use one instance per run."""
+
+    def __init__(self):
+        self._llm_start: dict[str, float] = {}
+        self._tool_start: dict[str, float] = {}
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        self._llm_start[agent.name] = time.perf_counter()
+
+    async def on_llm_end(self, context, agent, response):
+        start = self._llm_start.pop(agent.name, None)
+        if start is not None:
+            AGENT_MODEL_SECONDS.observe(time.perf_counter() - start, agent=agent.name)
+        usage = getattr(response, "usage", None)
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        AGENT_TOKENS.inc(input_tokens, agent=agent.name, direction="input")
+        AGENT_TOKENS.inc(output_tokens, agent=agent.name, direction="output")
+        profile = current_profile.get()
+        if profile is not None:
+            profile.model_calls += 1
+            profile.input_tokens += input_tokens
+            profile.output_tokens += output_tokens
+
+    async def on_tool_start(self, context, agent, tool):
+        self._tool_start[getattr(tool, "name", "tool")] = time.perf_counter()
+
+    async def on_tool_end(self, context, agent, tool, result):
+        name = getattr(tool, "name", "tool")
+        start = self._tool_start.pop(name, None)
+        if start is not None:
+            AGENT_TOOL_SECONDS.observe(time.perf_counter() - start, tool=name)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.tool_calls += 1
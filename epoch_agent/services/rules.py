@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Rule-based fast path that tags obvious emails without calling the triage agent.
+
+Rules live in the triage_rules table and are loaded into an in-memory index. Each rule matches
+one field:
+- sender: exact sender address (e.g. receipts@stripe.com)
+- domain: sender domain, including subdomains (e.g. stripe.com matches mail.stripe.com)
+- list_id: the List-Id header (e.g. news.example.com)
+- subject: case-insensitive regular expression searched in the subject
+"""
+import argparse
+import re
+from email.utils import parseaddr
+
+from pydantic import BaseModel
+
+RULE_FIELDS = ("sender", "domain", "list_id", "subject")
+
+
+class FastPathStats(BaseModel):
+    """Running totals of triage work handled by the fast path."""
+    emails_matched: int = 0
+    llm_classifications_saved: int = 0
+    agent_runs_skipped: int = 0
+
+
+stats = FastPathStats()
+
+
+def normalize_list_id(list_id: str | None) -> str:
+    """Extracts the list identifier from a List-Id header ('Name <id>' or 'id')."""
+    if not list_id:
+        return ""
+    match = re.search(r"<([^>]+)>", list_id)
+    return (match.group(1) if match else list_id).strip().lower()
+
+
+class RuleIndex:
+    """In-memory index of triage rules: dict lookups for addresses, domains and lists, regexes for subjects."""
+
+    def __init__(self):
+        self.senders: dict[str, str] = {}
+        self.domains: dict[str, str] = {}
+        self.list_ids: dict[str, str] = {}
+        self.subjects: list[tuple[re.Pattern, str]] = []
+
+    def __len__(self):
+        return len(self.senders) + len(self.domains) + len(self.list_ids) + len(self.subjects)
+
+    def add(self, field: str, pattern: str, status: str):
+        if field == "sender":
+            self.senders[pattern.strip().lower()] = status
+        elif field == "domain":
+            self.domains[pattern.strip().lower().lstrip("@")] = status
+        elif field == "list_id":
+            self.list_ids[normalize_list_id(pattern)] = status
+        elif field == "subject":
+            self.subjects.append((re.compile(pattern, re.IGNORECASE), status))
+        else:
+            raise ValueError(f"Unknown rule field {field!r}; expected one of {RULE_FIELDS}")
+
+    def match(self, sender: str | None, subject: str | None, list_id: str | None = None) -> tuple[str, str] | None:
+        """
+        Finds the tag for an email.
+
+        Returns:
+            tuple[str, str] | None: The status and a description of the matching rule, or None.
+        """
+        address = parseaddr(sender or "")[1].lower()
+        if address in self.senders:
+            return self.senders[address], f"sender {address}"
+        lid = normalize_list_id(list_id)
+        if lid and lid in self.list_ids:
+            return self.list_ids[lid], f"list {lid}"
+        domain = address.rpartition("@")[2]
+        while domain:
+            if domain in self.domains:
+                return self.domains[domain], f"domain {domain}"
+            domain = domain.partition(".")[2]
+        for regex, status in self.subjects:
+            if regex.search(subject or ""):
+                return status, f"subject /{regex.pattern}/"
+        return None
+
+
+def load_rule_index(session) -> RuleIndex:
+    """Loads all rules from the database into a RuleIndex."""
+    from epoch_agent.email_triage_agent import RuleORM
+    index = RuleIndex()
+    for rule in session.query(RuleORM).order_by(RuleORM.id):
+        index.add(rule.field, rule.pattern, rule.status)
+    return index
+
+
+def add_rule(session, field: str, pattern: str, status: str):
+    """Validates and stores a new rule."""
+    from epoch_agent.email_triage_agent import RuleORM
+    RuleIndex().add(field, pattern, status)
+    rule = RuleORM(field=field, pattern=pattern, status=status)
+    session.add(rule)
+    session.commit()
+    return rule
+
+
+def main():
+    from epoch_agent.email_triage_agent import RuleORM, SessionLocal
+    parser = argparse.ArgumentParser(description="Manage fast-path triage rules.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="add a rule")
+    add.add_argument("field", choices=RULE_FIELDS)
+    add.add_argument("pattern")
+    add.add_argument("status")
+    sub.add_parser("list", help="list rules")
+    remove = sub.add_parser("remove", help="remove a rule by id")
+    remove.add_argument("id", type=int)
+    args = parser.parse_args()
+
+    with SessionLocal() as session:
+        if args.command == "add":
+            rule = add_rule(session, args.field, args.pattern, args.status)
+            print(f"Added rule {rule.id}: {rule.field} {rule.pattern!r} -> {rule.status}")
+        elif args.command == "list":
+            for rule in session.query(RuleORM).order_by(RuleORM.id):
+                print(f"{rule.id:>4}  {rule.field:<8} {rule.pattern!r} -> {rule.status}")
+        elif args.command == "remove":
+            session.query(RuleORM).filter(RuleORM.id == args.id).delete()
+            session.commit()
+            print(f"Removed rule {args.id}")
+
+
+if __name__ == "__main__":
+    main()
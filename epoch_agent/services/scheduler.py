@@ -0,0 +1,63 @@
+"""
+Periodic background tasks for the API server, such as fetching mail on an interval.
+
+Each task runs on the event loop and sleeps for its interval after a run finishes, so runs of
+the same task never overlap. The outcome of the last run is kept for the status endpoint.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel
+
+
+class TaskStatus(BaseModel):
+    """Outcome of the most recent run of a periodic task."""
+    name: str
+    interval: float
+    runs: int = 0
+    running: bool = False
+    last_started_at: str | None = None
+    last_duration: float | None = None
+    last_result: Any = None
+    last_error: str | None = None
+
+
+class PeriodicTask:
+    """Runs func every interval seconds, measured from the end of the previous run."""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[Any]]):
+        self.func = func
+        self.status = TaskStatus(name=name, interval=interval)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> "PeriodicTask":
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        return self
+
+    async def run_once(self):
+        self.status.running = True
+        self.status.last_started_at = datetime.utcnow().isoformat()
+        start = time.perf_counter()
+        try:
+            self.status.last_result = await self.func()
+            self.status.last_error = None
+        except Exception as e:
+            print(f"Scheduled {self.status.name} failed: {e}")
+            self.status.last_error = str(e)
+        finally:
+            self.status.last_duration = round(time.perf_counter() - start, 3)
+            self.status.runs += 1
+            self.status.running = False
+
+    async def _loop(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.status.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Full-text search over stored emails with an SQLite FTS5 index.
+
+emails_fts indexes the subject, sender, plain-text body and the text of the HTML body of every
+email. The HTML text is computed once at ingest (see html_text) and stored in emails.html_text,
+so the index only ever sees stored values: the contentless table's 'delete' command must be
+given exactly the tokens that were indexed. The text stays in the emails table only, and
+triggers on emails keep the index up to date, so every ingest path is covered.
+"""
+import argparse
+
+from pydantic import BaseModel
+from sqlalchemy import text
+
+from epoch_agent.services.digest import html_to_text
+
+FTS_TABLE = "emails_fts"
+# bm25 weights for subject, sender, body and html_text
+WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+
+_COLUMNS = "subject, sender, body, html_text"
+_NEW = "new.subject, new.sender, new.body, new.html_text"
+_OLD = "old.subject, old.sender, old.body, old.html_text"
+_TRIGGERS = ("emails_fts_insert", "emails_fts_delete", "emails_fts_update")
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_COLUMNS}, content='', tokenize='unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS}) VALUES (new.rowid, {_NEW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.rowid, {_OLD});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE OF subject, sender, body, html_text ON emails BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMNS}) VALUES ('delete', old.rowid, {_OLD});
+        INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS}) VALUES (new.rowid, {_NEW});
+    END""",
+]
+
+
+class SearchHit(BaseModel):
+    """A search result, best match first."""
+    message_id: str
+    subject: str | None
+    sender: str | None
+    date: str | None
+    status: str | None
+    processed: bool
+    rank: float
+
+
+def html_text(html_body: str | None) -> str | None:
+    """The text of an HTML body as stored in emails.html_text for the index; EmailORM sets it with html_body."""
+    return html_to_text(html_body) if html_body else None
+
+
+def fts5_available(conn) -> bool:
+    return bool(conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def fill_html_text(conn, batch_size: int = 500) -> int:
+    """
+    Stores html_text for emails that have an HTML body but no stored text yet.
+
+    Returns:
+        int: The number of emails filled.
+    """
+    filled, last = 0, 0
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT rowid, html_body FROM emails WHERE rowid > ? AND html_body IS NOT NULL AND html_text IS NULL "
+            "ORDER BY rowid LIMIT ?", (last, batch_size)
+        ).all()
+        if not rows:
+            return filled
+        conn.exec_driver_sql(
+            "UPDATE emails SET html_text = ? WHERE rowid = ?", [(html_text(html), rowid) for rowid, html in rows]
+        )
+        filled += len(rows)
+        last = rows[-1][0]
+
+
+def create_index(conn):
+    """
+    Creates the FTS table and triggers and indexes the emails already stored (skipped without FTS5).
+
+    Triggers from earlier versions are replaced, and an existing index is rebuilt from the stored
+    columns, so the index never holds tokens the triggers cannot reproduce.
+    """
+    if not fts5_available(conn):
+        print("SQLite was built without FTS5; full-text search is disabled.")
+        return
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).scalar()
+    for trigger in _TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    fill_html_text(conn)
+    for ddl in _DDL:
+        conn.exec_driver_sql(ddl)
+    if exists:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+    _index_all(conn)
+
+
+def _index_all(conn):
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}(rowid, {_COLUMNS}) SELECT rowid, {_COLUMNS} FROM emails")
+
+
+def rebuild(conn) -> int:
+    """
+    Reindexes every stored email from scratch and merges the index into one segment.
+
+    Returns:
+        int: The number of emails indexed.
+    """
+    create_index(conn)
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return conn.exec_driver_sql("SELECT count(*) FROM emails").scalar()
+
+
+def search(
+    session,
+    query: str,
+    status: str | None = None,
+    processed: bool | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchHit]:
+    """
+    Runs an FTS5 query (terms, "phrases", prefix*, subject:term, AND/OR/NOT) ranked by bm25.
+
+    Args:
+        status (str | None): Only emails with this tag.
+        processed (bool | None): Only processed (True) or unprocessed (False) emails.
+
+    Returns:
+        list[SearchHit]: One page of matches, best first.
+    """
+    filters, params = "", {"query": query, "limit": limit, "offset": offset}
+    if status is not None:
+        filters += " AND e.status = :status"
+        params["status"] = status
+    if processed is not None:
+        filters += " AND e.processed = :processed"
+        params["processed"] = processed
+    rows = session.execute(text(f"""
+        SELECT e.message_id, e.subject, e.sender, e.date, e.status, e.processed,
+               bm25({FTS_TABLE}, {', '.join(map(str, WEIGHTS))}) AS rank
+        FROM {FTS_TABLE} JOIN emails e ON e.rowid = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :query{filters}
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """), params)
+    return [SearchHit(**{**row._mapping, "processed": bool(row.processed)}) for row in rows]
+
+
+def main():
+    from epoch_agent.email_triage_agent import SessionLocal
+    parser = argparse.ArgumentParser(description="Manage and query the full-text search index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="reindex every stored email")
+    query = sub.add_parser("query", help="search stored emails")
+    query.add_argument("query")
+    query.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            count = rebuild(session.connection())
+            session.commit()
+            print(f"Indexed {count} emails.")
+        else:
+            for hit in search(session, args.query, limit=args.limit):
+                print(f"{hit.rank:8.2f}  {hit.status or '-':18}  {hit.sender}: {hit.subject}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Shared SQLite storage: the one engine and session factory used by the agent, the fetcher and
+the API, plus versioned schema migrations.
+
+Connections run in WAL mode so readers (the review UI, triage queries) do not block the ingest
+writer. The ORM models live in epoch_agent.email_triage_agent and register on Base.
+"""
+import os
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from epoch_agent.services import search
+
+Base = declarative_base()
+
+
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # takes effect for new databases only; archive.compact converts existing ones
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{int(os.getenv('DB_CACHE_KB', 20000))}")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def make_engine(db_file: str):
+    """Creates an engine for a SQLite file with the WAL and cache pragmas applied to every connection."""
+    engine = create_engine(f"sqlite:///{db_file}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_pragmas)
+    return engine
+
+
+DB_FILE = os.getenv("DB_FILE", "email_triage.db")
+engine = make_engine(DB_FILE)
+SessionLocal = sessionmaker(bind=engine)
+
+
+def configure(db_file: str):
+    """
+    Points the shared engine and SessionLocal at another database file and migrates it.
+
+    Returns:
+        Engine: The engine now in use.
+    """
+    global engine, DB_FILE
+    if db_file != DB_FILE:
+        engine.dispose()
+        DB_FILE = db_file
+        engine = make_engine(db_file)
+        SessionLocal.configure(bind=engine)
+    ensure_schema(engine)
+    return engine
+
+
+def add_column(conn, table_name: str, column_name: str):
+    """Adds a column declared on a model to an existing table, if it is missing."""
+    table = Base.metadata.tables[table_name]
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name not in existing:
+        quote = conn.dialect.identifier_preparer.quote
+        ddl = table.c[column_name].type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column_name)} {ddl}"))
+
+
+def _add_missing_columns(conn):
+    # databases created before migrations were versioned may lack any later column
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            add_column(conn, table.name, column.name)
+
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def rebuild_with_autoincrement(conn, table_name: str):
+    """
+    Recreates a table whose model declares sqlite_autoincrement, keeping its rows, so SQLite
+    stops reusing the ids of deleted rows. Does nothing when the table already has it.
+    """
+    sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+    table = Base.metadata.tables[table_name]
+    columns = ", ".join(conn.dialect.identifier_preparer.quote(c.name) for c in table.columns)
+    old = f"{table_name}_old"
+    conn.exec_driver_sql(f"ALTER TABLE {table_name} RENAME TO {old}")
+    for (index,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (old,)
+    ).all():
+        conn.exec_driver_sql(f"DROP INDEX {index}")
+    table.create(conn)
+    # inserting the old ids also sets the table's sqlite_sequence entry to the highest one
+    conn.exec_driver_sql(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {old}")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+
+
+# Applied in order; the database's PRAGMA user_version records how many have run. Append new
+# steps (e.g. lambda conn: add_column(conn, "emails", "new_column")) and never reorder them.
+MIGRATIONS = [
+    _add_missing_columns,
+    # ix_emails_processed_received_at and ix_emails_status for the triage and review queues
+    _create_missing_indexes,
+    # rows without received_at would drop out of keyset pages, since NULL never compares greater
+    lambda conn: conn.execute(text("UPDATE emails SET received_at = '' WHERE received_at IS NULL")),
+    # ix_emails_received_at_message_id for keyset pagination
+    _create_missing_indexes,
+    # row leasing for parallel triage workers
+    lambda conn: add_column(conn, "emails", "lease_token"),
+    lambda conn: add_column(conn, "emails", "lease_expires_at"),
+    _create_missing_indexes,
+    # formerly the first full-text index, whose triggers needed a Python SQL function; replaced below
+    lambda conn: None,
+    # content-hash deduplication; existing rows are hashed by python -m epoch_agent.services.dedup backfill
+    lambda conn: add_column(conn, "emails", "content_hash"),
+    _create_missing_indexes,
+    # full-text search index over stored columns only, with the HTML text stored at ingest
+    lambda conn: add_column(conn, "emails", "html_text"),
+    search.create_index,
+    # attachment ids must not be reused once archived (see services/archive.py)
+    lambda conn: rebuild_with_autoincrement(conn, "attachments"),
+]
+
+
+def ensure_schema(bind) -> int:
+    """
+    Creates missing tables and applies pending migrations.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for step in MIGRATIONS[version:]:
+            step(conn)
+            version += 1
+            conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    return version
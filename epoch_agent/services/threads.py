@@ -0,0 +1,53 @@
+"""
+Conversation threading from the In-Reply-To and References headers.
+
+Every stored email gets a thread_id: the thread of the first referenced message already in the
+database, otherwise the root of its References chain, otherwise its own Message-ID.
+"""
+import re
+
+_MSGID = re.compile(r"<[^<>\s]+>")
+
+
+def parse_references(header: str | None) -> list[str]:
+    """Extracts message IDs (with angle brackets) from a References or In-Reply-To header."""
+    return _MSGID.findall(header or "")
+
+
+def thread_id_for(session, message_id: str, in_reply_to: str | None, references: str | None) -> str:
+    """
+    Resolves the thread an incoming email belongs to.
+
+    Args:
+        session: Open database session used to look up referenced messages.
+        message_id (str): The email's Message-ID.
+        in_reply_to (str | None): The In-Reply-To header.
+        references (str | None): The References header.
+
+    Returns:
+        str: The thread ID.
+    """
+    from epoch_agent.email_triage_agent import EmailORM
+    refs = parse_references(references)
+    parents = parse_references(in_reply_to) + refs[::-1]
+    if parents:
+        known = (
+            session.query(EmailORM.message_id, EmailORM.thread_id)
+            .filter(EmailORM.message_id.in_(parents), EmailORM.thread_id.isnot(None))
+            .all()
+        )
+        if known:
+            by_id = dict(known)
+            return next(by_id[p] for p in parents if p in by_id)
+        return refs[0] if refs else parents[0]
+    return message_id
+
+
+def thread_context(earlier: list, limit: int = 5) -> str:
+    """Summarizes earlier unprocessed messages of a thread in a few lines."""
+    if not earlier:
+        return ""
+    lines = [f"[Thread context: {len(earlier)} earlier unprocessed message(s)]"]
+    for e in earlier[-limit:]:
+        lines.append(f"- {e.date} {e.sender}: {e.subject}")
+    return "\n".join(lines) + "\n\n"
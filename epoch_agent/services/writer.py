@@ -0,0 +1,103 @@
+"""
+Single background writer that applies queued items to the database in batches.
+
+Producers (IMAP fetch workers, request handlers) submit items from any thread; one writer
+thread groups them and calls flush(session, items) once per batch, so SQLite sees one writer
+and one commit per batch instead of one per item.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable
+
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    Queue plus writer thread that flushes items in batches of up to max_batch, waiting at most
+    max_delay seconds for a batch to fill.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[Any, list], None],
+        max_batch: int = 500,
+        max_delay: float = 0.5,
+        max_queue: int = 10000,
+        name: str = "batch-writer",
+        session_factory: Callable[[], Any] | None = None,
+    ):
+        self.flush = flush
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+        self.items_written = 0
+        self.batches = 0
+        self.errors: list[Exception] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "BatchWriter":
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, item, done: threading.Event | None = None):
+        """
+        Queues an item, blocking while the queue is full.
+
+        done is set once the item's batch has been flushed; its error attribute holds the
+        exception if the flush failed.
+        """
+        self._queue.put((item, done))
+
+    def close(self):
+        """Flushes everything queued so far and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put((_STOP, None))
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _run(self):
+        from epoch_agent.email_triage_agent import SessionLocal
+        session_factory = self.session_factory or SessionLocal
+        stopping = False
+        while not stopping:
+            item, done = self._queue.get()
+            if item is _STOP:
+                break
+            batch, events = [item], [done]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item, done = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                events.append(done)
+            try:
+                with session_factory() as session:
+                    self.flush(session, batch)
+                self.items_written += len(batch)
+                self.batches += 1
+                failed = None
+            except Exception as e:
+                print(f"{self.name}: failed to write {len(batch)} items: {e}")
+                self.errors.append(e)
+                failed = e
+            for event in events:
+                if event is not None:
+                    event.error = failed
+                    event.set()
@@ -1,9 +1,11 @@
 from pydantic import BaseModel
-from agents import function_tool, Agent, Runner, trace
+from agents import function_tool, Agent, trace
 import asyncio
 import os
 from dotenv import load_dotenv
 
+from epoch_agent.services import agent_runner
+
 # Load the .env file at startup
 load_dotenv()
 
@@ -71,6 +73,10 @@ example_tool_agent = Agent(
 async def run_example_tool_agent(input: str):
     """
     Run the example tool agent with the provided input.
+
+    Runs go through the shared agent runner, which limits concurrency and request/token rates
+    across all agents (AGENT_CONCURRENCY, AGENT_RPM, AGENT_TPM) and retries rate-limit and other
+    transient errors with backoff. Pass priority=agent_runner.PRIORITY_HIGH for interactive runs.
     
     Args:
         input (str): Input string for the agent.
@@ -81,7 +87,7 @@ async def run_example_tool_agent(input: str):
     with trace("Running example_tool_agent"):
         # Run the agent with the provided input
         # The runner will handle the execution and return the output in the specified format
-        result = await Runner.run(example_tool_agent, input)
+        result = await agent_runner.run(example_tool_agent, input)
         print(f"Agent output: {result}")
         return result
     
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+from agents import Agent, Runner
+
+from epoch_agent.services import agent_runner
+
+REQUEST = httpx.Request('POST', 'https://api.openai.com/v1/responses')
+
+
+def _rate_limited(code=None, retry_after=None):
+    headers = {'retry-after': retry_after} if retry_after else {}
+    response = httpx.Response(429, request=REQUEST, headers=headers)
+    return openai.RateLimitError('rate limited', response=response, body={'code': code})
+
+
+def test_transient_errors_are_retried_with_backoff(monkeypatch):
+    errors = [openai.APIConnectionError(request=REQUEST), _rate_limited(retry_after='0.01')]
+    calls = []
+
+    async def flaky_run(agent, input, **kwargs):
+        calls.append(kwargs['hooks'])
+        if errors:
+            raise errors.pop(0)
+        return 'done'
+
+    monkeypatch.setattr(Runner, 'run', flaky_run)
+    runner = agent_runner.AgentRunner(max_retries=3, backoff_base=0.01)
+    assert asyncio.run(runner.run(Agent(name='a'), 'hi')) == 'done'
+    assert len(calls) == 3
+    assert runner.gate.active == 0
+
+
+@pytest.mark.parametrize('error', [_rate_limited(code='insufficient_quota'), ValueError('bad output')])
+def test_permanent_errors_are_not_retried(monkeypatch, error):
+    calls = []
+
+    async def failing_run(agent, input, **kwargs):
+        calls.append(1)
+        raise error
+
+    monkeypatch.setattr(Runner, 'run', failing_run)
+    runner = agent_runner.AgentRunner(backoff_base=0.01)
+    with pytest.raises(type(error)):
+        asyncio.run(runner.run(Agent(name='a'), 'hi'))
+    assert calls == [1]
+    assert runner.gate.active == 0
+
+
+def test_gate_admits_waiters_by_priority():
+    gate = agent_runner.PriorityGate(1)
+    admitted = []
+
+    async def worker(name, priority):
+        await gate.acquire(priority)
+        admitted.append(name)
+        await asyncio.sleep(0)
+        gate.release()
+
+    async def main():
+        await gate.acquire()
+        tasks = [asyncio.create_task(worker(name, priority))
+                 for name, priority in [('low', 20), ('normal', 10), ('cancelled', 0), ('high', 0)]]
+        await asyncio.sleep(0)
+        tasks[2].cancel()
+        gate.release()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+    assert admitted == ['high', 'normal', 'low']
+    assert gate.active == 0
+
+
+def test_token_bucket_reserves_and_corrects():
+    bucket = agent_runner.TokenBucket(per_minute=600)
+    assert bucket.reserve(600) == 0
+    # empty: the next 60 units take about 6 seconds to refill
+    assert bucket.reserve(60) == pytest.approx(6, abs=0.1)
+    bucket.adjust(60)
+    assert bucket.reserve(30) == pytest.approx(3, abs=0.1)
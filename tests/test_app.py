@@ -1,5 +1,9 @@
+import asyncio
+import json
 import os
 import sqlite3
+import threading
+import time
 import importlib
 
 import pytest
@@ -68,4 +72,234 @@ def test_email_and_review_flow(client, tmp_path, monkeypatch):
 
     # Nonexistent ID -> 404
     resp = client.get('/review/doesnotexist')
-    assert resp.status_code == 404
\ No newline at end of file
+    assert resp.status_code == 404
+
+
+def test_attachment_is_streamed_from_blob_store(client, tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path / 'blobs'))
+    with app_module.SessionLocal() as session:
+        sha256, size = app_module.blobstore.store_attachment(session, b'hello attachment')
+        session.add(app_module.AttachmentORM(
+            message_id='m1', filename='note.txt', content_type='text/plain', sha256=sha256, size=size,
+        ))
+        session.commit()
+
+    listing = client.get('/emails/m1/attachments').json()
+    assert [(a['filename'], a['size']) for a in listing] == [('note.txt', 16)]
+    resp = client.get(f"/attachments/{listing[0]['id']}")
+    assert resp.status_code == 200
+    assert resp.content == b'hello attachment'
+    assert 'note.txt' in resp.headers['content-disposition']
+    assert client.get('/attachments/999').status_code == 404
+
+
+def test_legacy_attachment_with_non_ascii_filename(client):
+    with app_module.SessionLocal() as session:
+        session.add(app_module.AttachmentORM(
+            id=7, message_id='m1', filename='Rechnung_März "Q1".pdf', content_type='application/pdf', data=b'%PDF',
+        ))
+        session.commit()
+
+    resp = client.get('/attachments/7')
+    assert resp.status_code == 200
+    assert resp.content == b'%PDF'
+    assert resp.headers['content-disposition'] == (
+        'attachment; filename="Rechnung_M_rz _Q1_.pdf"; '
+        "filename*=utf-8''Rechnung_M%C3%A4rz%20%22Q1%22.pdf"
+    )
+
+
+def _inbound(i):
+    return {
+        'message_id': f'b{i}',
+        'subject': f'Batch {i}',
+        'sender': 'bulk@example.com',
+        'date': '2025-07-15',
+        'body': 'Hello',
+    }
+
+
+def test_batch_ingest_json_and_ndjson(client):
+    resp = client.post('/emails/batch', json=[_inbound(i) for i in range(3)])
+    assert resp.status_code == 200
+    assert resp.json() == {'inserted': 3, 'duplicates': 0}
+
+    ndjson = '\n'.join(json.dumps(_inbound(i)) for i in range(2, 5))
+    resp = client.post('/emails/batch', content=ndjson, headers={'content-type': 'application/x-ndjson'})
+    assert resp.json() == {'inserted': 2, 'duplicates': 1}
+    assert len(client.get('/all').json()) == 5
+
+    resp = client.post('/emails/batch', json=[{'message_id': 'bad'}])
+    assert resp.status_code == 422
+
+
+def test_buffered_single_ingest(client, monkeypatch):
+    monkeypatch.setenv('INGEST_BUFFER', 'true')
+    with client:
+        for i in range(3):
+            assert client.post('/email', json=_inbound(i)).json() == {'success': True}
+        # acknowledged emails are already committed
+        assert len(client.get('/all').json()) == 3
+        assert client.post('/email', json=_inbound(0)).status_code == 200
+    assert len(client.get('/all').json()) == 3
+
+
+def test_listing_keyset_pages_projection_and_ndjson(client):
+    client.post('/emails/batch', json=[_inbound(i) for i in range(5)])
+
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 2, 'fields': 'message_id,subject'}
+        if cursor:
+            params['cursor'] = cursor
+        resp = client.get('/all', params=params)
+        page = resp.json()
+        assert all(set(e) == {'message_id', 'subject'} for e in page)
+        seen += [e['message_id'] for e in page]
+        cursor = resp.headers.get('x-next-cursor')
+        if not cursor:
+            break
+    assert sorted(seen) == [f'b{i}' for i in range(5)]
+    assert len(seen) == 5
+
+    resp = client.get('/all', params={'format': 'ndjson', 'fields': 'message_id'})
+    assert resp.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert sorted(e['message_id'] for e in lines) == [f'b{i}' for i in range(5)]
+
+    assert client.get('/all', params={'fields': 'password'}).status_code == 400
+    assert client.get('/all', params={'cursor': 'nope'}).status_code == 400
+
+
+def test_process_runs_single_flight_background_job(client, monkeypatch):
+    release = asyncio.Event()
+    calls = []
+
+    async def fake_triage():
+        calls.append(1)
+        await release.wait()
+        return {'path': 'reports/r.md'}
+
+    monkeypatch.setattr(app_module, 'run_email_triage_agent', fake_triage)
+    with client:
+        first = client.post('/process')
+        assert first.status_code == 202
+        second = client.post('/process')
+        assert second.json()['id'] == first.json()['id']
+
+        job_id = first.json()['id']
+        client.portal.call(release.set)
+        for _ in range(50):
+            job = client.get(f'/jobs/{job_id}').json()
+            if job['status'] == 'succeeded':
+                break
+            time.sleep(0.01)
+        assert job['result'] == {'path': 'reports/r.md'}
+        assert calls == [1]
+        assert client.post('/process').json()['id'] != job_id
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_scheduled_fetch_runs_off_the_event_loop(client, monkeypatch):
+    from epoch_agent.services import imap_fetcher
+    release = threading.Event()
+
+    def blocking_fetch():
+        # blocks until the test has been served while the fetch is in progress
+        release.wait(timeout=5)
+        return 2
+
+    async def fake_triage():
+        return {'path': 'reports/r.md'}
+
+    monkeypatch.setattr(imap_fetcher, 'fetch_emails', blocking_fetch)
+    monkeypatch.setattr(app_module, 'run_email_triage_agent', fake_triage)
+    monkeypatch.setenv('FETCH_INTERVAL', '60')
+    monkeypatch.setenv('FETCH_TRIAGE', 'true')
+    with client:
+        assert client.get('/schedule').json()['running']
+        assert client.post('/email', json=_inbound(1)).status_code == 200
+        release.set()
+        for _ in range(100):
+            status = client.get('/schedule').json()
+            if status['runs']:
+                break
+            time.sleep(0.01)
+        assert status['last_result']['fetched'] == 2
+        assert status['last_result']['triage_status'] == 'succeeded'
+        assert status['last_error'] is None
+        assert client.post('/fetch_email').json()['message'] == 'Fetched 2 new emails.'
+
+
+def test_search_endpoint(client):
+    client.post('/emails/batch', json=[
+        {**_inbound(1), 'subject': 'Quarterly invoice'},
+        {**_inbound(2), 'body': 'Nothing to see'},
+    ])
+    hits = client.get('/search', params={'q': 'invoice'}).json()
+    assert [h['message_id'] for h in hits] == ['b1']
+    assert client.get('/search', params={'q': 'invoice', 'processed': 'true'}).json() == []
+    assert client.get('/search', params={'q': '"unterminated'}).status_code == 400
+
+
+def test_metrics_endpoint(client):
+    client.get('/review/missing')
+    body = client.get('/metrics').text
+    assert '# TYPE http_request_seconds histogram' in body
+    assert 'route="/review/{message_id}"' in body
+    assert 'triage_stage_seconds' in body
+
+
+def test_copies_under_another_message_id_are_rejected(client):
+    assert client.post('/email', json=_inbound(1)).json() == {'success': True}
+    copy = {**_inbound(1), 'message_id': '<1@imap.example.com>', 'body': 'Hello\r\n'}
+    assert client.post('/email', json=copy).json() == {'success': True}
+    resp = client.post('/emails/batch', json=[copy, {**copy, 'message_id': 'b1-again'}, _inbound(2)])
+    assert resp.json() == {'inserted': 1, 'duplicates': 2}
+    assert sorted(e['message_id'] for e in client.get('/all').json()) == ['b1', 'b2']
+
+
+def test_archived_emails_stay_reachable(client):
+    from epoch_agent.services import archive
+    client.post('/emails/batch', json=[_inbound(i) for i in range(3)])
+    with app_module.SessionLocal() as session:
+        email = session.get(app_module.EmailORM, 'b1')
+        email.processed, email.processed_at, email.status = True, '2025-01-01T00:00:00', '6 - Newsletters'
+        session.commit()
+
+    assert archive.archive_processed(days=30).emails == 1
+
+    assert [e['message_id'] for e in client.get('/all').json()] == ['b0', 'b2']
+    assert client.get('/review/b1').json()['subject'] == 'Batch 1'
+    assert client.get('/review/missing').status_code == 404
+    assert [h['message_id'] for h in client.get('/search', params={'q': 'batch', 'archived': 'true'}).json()] == ['b1']
+    assert [h['message_id'] for h in client.get('/search', params={'q': 'batch'}).json()] == ['b0', 'b2']
+
+
+def test_archived_attachment_ids_are_not_reused(client, tmp_path, monkeypatch):
+    from epoch_agent.services import archive
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path / 'blobs'))
+    client.post('/emails/batch', json=[_inbound(1), _inbound(2)])
+    with app_module.SessionLocal() as session:
+        email = session.get(app_module.EmailORM, 'b1')
+        email.processed, email.processed_at, email.status = True, '2025-01-01T00:00:00', '5 - Financials'
+        sha256, size = app_module.blobstore.store_attachment(session, b'old invoice')
+        session.add(app_module.AttachmentORM(message_id='b1', filename='old.pdf', sha256=sha256, size=size))
+        session.commit()
+    assert archive.archive_processed(days=30).attachments == 1
+
+    with app_module.SessionLocal() as session:
+        sha256, size = app_module.blobstore.store_attachment(session, b'new invoice')
+        session.add(app_module.AttachmentORM(message_id='b2', filename='new.pdf', sha256=sha256, size=size))
+        session.commit()
+    [old] = client.get('/emails/b1/attachments').json()
+    [new] = client.get('/emails/b2/attachments').json()
+    assert old['id'] != new['id']
+    assert client.get(f"/attachments/{old['id']}").content == b'old invoice'
+    assert client.get(f"/emails/b1/attachments/{old['id']}").content == b'old invoice'
+    assert client.get(f"/emails/b2/attachments/{new['id']}").content == b'new invoice'
+    assert client.get(f"/emails/b2/attachments/{old['id']}").status_code == 404
+
+    assert archive.restore('b1')
+    assert client.get(f"/emails/b1/attachments/{old['id']}").content == b'old invoice'
+    assert client.get(f"/emails/b2/attachments/{new['id']}").content == b'new invoice'
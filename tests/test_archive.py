@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import archive, blobstore, storage
+
+
+@pytest.fixture
+def hot_db(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path / 'blobs'))
+    monkeypatch.delenv('ARCHIVE_DB_FILE', raising=False)
+    storage.configure(str(tmp_path / 'hot.db'))
+    return tmp_path / 'hot.db'
+
+
+def _add(session, mid, processed_at, processed=True, **fields):
+    session.add(triage.EmailORM(
+        message_id=mid, subject=f'Invoice {mid}', sender='billing@example.com', date='', body=f'Amount due for {mid}',
+        received_at='2025-01-01T00:00:00', processed=processed, processed_at=processed_at,
+        status='5 - Financials' if processed else None, **fields,
+    ))
+
+
+def test_archive_moves_old_processed_emails_and_restores_them(hot_db):
+    with triage.SessionLocal() as session:
+        _add(session, 'old', '2025-01-02T00:00:00', html_body='<p>Pay by <b>Friday</b></p>')
+        _add(session, 'recent', '2999-01-01T00:00:00')
+        _add(session, 'unprocessed', None, processed=False)
+        sha256, size = blobstore.store_attachment(session, b'%PDF')
+        session.add(triage.AttachmentORM(message_id='old', filename='invoice.pdf', sha256=sha256, size=size))
+        session.commit()
+        attachment_id = session.query(triage.AttachmentORM).one().id
+
+    result = archive.archive_processed(days=30)
+
+    assert (result.emails, result.attachments) == (1, 1)
+    assert archive.archive_path() == str(hot_db.parent / 'hot.archive.db')
+    with triage.SessionLocal() as session:
+        assert sorted(e.message_id for e in session.query(triage.EmailORM)) == ['recent', 'unprocessed']
+        assert session.query(triage.AttachmentORM).count() == 0
+        # the archived attachment row still holds its blob
+        assert session.get(triage.BlobORM, sha256).refcount == 1
+    conn = sqlite3.connect(hot_db)
+    assert conn.execute('PRAGMA auto_vacuum').fetchone() == (2,)
+    assert conn.execute('PRAGMA freelist_count').fetchone() == (0,)
+    conn.close()
+
+    email = archive.get_email('old')
+    assert (email['status'], email['html_body']) == ('5 - Financials', '<p>Pay by <b>Friday</b></p>')
+    assert [a.id for a in archive.list_attachments('old')] == [attachment_id]
+    assert archive.get_attachment(attachment_id).sha256 == sha256
+    assert [hit.message_id for hit in archive.search('friday')] == ['old']
+    # a second run finds nothing left to move
+    assert archive.archive_processed(days=30).emails == 0
+
+    assert archive.restore('old')
+    assert archive.get_email('old') is None
+    assert archive.search('friday') == []
+    with triage.SessionLocal() as session:
+        restored = session.get(triage.EmailORM, 'old')
+        assert (restored.status, restored.html_body) == ('5 - Financials', '<p>Pay by <b>Friday</b></p>')
+        assert session.get(triage.AttachmentORM, attachment_id).sha256 == sha256
+    assert not archive.restore('old')
+
+
+def test_restore_keeps_attachments_whose_id_was_reused(hot_db):
+    with triage.SessionLocal() as session:
+        _add(session, 'old', '2025-01-02T00:00:00')
+        session.add(triage.AttachmentORM(id=1, message_id='old', filename='old.txt', data=b'old'))
+        session.commit()
+    archive.archive_processed(days=30)
+    # an id handed out again by a database that did not reserve archived ids yet
+    with triage.SessionLocal() as session:
+        session.execute(triage.AttachmentORM.__table__.delete())
+        session.add(triage.AttachmentORM(id=1, message_id='other', filename='new.txt', data=b'new'))
+        session.commit()
+
+    assert archive.get_attachment(1, 'other') is None
+    assert archive.restore('old')
+    with triage.SessionLocal() as session:
+        rows = {a.message_id: (a.id, a.data) for a in session.query(triage.AttachmentORM)}
+    assert rows['other'] == (1, b'new')
+    assert rows['old'][0] != 1 and rows['old'][1] == b'old'
+    assert archive.list_attachments('old') == []
@@ -0,0 +1,56 @@
+import asyncio
+
+from agents import Agent, Runner, function_tool
+
+from benchmarks import run
+from benchmarks.corpus import generate_corpus
+from benchmarks.stub_model import StubModel, _emails_in, stub_tag
+
+
+def test_corpus_is_reproducible():
+    assert generate_corpus(20, seed=3) == generate_corpus(20, seed=3)
+    assert generate_corpus(20, seed=3) != generate_corpus(20, seed=4)
+
+
+def test_stub_model_reads_tool_output_and_tags():
+    output = "emails=[Email(message_id='m1', subject='Your receipt #1', body='Thanks')]"
+    emails = _emails_in([{'type': 'function_call_output', 'output': output}])
+    assert emails == [{'message_id': 'm1', 'subject': 'Your receipt #1', 'body': 'Thanks'}]
+    assert stub_tag(emails[0]['subject'], emails[0]['body']) == '5 - Financials'
+
+
+def test_stub_model_streams_offline():
+    @function_tool
+    def get_unprocessed_emails() -> str:
+        """Returns the unprocessed emails."""
+        return "emails=[Email(message_id='m1', subject='Weekly digest', body='News')]"
+
+    agent = Agent(name='stub_stream', model=StubModel(), tools=[get_unprocessed_emails])
+
+    async def stream():
+        result = Runner.run_streamed(agent, 'Triage')
+        async for _ in result.stream_events():
+            pass
+        return result.final_output
+
+    assert '"status": "6 - Newsletters"' in asyncio.run(stream())
+
+
+def test_fetch_benchmark_against_fake_imap_server():
+    result = run.measured(run.bench_fetch, 15)
+    assert result['fetch_msgs_per_s'] > 0
+    assert result['parse_msgs_per_s'] > 0
+    assert result['peak_mb'] > 0
+
+
+def test_triage_benchmark_with_stub_model():
+    result = run.measured(run.bench_triage, 30, 10, 0.0)
+    assert result['model_calls_30'] == 3
+    assert result['latency_s_30'] > 0
+
+
+def test_compare_flags_regressions_by_direction():
+    results = {'ingest': {'email_req_per_s': 70.0, 'peak_mb': 10.0}, 'triage': {'latency_s_50': 1.3}}
+    baseline = {'ingest': {'email_req_per_s': 100.0, 'peak_mb': 12.0}, 'triage': {'latency_s_50': 1.0}}
+    rows = {name: regressed for name, *_, regressed in run.compare(results, baseline, 0.2)}
+    assert rows == {'ingest.email_req_per_s': True, 'ingest.peak_mb': False, 'triage.latency_s_50': True}
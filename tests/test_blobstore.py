@@ -0,0 +1,65 @@
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import blobstore
+
+
+def _session():
+    engine = create_engine('sqlite:///:memory:')
+    triage.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_identical_attachments_are_stored_once(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path))
+    session = _session()
+    sha_a, size = blobstore.store_attachment(session, b'%PDF-1.4 invoice')
+    sha_b, _ = blobstore.store_attachment(session, b'%PDF-1.4 invoice')
+    session.commit()
+
+    assert sha_a == sha_b and size == 16
+    assert session.get(triage.BlobORM, sha_a).refcount == 2
+    with open(blobstore.blob_path(sha_a), 'rb') as f:
+        assert f.read() == b'%PDF-1.4 invoice'
+    assert len([f for _, _, files in os.walk(tmp_path) for f in files]) == 1
+
+    blobstore.release(session, sha_a)
+    assert blobstore.gc(session) == 0
+    blobstore.release(session, sha_a)
+    assert blobstore.gc(session) == 1
+    assert not os.path.exists(blobstore.blob_path(sha_a))
+
+
+def test_migrate_moves_inline_bytes_out_of_the_database(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path))
+    session = _session()
+    for i in range(3):
+        session.add(triage.AttachmentORM(message_id=f'm{i}', filename='a.txt', content_type='text/plain', data=b'same'))
+    session.commit()
+
+    assert blobstore.migrate_attachments(session, batch_size=2) == 3
+    rows = session.query(triage.AttachmentORM).all()
+    assert all(r.data is None and r.size == 4 for r in rows)
+    assert len({r.sha256 for r in rows}) == 1
+    assert session.get(triage.BlobORM, rows[0].sha256).refcount == 3
+
+
+def test_gc_sweeps_files_without_a_row(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path))
+    session = _session()
+    kept, _ = blobstore.store_attachment(session, b'kept')
+    session.commit()
+    orphan, _ = blobstore.store_attachment(session, b'rolled back')
+    session.rollback()
+    fresh, _ = blobstore.put(b'not committed yet')
+
+    old = os.path.getmtime(blobstore.blob_path(fresh)) - 2 * blobstore.ORPHAN_MIN_AGE
+    for sha256 in (kept, orphan):
+        os.utime(blobstore.blob_path(sha256), (old, old))
+
+    assert blobstore.gc(session) == 1
+    assert not os.path.exists(blobstore.blob_path(orphan))
+    assert os.path.exists(blobstore.blob_path(kept)) and os.path.exists(blobstore.blob_path(fresh))
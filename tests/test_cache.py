@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import cache
+
+
+def _session():
+    engine = create_engine('sqlite:///:memory:')
+    triage.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_fingerprint_ignores_volatile_content():
+    a = cache.fingerprint('Shop <orders@shop.com>', 'Order 1234 shipped', 'Track at https://t.co/x?id=1\nOrder 1234')
+    b = cache.fingerprint('orders@shop.com', 'RE: Order 9876 shipped', 'Track at https://t.co/y?id=2\nOrder  9876')
+    c = cache.fingerprint('other@shop.com', 'Order 1234 shipped', 'Track at https://t.co/x?id=1\nOrder 1234')
+    assert a == b
+    assert a != c
+
+
+def test_store_lookup_and_eviction(monkeypatch):
+    monkeypatch.setenv('CACHE_MAX_ENTRIES', '2')
+    session = _session()
+    cache.store(session, {'fp1': ('5 - Financials', 'Receipt'), 'fp2': ('2 - Review', 'Unsure')})
+    assert set(cache.lookup(session, ['fp1', 'fp2'])) == {'fp1'}
+
+    cache.store(session, {'fp3': ('6 - Newsletters', 'Digest')})
+    cache.store(session, {'fp4': ('6 - Newsletters', 'Digest')})
+    # fp1 was used before fp3 and fp4 were added, so it is the least recently used
+    assert set(cache.lookup(session, ['fp1', 'fp3', 'fp4'])) == {'fp3', 'fp4'}
+
+
+def test_expired_entries_are_ignored(monkeypatch):
+    session = _session()
+    cache.store(session, {'fp1': ('5 - Financials', 'Receipt')})
+    entry = session.get(triage.ClassificationCacheORM, 'fp1')
+    entry.created_at = (datetime.utcnow() - timedelta(days=31)).isoformat()
+    session.commit()
+    assert cache.lookup(session, ['fp1']) == {}
+    assert cache.evict(session) == 1
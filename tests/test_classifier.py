@@ -0,0 +1,52 @@
+import os
+
+from epoch_agent.services.classifier import CentroidClassifier, email_tokens
+
+
+def _examples():
+    return [
+        (email_tokens('billing@bank.com', 'Monthly statement', 'Your balance is due'), '5 - Financials'),
+        (email_tokens('billing@bank.com', 'Payment receipt', 'Thanks for your payment'), '5 - Financials'),
+        (email_tokens('digest@news.io', 'Weekly digest', 'Top stories this week'), '6 - Newsletters'),
+        (email_tokens('digest@news.io', 'Weekly digest #2', 'More stories'), '6 - Newsletters'),
+    ]
+
+
+def test_centroid_classifier_predicts_nearest_tag():
+    model = CentroidClassifier()
+    model.partial_fit(_examples())
+    assert model.n_examples == 4
+    (label, confidence), = model.predict([email_tokens('billing@bank.com', 'Statement', 'balance due')])
+    assert label == '5 - Financials'
+    assert 0.5 < confidence <= 1.0
+
+
+def test_centroid_classifier_round_trip(tmp_path):
+    model = CentroidClassifier()
+    model.partial_fit(_examples())
+    model.trained_until = '2025-07-15T00:00:00'
+    # saved to exactly the configured path, even without the .npz suffix
+    path = str(tmp_path / 'model')
+    model.save(path)
+
+    loaded = CentroidClassifier.load(path)
+    assert os.listdir(tmp_path) == ['model']
+    assert loaded.n_examples == model.n_examples
+    assert loaded.labels == model.labels
+    assert loaded.trained_until == '2025-07-15T00:00:00'
+    doc = [email_tokens('digest@news.io', 'Weekly digest', '')]
+    assert loaded.predict(doc) == model.predict(doc)
+
+
+def test_untrained_classifier_predicts_nothing():
+    assert CentroidClassifier().predict([email_tokens('a@b.c', 'hi', '')]) == []
+
+
+def test_incremental_fit_matches_single_fit():
+    whole, split = CentroidClassifier(), CentroidClassifier()
+    whole.partial_fit(_examples())
+    split.partial_fit(_examples()[:1])
+    split.partial_fit(_examples()[1:])
+    assert (whole.sums == split.sums).all() and (whole.doc_freq == split.doc_freq).all()
+    doc = [email_tokens('billing@bank.com', 'Statement', 'balance due')]
+    assert whole.predict(doc) == split.predict(doc)
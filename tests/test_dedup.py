@@ -0,0 +1,52 @@
+from sqlalchemy.orm import sessionmaker
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import blobstore, dedup, storage
+
+
+def _session(tmp_path):
+    engine = storage.make_engine(str(tmp_path / 'dedup.db'))
+    storage.ensure_schema(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_content_hash_matches_worker_and_imap_copies():
+    worker = dedup.content_hash('bob@example.com', 'Lunch  tomorrow?', '2025-07-15T09:00:00+00:00',
+                                'Are you free\r\nat noon?\r\n')
+    imap = dedup.content_hash('Bob Jones <Bob@Example.com>', 'Lunch tomorrow?', 'Tue, 15 Jul 2025 11:00:00 +0200',
+                              'Are you free\nat noon?')
+    assert worker == imap
+    # HTML-only messages: the Worker posts the markup, the fetcher stores it as html_body
+    html = '<html><body><p>Big <b>sale</b></p></body></html>'
+    assert dedup.content_hash('shop@x.com', 'Sale', '', html) == dedup.content_hash('shop@x.com', 'Sale', '', None, html)
+    # unlike the cache fingerprint, numbers matter
+    assert dedup.content_hash('shop@x.com', 'Receipt', '', 'Total 10') != dedup.content_hash('shop@x.com', 'Receipt', '', 'Total 12')
+
+
+def _add(session, mid, received_at, body='Same body', **fields):
+    session.add(triage.EmailORM(
+        message_id=mid, subject='Invoice', sender='billing@example.com', date='Tue, 15 Jul 2025 10:00:00 +0000',
+        body=body, received_at=received_at, **{'processed': False, **fields},
+    ))
+
+
+def test_backfill_collapses_existing_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path / 'blobs'))
+    session = _session(tmp_path)
+    _add(session, 'worker-1', '2025-07-15T10:00:01')
+    _add(session, '<7@imap.example.com>', '2025-07-15T10:05:00', html_body='<p>Same body</p>',
+         processed=True, status='5 - Financials', tagged_by='agent')
+    _add(session, 'other', '2025-07-15T10:06:00', body='Different body')
+    sha256, size = blobstore.store_attachment(session, b'%PDF')
+    session.add(triage.AttachmentORM(message_id='<7@imap.example.com>', filename='invoice.pdf', sha256=sha256, size=size))
+    session.commit()
+
+    result = dedup.backfill(session, batch_size=2)
+
+    assert result == dedup.BackfillResult(hashed=2, collapsed=1)
+    assert sorted(e.message_id for e in session.query(triage.EmailORM)) == ['other', 'worker-1']
+    keeper = session.get(triage.EmailORM, 'worker-1')
+    assert (keeper.processed, keeper.status, keeper.html_body) == (True, '5 - Financials', '<p>Same body</p>')
+    assert [a.message_id for a in session.query(triage.AttachmentORM)] == ['worker-1']
+    assert dedup.find_existing(session, [keeper.content_hash]) == {keeper.content_hash: 'worker-1'}
+    assert dedup.backfill(session) == dedup.BackfillResult()
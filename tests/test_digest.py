@@ -0,0 +1,48 @@
+from epoch_agent.services.digest import build_digest, html_to_text, strip_quoted, strip_signature
+
+
+def test_html_to_text_drops_markup_and_styles():
+    html = '<html><head><style>p {color: red}</style></head><body><p>Hi&nbsp;there</p><p>Line 2</p></body></html>'
+    text = html_to_text(html)
+    assert 'color' not in text
+    assert 'Hi\xa0there' in text and 'Line 2' in text
+
+
+def test_strip_quoted_and_signature():
+    body = 'Sounds good.\n\nOn Mon, Jul 14, 2025 at 9:00 AM Alice <a@x.com> wrote:\n> old text\n> more'
+    assert strip_quoted(body).strip() == 'Sounds good.'
+    assert strip_quoted('> quoted\nreply') == 'reply'
+    assert strip_signature('Thanks\n-- \nBob\n555-1234') == 'Thanks'
+    assert strip_signature('Thanks\nSent from my iPhone') == 'Thanks'
+
+
+def test_strip_quoted_keeps_forwarded_messages():
+    body = (
+        'FYI, can you handle this?\n\n---------- Forwarded message ---------\nFrom: Billing <b@x.com>\n'
+        'Date: Mon, Jul 14, 2025\nSubject: Invoice\nTo: me@x.com\n\nYour invoice is 30 days overdue.'
+    )
+    digest = build_digest(body)
+    assert digest.startswith('FYI, can you handle this?')
+    assert 'From: Billing <b@x.com>' in digest
+    assert digest.endswith('Your invoice is 30 days overdue.')
+
+
+def test_strip_quoted_cuts_at_from_only_before_a_header_block():
+    body = 'Agenda for Friday.\nFrom: 9am to 5pm we meet in room 4\nBring your laptop.'
+    assert strip_quoted(body) == body
+    reply = 'Approved.\n\nFrom: Alice <a@x.com>\nSent: Monday, July 14, 2025 9:00 AM\nTo: Bob\nSubject: Budget\n\nOld text'
+    assert strip_quoted(reply).strip() == 'Approved.'
+
+
+def test_build_digest_uses_html_and_truncates():
+    html = '<p>Your order <a href="https://t.example.com/c?id=123&utm=abc">shipped</a> https://t.example.com/c?id=123</p>'
+    assert build_digest('', html) == 'Your order shipped https://t.example.com/c'
+    digest = build_digest('word ' * 1000, max_tokens=10)
+    assert len(digest) <= 10 * 4 + len(' [...]')
+    assert digest.endswith('[...]')
+
+
+def test_build_digest_converts_markup_posted_as_body():
+    body = '<html><head><style>p {color: red}</style></head><body><p>Big sale</p><p>Today only</p></body></html>'
+    assert build_digest(body) == 'Big sale\n\nToday only'
+    assert build_digest('<3 plain text stays') == '<3 plain text stays'
@@ -1,17 +1,23 @@
+import asyncio
 import os
+from types import SimpleNamespace
 import pytest
 import tempfile
+import threading
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 import epoch_agent.email_triage_agent as triage
 
 
 @pytest.fixture(autouse=True)
-def in_memory_db(monkeypatch):
+def in_memory_db(monkeypatch, tmp_path):
+    monkeypatch.setenv('CLASSIFIER_PATH', str(tmp_path / 'classifier.npz'))
     # Configure an in-memory SQLite database for testing
-    engine = create_engine('sqlite:///:memory:', connect_args={"check_same_thread": False})
+    # one shared connection: triage runs its database stages in worker threads
+    engine = create_engine('sqlite:///:memory:', connect_args={"check_same_thread": False}, poolclass=StaticPool)
     SessionLocal = sessionmaker(bind=engine)
     # Monkeypatch ORM engine and session
     triage.engine = engine
@@ -42,7 +48,7 @@ def test_get_and_mark_unprocessed_emails(in_memory_db):
 
     # Mark the email as processed with a status tag
     status = triage.EmailStatus(message_id='id1', status='! - Bob')
-    result = triage.mark_emails_processed([status])
+    result = triage.mark_emails_processed(triage.TriageResult(emails=[status], summary='One urgent email.'))
     assert result.success
 
     # After processing, it should not appear in unprocessed list
@@ -59,9 +65,289 @@ def test_get_and_mark_unprocessed_emails(in_memory_db):
 def test_save_report(tmp_path, monkeypatch):
     # Use a temporary directory for reports
     monkeypatch.setenv('REPORT_DIR', str(tmp_path))
-    content = '# Sample Report'
-    output = triage.save_report(content)
+    result = triage.TriageResult(
+        emails=[triage.EmailStatus(message_id='id1', status='5 - Financials', summary='Invoice due')],
+        summary='One invoice.',
+    )
+    output = triage.save_report(result)
     assert output.success
-    report_path = tmp_path / output.path.name
+    report_path = tmp_path / os.path.basename(output.path)
     assert report_path.exists()
-    assert report_path.read_text(encoding='utf-8') == content
\ No newline at end of file
+    assert report_path.read_text(encoding='utf-8') == triage.render_report(result)
+
+
+def test_render_report_groups_by_tag():
+    result = triage.TriageResult(
+        emails=[
+            triage.EmailStatus(message_id='a', status='6 - Newsletters', summary='Weekly digest'),
+            triage.EmailStatus(message_id='b', status='! - Bob', summary='Server down'),
+            triage.EmailStatus(message_id='c', status='6 - Newsletters'),
+        ],
+        summary='Three emails.',
+    )
+    emails = {'b': triage.Email(message_id='b', subject='Alert', sender='ops@x.com', date='', body='')}
+    report = triage.render_report(result, emails)
+    assert report.index('## ! - Bob (1)') < report.index('## 6 - Newsletters (2)')
+    assert '- **Alert** (ops@x.com): Server down' in report
+    assert '- `a`: Weekly digest' in report
+    assert '- `c`\n' in report
+
+def test_chunk_emails_respects_size_and_token_budget():
+    emails = [
+        triage.Email(message_id=f'id{i}', subject='s', sender='a@b.c', date='d', body='x' * 400)
+        for i in range(5)
+    ]
+    assert [len(b) for b in triage.chunk_emails(emails, 2, 10000)] == [2, 2, 1]
+    # each email is ~100 tokens, so a 250 token budget fits two per batch
+    assert [len(b) for b in triage.chunk_emails(emails, 10, 250)] == [2, 2, 1]
+    # oversized emails still get a batch of their own
+    assert [len(b) for b in triage.chunk_emails(emails, 10, 1)] == [1, 1, 1, 1, 1]
+
+
+def test_batched_triage_merges_batches(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    session = in_memory_db()
+    for i in range(5):
+        session.add(triage.EmailORM(
+            message_id=f'id{i}', subject=f'Subject {i}', sender='a@b.c',
+            date='2025-07-15', body='Hello', received_at='2025-07-15T00:00:00',
+        ))
+    session.commit()
+
+    calls = []
+
+    async def fake_run(agent, input_data, **kwargs):
+        batch = triage.EmailList.model_validate_json(input_data).emails
+        calls.append(len(batch))
+        if batch[0].message_id == 'id4':
+            raise RuntimeError('model error')
+        output = triage.TriageResult(
+            emails=[triage.EmailStatus(message_id=e.message_id, status='5 - Financials', summary='Receipt')
+                    for e in batch],
+            summary=f'{len(batch)} receipts.',
+        )
+        return SimpleNamespace(final_output=output)
+
+    monkeypatch.setattr(triage.Runner, 'run', fake_run)
+    output = asyncio.run(triage.run_email_triage_agent(batch_size=2, concurrency=2))
+
+    assert output.success
+    assert sorted(calls) == [1, 2, 2]
+    report = open(output.path, encoding='utf-8').read()
+    assert '## 5 - Financials (4)' in report
+    assert '**Subject 0** (a@b.c): Receipt' in report
+    # the failed batch is left for the next run
+    assert [e.message_id for e in triage.get_unprocessed_emails().emails] == ['id4']
+
+
+def test_get_unprocessed_emails_serves_digest(in_memory_db):
+    session = in_memory_db()
+    session.add(triage.EmailORM(
+        message_id='id1', subject='Re: plan', sender='a@b.c', date='2025-07-15',
+        body='Sounds good.\n> quoted history', digest='Sounds good.', received_at='2025-07-15T00:00:00',
+    ))
+    session.commit()
+    assert triage.get_unprocessed_emails().emails[0].body == 'Sounds good.'
+    assert triage.get_unprocessed_emails(use_digest=False).emails[0].body.endswith('quoted history')
+
+
+def test_fast_path_tags_matches_before_agent(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    monkeypatch.setattr(triage.rules, 'stats', triage.rules.FastPathStats())
+    session = in_memory_db()
+    triage.rules.add_rule(session, 'domain', 'stripe.com', '5 - Financials')
+    session.add(triage.EmailORM(
+        message_id='r1', subject='Receipt', sender='Stripe <receipts@stripe.com>',
+        date='2025-07-15', body='Paid', received_at='2025-07-15T00:00:00',
+    ))
+    session.commit()
+
+    async def fail_run(agent, input_data, **kwargs):
+        raise AssertionError('agent should not run')
+
+    monkeypatch.setattr(triage.Runner, 'run', fail_run)
+    output = asyncio.run(triage.run_email_triage_agent())
+
+    assert output.success
+    assert session.get(triage.EmailORM, 'r1').status == '5 - Financials'
+    assert triage.rules.stats.llm_classifications_saved == 1
+    assert triage.rules.stats.agent_runs_skipped == 1
+
+
+def test_triage_run_keeps_database_stages_off_the_event_loop(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    in_memory_db()
+    threads = {}
+    for name in ('claim_emails', 'triage_locally', 'finish_triage', 'release_lease'):
+        def record(*args, _name=name, _func=getattr(triage, name), **kwargs):
+            threads[_name] = threading.current_thread()
+            return _func(*args, **kwargs)
+        monkeypatch.setattr(triage, name, record)
+
+    asyncio.run(triage.run_email_triage_agent())
+    assert set(threads) == {'claim_emails', 'triage_locally', 'finish_triage', 'release_lease'}
+    assert threading.main_thread() not in threads.values()
+
+
+def test_local_classifier_tags_confident_emails(in_memory_db, monkeypatch):
+    monkeypatch.setenv('CLASSIFIER_MIN_EXAMPLES', '4')
+    session = in_memory_db()
+    history = [
+        ('h1', 'billing@bank.com', 'Your statement is ready', '5 - Financials'),
+        ('h2', 'billing@bank.com', 'Statement available', '5 - Financials'),
+        ('h3', 'digest@news.io', 'This week in Python', '6 - Newsletters'),
+        ('h4', 'digest@news.io', 'This week in Rust', '6 - Newsletters'),
+    ]
+    for i, (mid, sender, subject, status) in enumerate(history):
+        session.add(triage.EmailORM(
+            message_id=mid, subject=subject, sender=sender, date='', body=subject,
+            received_at='', processed=True, processed_at=f'2025-07-15T00:00:0{i}', status=status,
+        ))
+    session.add(triage.EmailORM(
+        message_id='new1', subject='Your statement is ready', sender='billing@bank.com', date='', body='',
+        received_at='',
+    ))
+    session.commit()
+
+    result = triage.apply_local_classifier(threshold=0.5)
+    assert [(u.message_id, u.status) for u in result.emails] == [('new1', '5 - Financials')]
+    assert session.get(triage.EmailORM, 'new1').tagged_by == 'classifier'
+
+
+def test_classification_cache_skips_repeat_emails(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    monkeypatch.setattr(triage.rules, 'stats', triage.rules.FastPathStats())
+    session = in_memory_db()
+    calls = []
+
+    async def fake_run(agent, input_data, **kwargs):
+        calls.append(input_data)
+        emails = triage.get_unprocessed_emails(lease_token=kwargs['context'].lease_token).emails
+        return SimpleNamespace(final_output=triage.TriageResult(
+            emails=[triage.EmailStatus(message_id=e.message_id, status='6 - Newsletters', summary='Weekly news')
+                    for e in emails],
+            summary='News.',
+        ))
+
+    monkeypatch.setattr(triage.Runner, 'run', fake_run)
+    for mid, issue in (('n1', 41), ('n2', 42)):
+        session.add(triage.EmailORM(
+            message_id=mid, subject=f'Weekly issue #{issue}', sender='news@weekly.io',
+            date='', body=f'Issue {issue} of the weekly', received_at='',
+        ))
+        session.commit()
+        asyncio.run(triage.run_email_triage_agent())
+
+    assert len(calls) == 1
+    assert session.get(triage.EmailORM, 'n2').status == '6 - Newsletters'
+    assert session.get(triage.EmailORM, 'n2').tagged_by == 'cache'
+    # the cache, not the fast-path rules, made the second agent run unnecessary
+    assert triage.rules.stats.agent_runs_skipped == 0
+
+
+def test_thread_mode_triages_newest_message_once(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    session = in_memory_db()
+    chain = [
+        ('<a@x>', None, None, 'Project plan'),
+        ('<b@x>', '<a@x>', '<a@x>', 'Re: Project plan'),
+        ('<c@x>', '<b@x>', '<a@x> <b@x>', 'Re: Project plan'),
+    ]
+    for i, (mid, irt, refs, subject) in enumerate(chain):
+        session.add(triage.EmailORM(
+            message_id=mid, subject=subject, sender='alice@x.com', date=f'day {i}', body='Latest reply',
+            received_at=f'2025-07-15T00:00:0{i}', in_reply_to=irt, references=refs,
+            thread_id=triage.threads.thread_id_for(session, mid, irt, refs),
+        ))
+        session.commit()
+    session.add(triage.EmailORM(
+        message_id='<solo@x>', subject='Other', sender='bob@x.com', date='', body='Hi',
+        received_at='2025-07-15T00:00:09', thread_id='<solo@x>',
+    ))
+    session.commit()
+    assert {e.thread_id for e in session.query(triage.EmailORM)} == {'<a@x>', '<solo@x>'}
+
+    seen = []
+
+    async def fake_run(agent, input_data, **kwargs):
+        context = kwargs['context']
+        emails = triage.get_unprocessed_emails(by_thread=context.by_thread, lease_token=context.lease_token).emails
+        seen.extend(emails)
+        return SimpleNamespace(final_output=triage.TriageResult(
+            emails=[triage.EmailStatus(message_id=e.message_id, status='1 - To Respond', summary='Reply')
+                    for e in emails],
+            summary='Two threads.',
+        ))
+
+    monkeypatch.setattr(triage.Runner, 'run', fake_run)
+    asyncio.run(triage.run_email_triage_agent(by_thread=True))
+
+    assert sorted(e.message_id for e in seen) == ['<c@x>', '<solo@x>']
+    thread_email = next(e for e in seen if e.message_id == '<c@x>')
+    assert thread_email.body.startswith('[Thread context: 2 earlier unprocessed message(s)]')
+    assert all(e.processed and e.status == '1 - To Respond' for e in session.query(triage.EmailORM))
+
+
+def test_claims_lease_rows_to_one_worker(in_memory_db):
+    session = in_memory_db()
+    for i in range(3):
+        session.add(triage.EmailORM(
+            message_id=f'id{i}', subject='S', sender='a@b.c', date='', body='Hi',
+            received_at=f'2025-07-15T00:00:0{i}',
+        ))
+    session.commit()
+
+    token_a, claimed_a = triage.claim_emails(limit=2)
+    token_b, claimed_b = triage.claim_emails()
+    assert (claimed_a, claimed_b) == (2, 1)
+    assert [e.message_id for e in triage.get_unprocessed_emails(lease_token=token_a).emails] == ['id0', 'id1']
+    assert triage.get_unprocessed_emails().emails == []
+
+    # a worker can only finalize the rows it holds
+    update = triage.TriageResult(
+        emails=[triage.EmailStatus(message_id='id0', status='5 - Financials')], summary='',
+    )
+    triage.mark_emails_processed(update, lease_token=token_b)
+    assert not session.get(triage.EmailORM, 'id0').processed
+    triage.mark_emails_processed(update, lease_token=token_a)
+    session.expire_all()
+    assert session.get(triage.EmailORM, 'id0').processed
+
+    # expired leases go back to the pool
+    session.get(triage.EmailORM, 'id1').lease_expires_at = '2000-01-01T00:00:00'
+    session.commit()
+    token_c, claimed_c = triage.claim_emails()
+    assert claimed_c == 1
+    assert triage.release_lease(token_b) == 1
+    assert [e.message_id for e in triage.get_unprocessed_emails().emails] == ['id2']
+
+
+def test_run_profile_records_stages_and_tokens(in_memory_db, tmp_path, monkeypatch):
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    monkeypatch.setenv('TRIAGE_PROFILE', 'true')
+    session = in_memory_db()
+    session.add(triage.EmailORM(
+        message_id='p1', subject='Hello', sender='a@b.c', date='', body='Hi', received_at='',
+    ))
+    session.commit()
+
+    async def fake_run(agent, input_data, **kwargs):
+        hooks = kwargs['hooks']
+        await hooks.on_llm_start(None, agent, None, [])
+        await hooks.on_llm_end(None, agent, SimpleNamespace(usage=SimpleNamespace(input_tokens=120, output_tokens=30)))
+        return SimpleNamespace(final_output=triage.TriageResult(
+            emails=[triage.EmailStatus(message_id='p1', status='1 - To Respond', summary='Say hi')], summary='One.',
+        ))
+
+    monkeypatch.setattr(triage.Runner, 'run', fake_run)
+    tokens_before = triage.metrics.AGENT_TOKENS.value(agent='email_triage_agent', direction='input')
+    output = asyncio.run(triage.run_email_triage_agent())
+
+    profile = triage.metrics.RunProfile.model_validate_json(
+        open(os.path.splitext(output.path)[0] + '.profile.json', encoding='utf-8').read()
+    )
+    assert profile.emails == 1
+    assert (profile.agent_runs, profile.model_calls) == (1, 1)
+    assert (profile.input_tokens, profile.output_tokens) == (120, 30)
+    assert {'claim', 'read_unprocessed', 'agent', 'mark_processed', 'save_report'} <= set(profile.stages)
+    assert triage.metrics.AGENT_TOKENS.value(agent='email_triage_agent', direction='input') == tokens_before + 120
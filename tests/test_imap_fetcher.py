@@ -0,0 +1,285 @@
+import json
+from email import message_from_bytes
+from email.message import EmailMessage
+from email.policy import default
+
+import threading
+
+import pytest
+from imapclient.response_types import BodyData
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import blobstore, dedup, imap_fetcher
+
+
+def make_raw(n, subject='Hello'):
+    msg = EmailMessage()
+    msg['Message-ID'] = f'<m{n}@example.com>'
+    msg['Subject'] = f'{subject} {n}'
+    msg['From'] = 'alice@example.com'
+    msg['Date'] = 'Tue, 15 Jul 2025 10:00:00 +0000'
+    msg.set_content(f'Body {n}')
+    return msg.as_bytes()
+
+
+def bodystructure(msg):
+    """Builds the BODYSTRUCTURE an IMAP server would report for msg."""
+    if msg.is_multipart():
+        parts = [bodystructure(p) for p in msg.get_payload()]
+        return BodyData((parts, msg.get_content_subtype().upper().encode(), None, None, None, None))
+    maintype, subtype = msg.get_content_type().upper().encode().split(b'/')
+    params = (b'CHARSET', msg.get_content_charset().encode()) if msg.get_content_charset() else None
+    encoding = (msg.get('Content-Transfer-Encoding') or '7bit').upper().encode()
+    payload = msg.get_payload().encode()
+    disposition = None
+    if msg.get_content_disposition() == 'attachment':
+        disposition = (b'ATTACHMENT', (b'FILENAME', msg.get_filename().encode()))
+    if maintype == b'TEXT':
+        return BodyData((maintype, subtype, params, None, None, encoding, len(payload), payload.count(b'\n'),
+                         None, disposition, None, None))
+    return BodyData((maintype, subtype, params, None, None, encoding, len(payload), None, disposition, None, None))
+
+
+def section_payload(msg, section):
+    """Returns the encoded payload of an IMAP body section ("1", "2.1", ...)."""
+    for index in section.split('.'):
+        if msg.is_multipart():
+            msg = msg.get_payload()[int(index) - 1]
+    return msg.get_payload().encode()
+
+
+class FakeIMAP:
+    """Minimal stand-in for IMAPClient serving an in-memory folder."""
+    uidvalidity = 1
+    messages: dict = {}
+    searches: list = []
+    fetched: list = []
+
+    def __init__(self, host, port=None, ssl=True):
+        self.host = host
+        self.folder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, user, password):
+        pass
+
+    def has_capability(self, capability):
+        return capability == 'IDLE'
+
+    def idle(self):
+        pass
+
+    def idle_check(self, timeout=None):
+        return FakeIMAP.on_idle()
+
+    def idle_done(self):
+        return None, []
+
+    def _box(self):
+        return FakeIMAP.mailboxes.get((self.host, self.folder), FakeIMAP.messages)
+
+    def select_folder(self, folder, readonly=False):
+        self.folder = folder
+        return {b'UIDVALIDITY': self.uidvalidity, b'UIDNEXT': max(self._box(), default=0) + 1}
+
+    def search(self, criteria):
+        FakeIMAP.searches.append(criteria)
+        box = self._box()
+        if criteria[0] == 'UID':
+            start = int(criteria[1].split(':')[0])
+            # like a real server, "N:*" includes the newest message even below N
+            return sorted({uid for uid in box if uid >= start} | {max(box)})
+        return sorted(box)
+
+    def fetch(self, uids, items):
+        response = {}
+        box = self._box()
+        for uid in uids:
+            msg = message_from_bytes(box[uid], policy=default)
+            data = {}
+            for item in items:
+                if item == 'RFC822':
+                    data[b'RFC822'] = box[uid]
+                elif item == 'BODYSTRUCTURE':
+                    FakeIMAP.fetched.append(uid)
+                    data[b'BODYSTRUCTURE'] = bodystructure(msg)
+                elif item == 'BODY.PEEK[HEADER]':
+                    data[b'BODY[HEADER]'] = box[uid].split(b'\n\n', 1)[0] + b'\n\n'
+                else:
+                    section = item[len('BODY.PEEK['):-1]
+                    FakeIMAP.sections.append((uid, section))
+                    data[f'BODY[{section}]'.encode()] = section_payload(msg, section)
+            response[uid] = data
+        return response
+
+
+@pytest.fixture
+def fake_imap(monkeypatch, tmp_path):
+    # a file database, since the shared writer runs in its own thread
+    engine = create_engine(f"sqlite:///{tmp_path / 'fetch.db'}", connect_args={'check_same_thread': False})
+    triage.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(triage, 'SessionLocal', sessionmaker(bind=engine))
+    monkeypatch.setattr(imap_fetcher, 'IMAPClient', FakeIMAP)
+    monkeypatch.setenv('BLOB_DIR', str(tmp_path / 'blobs'))
+    for name, value in {'IMAP_HOST': 'imap.example.com', 'IMAP_USER': 'me', 'IMAP_PASS': 'pw'}.items():
+        monkeypatch.setenv(name, value)
+    FakeIMAP.uidvalidity = 1
+    FakeIMAP.messages = {1: make_raw(1), 2: make_raw(2)}
+    FakeIMAP.mailboxes = {}
+    FakeIMAP.searches = []
+    FakeIMAP.fetched = []
+    FakeIMAP.sections = []
+    return triage.SessionLocal
+
+
+def test_incremental_sync_fetches_only_new_uids(fake_imap):
+    imap_fetcher.fetch_emails()
+    assert FakeIMAP.fetched == [1, 2]
+    assert FakeIMAP.searches[-1][0] == 'SINCE'
+
+    FakeIMAP.messages[3] = make_raw(3)
+    imap_fetcher.fetch_emails()
+    assert FakeIMAP.searches[-1] == ['UID', '3:*']
+    assert FakeIMAP.fetched == [1, 2, 3]
+
+    # nothing new: the server still returns UID 3 for "4:*", which must be ignored
+    imap_fetcher.fetch_emails()
+    assert FakeIMAP.fetched == [1, 2, 3]
+
+    with fake_imap() as session:
+        assert session.query(triage.EmailORM).count() == 3
+        state = session.get(triage.ImapSyncStateORM, ('me@imap.example.com', 'INBOX'))
+        assert state.last_uid == 3
+
+
+def test_uidvalidity_change_triggers_resync(fake_imap):
+    imap_fetcher.fetch_emails()
+    FakeIMAP.uidvalidity = 2
+    FakeIMAP.messages = {1: make_raw(1), 2: make_raw(2), 3: make_raw(3)}
+    imap_fetcher.fetch_emails()
+    assert FakeIMAP.searches[-1][0] == 'SINCE'
+    with fake_imap() as session:
+        # already stored messages are skipped, the new one is added
+        assert session.query(triage.EmailORM).count() == 3
+        assert session.get(triage.ImapSyncStateORM, ('me@imap.example.com', 'INBOX')).uidvalidity == 2
+
+
+def test_partial_fetch_skips_oversized_attachments(fake_imap, monkeypatch):
+    monkeypatch.setenv('IMAP_ATTACHMENT_MAX_SIZE', '1000')
+    monkeypatch.setenv('IMAP_FETCH_CHUNK', '1')
+    msg = EmailMessage()
+    msg['Message-ID'] = '<big@example.com>'
+    msg['Subject'] = 'Report'
+    msg['From'] = 'bob@example.com'
+    msg.set_content('See attached')
+    msg.add_alternative('<p>See <b>attached</b></p>', subtype='html')
+    msg.add_attachment(b'small', maintype='application', subtype='octet-stream', filename='small.bin')
+    msg.add_attachment(b'x' * 5000, maintype='application', subtype='pdf', filename='big.pdf')
+    FakeIMAP.messages = {1: make_raw(1), 2: msg.as_bytes()}
+
+    imap_fetcher.fetch_emails()
+
+    # one chunk per message, and the large attachment (section 3) is never downloaded
+    assert FakeIMAP.fetched == [1, 2]
+    assert sorted(s for uid, s in FakeIMAP.sections if uid == 2) == ['1.1', '1.2', '2']
+    with fake_imap() as session:
+        stored = session.get(triage.EmailORM, '<big@example.com>')
+        assert stored.body.strip() == 'See attached'
+        assert '<b>attached</b>' in stored.html_body
+        attachments = session.query(triage.AttachmentORM).filter_by(message_id='<big@example.com>').all()
+        assert [(a.filename, a.size, a.data) for a in attachments] == [('small.bin', 5, None)]
+        with open(blobstore.blob_path(attachments[0].sha256), 'rb') as f:
+            assert f.read() == b'small'
+
+
+def test_copy_already_posted_by_worker_is_linked_not_stored(fake_imap, monkeypatch):
+    msg = EmailMessage()
+    msg['Subject'] = 'Receipt'
+    msg['From'] = 'Shop <shop@example.com>'
+    msg['Date'] = 'Tue, 15 Jul 2025 10:00:00 +0000'
+    msg.set_content('Thanks for your order')
+    msg.add_attachment(b'%PDF', maintype='application', subtype='pdf', filename='receipt.pdf')
+    # no Message-ID header: the fetcher stores it as <1@imap.example.com>
+    FakeIMAP.messages = {1: msg.as_bytes()}
+    with fake_imap() as session:
+        session.add(triage.EmailORM(
+            message_id='worker-1', subject='Receipt', sender='shop@example.com', date='2025-07-15T10:00:00Z',
+            body='Thanks for your order', received_at='', processed=False,
+            content_hash=dedup.content_hash('shop@example.com', 'Receipt', '2025-07-15T10:00:00Z', 'Thanks for your order'),
+        ))
+        session.commit()
+
+    assert imap_fetcher.fetch_emails() == 0
+
+    with fake_imap() as session:
+        assert [e.message_id for e in session.query(triage.EmailORM)] == ['worker-1']
+        attachments = session.query(triage.AttachmentORM).all()
+        assert [(a.message_id, a.filename) for a in attachments] == [('worker-1', 'receipt.pdf')]
+
+
+def test_idle_worker_ingests_new_mail_and_triggers_triage(fake_imap, monkeypatch):
+    stop = threading.Event()
+    triggered = []
+    monkeypatch.setattr(imap_fetcher, '_start_triage', lambda state: triggered.append(True) or True)
+    idles = []
+
+    def on_idle():
+        idles.append(True)
+        if len(idles) == 1:
+            FakeIMAP.messages[3] = make_raw(3)
+            return [(3, b'EXISTS')]
+        stop.set()
+        return []
+
+    FakeIMAP.on_idle = staticmethod(on_idle)
+    imap_fetcher.run_idle_worker(triage_after=3, stop=stop)
+
+    assert FakeIMAP.fetched == [1, 2, 3]
+    assert triggered == [True]
+
+
+def test_multiple_accounts_and_folders_fetch_concurrently(fake_imap, tmp_path, monkeypatch):
+    config = tmp_path / 'accounts.json'
+    config.write_text(json.dumps({'accounts': [
+        {'host': 'imap.a.com', 'user': 'me', 'password': 'pw', 'folders': ['INBOX', 'Work']},
+        {'host': 'imap.b.com', 'user': 'me', 'password_env': 'B_PASS'},
+    ]}))
+    monkeypatch.setenv('IMAP_ACCOUNTS_FILE', str(config))
+    monkeypatch.setenv('B_PASS', 'secret')
+    FakeIMAP.mailboxes = {
+        ('imap.a.com', 'INBOX'): {1: make_raw(1), 2: make_raw(2)},
+        ('imap.a.com', 'Work'): {7: make_raw(7)},
+        ('imap.b.com', 'INBOX'): {1: make_raw(11), 5: make_raw(15)},
+    }
+
+    accounts = imap_fetcher.load_accounts()
+    assert accounts[1].password == 'secret' and accounts[1].folders == ['INBOX']
+    assert imap_fetcher.fetch_emails() == 5
+
+    with fake_imap() as session:
+        assert session.query(triage.EmailORM).count() == 5
+        states = {(s.account, s.folder): s.last_uid for s in session.query(triage.ImapSyncStateORM)}
+    assert states == {
+        ('me@imap.a.com', 'INBOX'): 2,
+        ('me@imap.a.com', 'Work'): 7,
+        ('me@imap.b.com', 'INBOX'): 5,
+    }
+
+
+@pytest.mark.parametrize('workers', ['0', '2'])
+def test_parse_stage_in_process_or_pooled(fake_imap, monkeypatch, workers):
+    monkeypatch.setenv('IMAP_PARSE_WORKERS', workers)
+    FakeIMAP.messages = {uid: make_raw(uid) for uid in range(1, 6)}
+    assert imap_fetcher.fetch_emails() == 5
+    assert imap_fetcher.parse_stats.messages == 5
+    with fake_imap() as session:
+        stored = session.get(triage.EmailORM, '<m3@example.com>')
+        assert stored.subject == 'Hello 3'
+        assert stored.digest == 'Body 3'
@@ -0,0 +1,27 @@
+import pytest
+
+from epoch_agent.services.rules import RuleIndex, normalize_list_id
+
+
+def test_rule_index_matching_order():
+    index = RuleIndex()
+    index.add('domain', 'stripe.com', '5 - Financials')
+    index.add('sender', 'news@stripe.com', '6 - Newsletters')
+    index.add('list_id', 'Weekly <weekly.example.com>', '6 - Newsletters')
+    index.add('subject', r'\breceipt\b', '5 - Financials')
+
+    assert index.match('Stripe <news@stripe.com>', 'Product update') == ('6 - Newsletters', 'sender news@stripe.com')
+    assert index.match('billing@mail.stripe.com', 'Invoice')[0] == '5 - Financials'
+    assert index.match('a@example.com', 'Hi', '<WEEKLY.example.com>')[1] == 'list weekly.example.com'
+    assert index.match('shop@store.com', 'Your Receipt #42')[0] == '5 - Financials'
+    assert index.match('friend@example.com', 'Lunch?') is None
+
+
+def test_rule_index_rejects_unknown_field():
+    with pytest.raises(ValueError):
+        RuleIndex().add('body', 'x', '2 - Review')
+
+
+def test_normalize_list_id():
+    assert normalize_list_id('Dev list <dev.lists.example.org>') == 'dev.lists.example.org'
+    assert normalize_list_id(None) == ''
@@ -0,0 +1,62 @@
+import sqlite3
+
+from sqlalchemy.orm import sessionmaker
+
+import epoch_agent.email_triage_agent as triage
+from epoch_agent.services import search, storage
+
+
+def _session(tmp_path):
+    engine = storage.make_engine(str(tmp_path / 'search.db'))
+    storage.ensure_schema(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _add(session, mid, subject, body='', html_body=None, status=None):
+    session.add(triage.EmailORM(
+        message_id=mid, subject=subject, sender='shop@example.com', date='', body=body,
+        html_body=html_body, status=status, processed=status is not None, received_at='',
+    ))
+    session.commit()
+
+
+def test_index_follows_inserts_updates_and_deletes(tmp_path):
+    session = _session(tmp_path)
+    _add(session, 'm1', 'Your invoice', 'Amount due', status='5 - Financials')
+    _add(session, 'm2', 'Weekly digest', html_body='<p>Latest <b>invoice</b> tips</p><style>.x{}</style>')
+    _add(session, 'm3', 'Lunch?', 'Café at noon')
+
+    hits = search.search(session, 'invoice')
+    # subject matches rank above body matches
+    assert [h.message_id for h in hits] == ['m1', 'm2']
+    assert [h.message_id for h in search.search(session, 'invoice', processed=False)] == ['m2']
+    assert [h.message_id for h in search.search(session, 'invoice', status='5 - Financials')] == ['m1']
+    assert [h.message_id for h in search.search(session, 'cafe')] == ['m3']
+    assert [h.message_id for h in search.search(session, 'inv*', limit=1, offset=1)] == ['m2']
+
+    session.get(triage.EmailORM, 'm3').subject = 'Dinner?'
+    session.delete(session.get(triage.EmailORM, 'm1'))
+    session.commit()
+    assert search.search(session, 'lunch') == []
+    assert [h.message_id for h in search.search(session, 'dinner')] == ['m3']
+    assert [h.message_id for h in search.search(session, 'invoice')] == ['m2']
+
+    assert search.rebuild(session.connection()) == 2
+    session.commit()
+    assert {h.message_id for h in search.search(session, 'invoice OR dinner')} == {'m2', 'm3'}
+
+
+def test_index_needs_no_python_functions(tmp_path):
+    session = _session(tmp_path)
+    _add(session, 'h1', 'News', html_body='<p>Quarterly <b>report</b></p>')
+    assert session.get(triage.EmailORM, 'h1').html_text.strip() == 'Quarterly report'
+    session.close()
+
+    # a plain connection, as used by the sqlite3 shell or a backup script, can still write to emails
+    conn = sqlite3.connect(tmp_path / 'search.db')
+    conn.execute("DELETE FROM emails WHERE message_id = 'h1'")
+    conn.commit()
+    conn.close()
+
+    session = _session(tmp_path)
+    assert search.search(session, 'quarterly') == []
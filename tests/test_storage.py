@@ -0,0 +1,40 @@
+import sqlite3
+
+import epoch_agent.email_triage_agent  # noqa: F401  registers the ORM models
+from epoch_agent.services import storage
+
+
+def test_migrates_old_database_in_place(tmp_path):
+    db_file = tmp_path / 'old.db'
+    conn = sqlite3.connect(db_file)
+    conn.execute('CREATE TABLE emails (message_id VARCHAR PRIMARY KEY, subject VARCHAR, processed BOOLEAN)')
+    conn.execute("INSERT INTO emails VALUES ('m1', 'Hi', 0)")
+    conn.execute('CREATE TABLE attachments (id INTEGER PRIMARY KEY, message_id VARCHAR, filename VARCHAR)')
+    conn.execute('CREATE INDEX ix_attachments_message_id ON attachments (message_id)')
+    conn.execute("INSERT INTO attachments VALUES (5, 'm1', 'a.pdf')")
+    conn.commit()
+    conn.close()
+
+    engine = storage.make_engine(str(db_file))
+    assert storage.ensure_schema(engine) == len(storage.MIGRATIONS)
+    # running again is a no-op
+    assert storage.ensure_schema(engine) == len(storage.MIGRATIONS)
+    engine.dispose()
+
+    conn = sqlite3.connect(db_file)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(emails)')}
+    assert {'status', 'digest', 'references', 'thread_id'} <= columns
+    indexes = {row[1] for row in conn.execute('PRAGMA index_list(emails)')}
+    assert {'ix_emails_processed_received_at', 'ix_emails_status'} <= indexes
+    assert conn.execute('SELECT subject FROM emails').fetchall() == [('Hi',)]
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    # attachments were rebuilt with AUTOINCREMENT, keeping their rows and ids
+    assert 'AUTOINCREMENT' in conn.execute("SELECT sql FROM sqlite_master WHERE name = 'attachments'").fetchone()[0]
+    assert conn.execute('SELECT id, message_id, filename FROM attachments').fetchall() == [(5, 'm1', 'a.pdf')]
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'attachments'").fetchone() == (5,)
+    assert 'ix_attachments_message_id' in {row[1] for row in conn.execute('PRAGMA index_list(attachments)')}
+    plan = ' '.join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM emails WHERE status = '2 - Review'"
+    ))
+    assert 'ix_emails_status' in plan
+    conn.close()